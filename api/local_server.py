@@ -0,0 +1,287 @@
+"""
+In-memory stand-in for the online-store-service backend, for local testing.
+
+Implements the endpoints WallpaperAPI uses, including the bulk endpoints,
+with the same response shapes. Data lives in memory only.
+
+Waiting items can be claimed with a lease (claim / renew / release), so
+several bot workers can be run against it: a leased item is invisible to
+other workers until its lease expires, and only the lease holder (workerId
+in the PATCH body) can complete it.
+
+    python3 -m api.local_server --port 4000
+    WALLPAPER_API_URL=http://localhost:4000 python3 organizer.py
+"""
+
+import json
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class LocalStore:
+    """Wallpaper items and waiting-list items, guarded by one lock."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.items = {}      # itemId -> item dict
+        self.waiting = {}    # _id -> waiting item dict (insertion ordered)
+        self._next_item_id = 1
+
+    # --- wallpaper items ---
+
+    def add_item(self, payload):
+        item = dict(payload)
+        if not item.get("itemId"):
+            item["itemId"] = f"{self._next_item_id:06d}"
+            self._next_item_id += 1
+        self.items[item["itemId"]] = item
+        return item["itemId"]
+
+    def patch_field(self, item_id, field, data):
+        item = self.items.get(item_id)
+        if item is None:
+            return False, f"Item {item_id} not found"
+        item[field] = data
+        return True, "Updated"
+
+    def add_image_list_item(self, item_id, data):
+        item = self.items.get(item_id)
+        if item is None:
+            return False, f"Item {item_id} not found"
+        item.setdefault("imageList", []).append(data)
+        return True, "Added"
+
+    # --- waiting list ---
+
+    def add_waiting(self, payload):
+        _id = uuid.uuid4().hex[:24]
+        created_at = datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+        self.waiting[_id] = {"_id": _id, "createdAt": created_at, **payload}
+        return _id
+
+    def is_available(self, item, now=None):
+        """Not finished and not held by an unexpired lease"""
+        if item.get("status", "") != "":
+            return False
+        lease = item.get("lease")
+        return not lease or lease["expiresAt"] <= (now or time.time())
+
+    def next_waiting(self, assign):
+        """Next unassigned item, which is then assigned (release_waiting_list_item resets assign)"""
+        for item in self.waiting.values():
+            if self.is_available(item) and not item.get("assign"):
+                item["assign"] = assign
+                return item
+        return None
+
+    def claim_waiting(self, assign, worker_id, ttl, item_id=None):
+        now = time.time()
+        candidates = [self.waiting.get(item_id)] if item_id else self.waiting.values()
+        for item in candidates:
+            if item is not None and self.is_available(item, now):
+                item["assign"] = assign
+                item["lease"] = {"workerId": worker_id, "expiresAt": now + ttl}
+                return item
+        return None
+
+    def _held_by(self, _id, worker_id):
+        """The item if worker_id still holds its lease (expired but not yet re-claimed counts)"""
+        item = self.waiting.get(_id)
+        if item is None or item.get("status", "") != "":
+            return None
+        lease = item.get("lease")
+        if not lease or lease["workerId"] != worker_id:
+            return None
+        return item
+
+    def renew_lease(self, _id, worker_id, ttl):
+        item = self._held_by(_id, worker_id)
+        if item is None:
+            return None
+        item["lease"]["expiresAt"] = time.time() + ttl
+        return item
+
+    def release_lease(self, _id, worker_id, failures, note, max_failures):
+        item = self._held_by(_id, worker_id)
+        if item is None:
+            return None
+        item.pop("lease")
+        item.update({"status": "Failed" if failures >= max_failures else "", "assign": "",
+                     "failures": failures, "lastError": note})
+        return item
+
+
+class LocalApiHandler(BaseHTTPRequestHandler):
+    store: LocalStore = None  # set by make_server()
+
+    def log_message(self, format, *args):
+        pass  # keep test output quiet
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0) or 0)
+        if not length:
+            return {}
+        return json.loads(self.rfile.read(length))
+
+    def _send(self, status, body):
+        data = body if isinstance(body, str) else json.dumps(body)
+        encoded = data.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json" if not isinstance(body, str) else "text/plain")
+        self.send_header("Content-Length", str(len(encoded)))
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    def _route(self, method):
+        path = self.path.split("?")[0].rstrip("/")
+        body = self._read_json() if method in ("POST", "PUT", "PATCH") else {}
+        store = self.store
+
+        with store.lock:
+            # Bulk endpoints: {"operations": [...]} -> {"results": [...]}
+            if method == "POST" and path == "/api/items/waiting/bulk":
+                results = [{"success": True, "message": store.add_waiting(op)} for op in body.get("operations", [])]
+                return self._send(200, {"results": results})
+            if method == "PATCH" and path == "/api/items/patch_field/bulk":
+                results = []
+                for op in body.get("operations", []):
+                    success, message = store.patch_field(op.get("itemId"), op.get("field"), op.get("data"))
+                    results.append({"success": success, "message": message})
+                return self._send(200, {"results": results})
+            if method == "PATCH" and path == "/api/items/add_one_image_list_item/bulk":
+                results = []
+                for op in body.get("operations", []):
+                    success, message = store.add_image_list_item(op.get("itemId"), op.get("data"))
+                    results.append({"success": success, "message": message})
+                return self._send(200, {"results": results})
+
+            # Waiting list
+            if path == "/api/items/waiting":
+                if method == "POST":
+                    return self._send(200, store.add_waiting(body))
+                if method == "GET":
+                    return self._send(200, list(store.waiting.values()))
+            if method == "GET" and path == "/api/items/waiting/count/all":
+                count = sum(1 for item in store.waiting.values() if store.is_available(item))
+                return self._send(200, {"count": count})
+            match = re.fullmatch(r"/api/items/waiting/claim/([^/]+)", path)
+            if match and method == "POST":
+                item = store.claim_waiting(match.group(1), body.get("workerId", ""), float(body.get("ttl", 300)),
+                                           body.get("_id"))
+                if item is None:
+                    return self._send(404, {"message": "No waiting items found."})
+                return self._send(200, item)
+            match = re.fullmatch(r"/api/items/waiting/([^/]+)/lease", path)
+            if match and method == "POST":
+                item = store.renew_lease(match.group(1), body.get("workerId", ""), float(body.get("ttl", 300)))
+                if item is None:
+                    return self._send(409, {"message": "Lease lost"})
+                return self._send(200, item)
+            match = re.fullmatch(r"/api/items/waiting/([^/]+)/release", path)
+            if match and method == "POST":
+                item = store.release_lease(match.group(1), body.get("workerId", ""), int(body.get("failures", 0)),
+                                           body.get("note", ""), int(body.get("maxFailures", 3)))
+                if item is None:
+                    return self._send(409, {"message": "Lease lost"})
+                return self._send(200, item)
+            match = re.fullmatch(r"/api/items/waiting/([^/]+)", path)
+            if match and method == "GET":
+                item = store.next_waiting(match.group(1))
+                if item is None:
+                    return self._send(404, {"message": "No waiting items found."})
+                return self._send(200, item)
+            if match and method == "PATCH":
+                item = store.waiting.get(match.group(1))
+                if item is None:
+                    return self._send(404, {"message": "Waiting item not found"})
+                worker_id = body.pop("workerId", "")
+                lease = item.get("lease")
+                if lease and lease["workerId"] != worker_id:
+                    return self._send(409, {"message": "Lease held by another worker"})
+                item.update(body)
+                if item.get("status", "") != "":
+                    item.pop("lease", None)  # completed
+                return self._send(200, item)
+
+            # Single-item field updates
+            match = re.fullmatch(r"/api/items/patch_field/([^/]+)", path)
+            if match and method == "PATCH":
+                for field, data in body.items():
+                    success, message = store.patch_field(match.group(1), field, data)
+                    if not success:
+                        return self._send(404, {"message": message})
+                return self._send(200, {"message": "Updated"})
+            match = re.fullmatch(r"/api/items/add_one_image_list_item/([^/]+)", path)
+            if match and method == "PATCH":
+                success, message = store.add_image_list_item(match.group(1), body.get("imageList", {}))
+                return self._send(200 if success else 404, {"message": message})
+
+            # Wallpaper items
+            if path == "/api/items":
+                if method == "POST":
+                    return self._send(200, store.add_item(body))
+                if method == "GET":
+                    return self._send(200, list(store.items.values()))
+            match = re.fullmatch(r"/api/items/([^/]+)", path)
+            if match:
+                item_id = match.group(1)
+                if item_id not in store.items:
+                    return self._send(404, {"message": f"Item {item_id} not found"})
+                if method == "GET":
+                    return self._send(200, store.items[item_id])
+                if method == "PUT":
+                    store.items[item_id].update(body)
+                    return self._send(200, store.items[item_id])
+                if method == "DELETE":
+                    del store.items[item_id]
+                    return self._send(200, {"message": "Deleted"})
+
+        return self._send(404, {"message": f"No route for {method} {path}"})
+
+    def do_GET(self):
+        self._route("GET")
+
+    def do_POST(self):
+        self._route("POST")
+
+    def do_PUT(self):
+        self._route("PUT")
+
+    def do_PATCH(self):
+        self._route("PATCH")
+
+    def do_DELETE(self):
+        self._route("DELETE")
+
+
+def make_server(host="127.0.0.1", port=4000, store=None):
+    """
+    Create (but don't start) a stand-in server. Use port=0 for a free port.
+
+    Example:
+        server = make_server(port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        api = WallpaperAPI(f"http://127.0.0.1:{server.server_port}")
+    """
+    handler = type("BoundLocalApiHandler", (LocalApiHandler,), {"store": store or LocalStore()})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Local stand-in for the wallpaper backend')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=4000)
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port)
+    print(f"Local wallpaper API on http://{args.host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nLocal wallpaper API stopped")
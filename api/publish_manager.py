@@ -61,7 +61,9 @@ class PublishManager:
         photo_type: Optional[str] = None,
         free_download: Optional[bool] = None,
         preview: Optional[str] = None,
-        imagesList: Optional[List[Dict[str, str]]] = None
+        imagesList: Optional[List[Dict[str, str]]] = None,
+        placeholder: Optional[dict] = None,
+        waiting_id: str = ""
     ) -> str:
         """
         Publish a new wallpaper item
@@ -80,6 +82,8 @@ class PublishManager:
             free_download: Optional custom free download flag
             preview: Optional custom preview image
             imagesList: Optional list of image data from resize_all_and_upload_to_firebase
+            placeholder: Optional inline placeholder (BlurHash + tiny thumbnail) stored on the item
+            waiting_id: Optional waiting list item id, stored on the item as its idempotency key
         Returns:
             bool: True if publication was successful, False otherwise
         """
@@ -102,7 +106,9 @@ class PublishManager:
                         type=img["type"],
                         resolution=img["resolution"],
                         link=img["link"],
-                        blob=img["blob"]
+                        blob=img["blob"],
+                        encoding=img.get("encoding"),
+                        format=img.get("format", "jpeg")
                     ))
 
             # Create download lists
@@ -121,7 +127,9 @@ class PublishManager:
                 thumbnail=thumbnail_url,
                 preview=final_preview,
                 image_list=image_list,
-                download_list=download_list
+                download_list=download_list,
+                placeholder=placeholder,
+                waiting_id=waiting_id
             )
             print("result=")
             print(result)
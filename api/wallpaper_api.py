@@ -1,8 +1,13 @@
-import requests
 import json
-from typing import List, Dict, Union, Optional
+import os
+from typing import Callable, List, Dict, Union, Optional, Tuple
 from dataclasses import dataclass
 
+# Operations per bulk request; the backend rejects bodies over a few MB
+BULK_BATCH_SIZE = 100
+# Seconds a claimed waiting item stays reserved for its worker without a renewal
+DEFAULT_LEASE_TTL = 300
+
 @dataclass
 class ImageItem:
     """
@@ -13,11 +18,21 @@ class ImageItem:
         resolution: The resolution of the image (e.g., "800x600")
         link: The URL where the image can be accessed
         blob: The Firebase blob path reference for the image
+        encoding: Settings chosen by the adaptive encoder (quality, subsampling, progressive, bytes)
+        format: Image format of the file: "jpeg", "webp" or "avif"
     """
     type: str
     resolution: str
     link: str
     blob: str
+    encoding: Optional[dict] = None
+    format: str = "jpeg"
+
+    def to_dict(self) -> dict:
+        data = {"type": self.type, "format": self.format, "resolution": self.resolution, "link": self.link, "blob": self.blob}
+        if self.encoding:
+            data["encoding"] = self.encoding
+        return data
 
 @dataclass
 class DownloadItem:
@@ -29,12 +44,14 @@ class DownloadItem:
     upscaled_blob: str
 
 class WallpaperAPI:
-    def __init__(self, base_url: str = "https://online-store-service.onrender.com"):
-    # def __init__(self, base_url: str = "http://localhost:4000"): # test local api
-        self.base_url = base_url
+    def __init__(self, base_url: Optional[str] = None):
+        # WALLPAPER_API_URL=http://localhost:4000 points every client at a local
+        # backend or at the stand-in server in api/local_server.py
+        self.base_url = base_url or os.getenv("WALLPAPER_API_URL", "https://online-store-service.onrender.com")
         self.headers = {
             "Content-Type": "application/json"
         }
+        self.unsupported_bulk_endpoints = set()  # answered 404/405: sent one item at a time
 
     def _make_request(self, method: str, endpoint: str, data: Optional[dict] = None) -> Dict[str, Union[bool, str]]:
         """
@@ -48,6 +65,7 @@ class WallpaperAPI:
         Returns:
             Dictionary containing response status and message
         """
+        import requests  # imported lazily to keep bot startup fast
         url = f"{self.base_url}{endpoint}"
 
         try:
@@ -61,12 +79,14 @@ class WallpaperAPI:
             if response.status_code == 200:
                 return {
                     "success": True,
-                    "message": response.text
+                    "message": response.text,
+                    "status_code": response.status_code
                 }
             else:
                 return {
                     "success": False,
-                    "message": f"Error: {response.text}"
+                    "message": f"Error: {response.text}",
+                    "status_code": response.status_code
                 }
 
         except requests.exceptions.RequestException as e:
@@ -88,7 +108,9 @@ class WallpaperAPI:
         thumbnail: str,
         preview: str,
         image_list: List[ImageItem],
-        download_list: List[DownloadItem]
+        download_list: List[DownloadItem],
+        placeholder: Optional[dict] = None,
+        waiting_id: str = ""
     ) -> Dict[str, Union[bool, str]]:
         """
         Add a new wallpaper item to the database.
@@ -106,6 +128,9 @@ class WallpaperAPI:
             preview: Preview image filename
             image_list: List of image variations with type and filename
             download_list: List of download options with size and link
+            placeholder: Inline placeholder (blurhash, thumbnail data URI, width, height)
+            waiting_id: Waiting list item the wallpaper was made from; lets a retried publish
+                        find the item it already added (find_wallpaper_by_waiting_id)
 
         Returns:
             Dictionary with status and message
@@ -121,9 +146,13 @@ class WallpaperAPI:
             "sizeOptions": size_options,
             "thumbnail": thumbnail,
             "preview": preview,
-            "imageList": [{"type": img.type, "resolution": img.resolution, "link": img.link, "blob": img.blob} for img in image_list],
+            "imageList": [img.to_dict() for img in image_list],
             "downloadList": [{"size": dl.size, "ext": dl.ext, "link": dl.link, "caption": dl.caption, "thumbnail_blob": dl.thumbnail_blob, "upscaled_blob": dl.upscaled_blob} for dl in download_list]
         }
+        if placeholder:
+            payload["placeholder"] = placeholder
+        if waiting_id:
+            payload["waitingId"] = waiting_id
 
         return self._make_request("POST", "/api/items", payload)
 
@@ -131,6 +160,25 @@ class WallpaperAPI:
         """Get all wallpapers"""
         return self._make_request("GET", "/api/items")
 
+    def find_wallpaper_by_waiting_id(self, waiting_id: str) -> Optional[str]:
+        """
+        itemId of the wallpaper added for a waiting list item.
+
+        Returns:
+            The itemId, "" if there is no such wallpaper, or None if the lookup failed
+        """
+        response = self.get_wallpapers()
+        if not response["success"]:
+            return None
+        try:
+            items = json.loads(response["message"])
+        except ValueError:
+            return None
+        for item in items:
+            if item.get("waitingId") == waiting_id:
+                return item.get("itemId", "")
+        return ""
+
     def get_wallpaper(self, item_id: str) -> Dict[str, Union[bool, str, dict]]:
         """Get a specific wallpaper by ID"""
         return self._make_request("GET", f"/api/items/{item_id}")
@@ -153,7 +201,8 @@ class WallpaperAPI:
         status: str = "",
         itemId: str = "",
         itemUrl: str = "",
-        review: bool = False
+        review: bool = False,
+        variants: Optional[List[dict]] = None
     ) -> Dict[str, Union[bool, str]]:
         """
         Add a new item to the waiting list.
@@ -165,6 +214,8 @@ class WallpaperAPI:
             note: Additional notes about the item (default is an empty string).
             assign: Assignment information (default is an empty string).
             status: Status of the item (default is an empty string).
+            variants: Other sizes of the source image, dicts with name, url, width, height
+                      (see image_variants.pexels_variants).
 
         Returns:
             Dictionary with status and message.
@@ -180,6 +231,8 @@ class WallpaperAPI:
             "itemUrl": itemUrl,
             "review": review,
         }
+        if variants:
+            payload["variants"] = variants
 
         return self._make_request("POST", "/api/items/waiting", payload)
 
@@ -187,6 +240,9 @@ class WallpaperAPI:
         """
         Get one item from the waiting list for a specific assignment.
 
+        The item isn't reserved: a second worker can get the same one. Workers
+        that share the waiting list use claim_waiting_item instead.
+
         Args:
             assign: The assignment type to filter by (default is "midjourney").
 
@@ -194,21 +250,26 @@ class WallpaperAPI:
             Dictionary containing:
             - success: Boolean indicating if the request was successful
             - message: Response message or error
-            - data: If successful, contains item data with '_id' and 'url'
+            - data: If successful, contains item data with '_id', 'url', 'variants' and 'failures'
         """
         response = self._make_request("GET", f"/api/items/waiting/{assign}")
+        return self._parse_waiting_item(response)
 
+    def _parse_waiting_item(self, response: Dict[str, Union[bool, str]]) -> Dict[str, Union[bool, str, dict]]:
         if response["success"]:
             try:
                 # Parse the JSON response
                 data = json.loads(response["message"])
 
-                # Extract only the _id and url fields
+                # Extract only the _id, url, variants, failures and lease fields
                 result = {
                     "success": True,
                     "data": {
                         "_id": data.get("_id"),
-                        "url": data.get("url")
+                        "url": data.get("url"),
+                        "variants": data.get("variants", []),
+                        "failures": data.get("failures", 0),
+                        "lease": data.get("lease")
                     }
                 }
                 return result
@@ -225,6 +286,10 @@ class WallpaperAPI:
 
         return response
 
+    def get_waiting_list(self) -> Dict[str, Union[bool, str]]:
+        """Get all waiting list items (any status), message is the JSON list"""
+        return self._make_request("GET", "/api/items/waiting")
+
     def get_count_from_waiting_list(self) -> int:
         """
         Get the count of all waiting list items with empty status.
@@ -250,7 +315,8 @@ class WallpaperAPI:
         new_itemUrl: str,
         priority: int = 0,
         status: str = "Completed",
-        review: bool = False
+        review: bool = False,
+        worker_id: str = ""
     ) -> Dict[str, Union[bool, str, dict]]:
         """
         Mark a waiting list item as completed with additional parameters.
@@ -262,6 +328,8 @@ class WallpaperAPI:
             priority: Priority level (default is 0)
             status: Status of the item (default is "Completed")
             review: Whether the item needs review (default is False)
+            worker_id: Lease holder completing the item; with leases, a completion by
+                       another worker is rejected with status_code 409
 
         Returns:
             Dictionary containing:
@@ -275,9 +343,102 @@ class WallpaperAPI:
             "status": status,
             "review": review
         }
+        if worker_id:
+            payload["workerId"] = worker_id
 
         return self._make_request("PATCH", f"/api/items/waiting/{_id}", payload)
 
+    def release_waiting_list_item(
+        self, _id: str,
+        failures: int,
+        note: str = "",
+        max_failures: int = 3
+    ) -> Dict[str, Union[bool, str, dict]]:
+        """
+        Give an item back to the waiting list after a failed attempt.
+
+        Args:
+            _id: The ID of the waiting list item
+            failures: Failed attempts so far, including this one
+            note: Why the attempt failed
+            max_failures: At this many failures the item is marked "Failed" instead of queued again
+
+        Returns:
+            Dictionary containing:
+            - success: Boolean indicating if the request was successful
+            - message: Response message or error data
+        """
+        payload = {
+            "status": "Failed" if failures >= max_failures else "",
+            "assign": "",
+            "failures": failures,
+            "lastError": note
+        }
+
+        return self._make_request("PATCH", f"/api/items/waiting/{_id}", payload)
+
+    def assign_waiting_item(self, _id: str, assign: str = "midjourney") -> Dict[str, Union[bool, str]]:
+        """
+        Mark a waiting item as taken, like get_one_from_waiting_list does for the
+        backend's next item; for an item chosen client-side without a lease.
+        """
+        return self._make_request("PATCH", f"/api/items/waiting/{_id}", {"assign": assign})
+
+    def claim_waiting_item(
+        self, worker_id: str,
+        ttl: int = DEFAULT_LEASE_TTL,
+        assign: str = "midjourney",
+        item_id: Optional[str] = None
+    ) -> Dict[str, Union[bool, str, dict]]:
+        """
+        Take one waiting item with a lease, so no other worker gets it until the
+        lease expires. Keep it with renew_lease while the job runs.
+
+        Args:
+            worker_id: Stable ID of this worker (the same after a restart)
+            ttl: Lease length in seconds
+            assign: The assignment type to filter by (default is "midjourney").
+            item_id: Claim this item (chosen by waiting_scheduler) instead of the backend's next one
+
+        Returns:
+            Same as get_one_from_waiting_list; data['lease'] has 'workerId' and 'expiresAt' (epoch seconds)
+        """
+        payload = {"workerId": worker_id, "ttl": ttl}
+        if item_id:
+            payload["_id"] = item_id
+        response = self._make_request("POST", f"/api/items/waiting/claim/{assign}", payload)
+        return self._parse_waiting_item(response)
+
+    def renew_lease(self, _id: str, worker_id: str, ttl: int = DEFAULT_LEASE_TTL) -> Dict[str, Union[bool, str]]:
+        """
+        Extend this worker's lease on a waiting item.
+
+        Returns:
+            Dictionary with status and message; status_code 409 means the lease was
+            lost (it expired and another worker claimed the item, or it was completed)
+        """
+        return self._make_request("POST", f"/api/items/waiting/{_id}/lease", {"workerId": worker_id, "ttl": ttl})
+
+    def release_lease(
+        self, _id: str,
+        worker_id: str,
+        failures: int,
+        note: str = "",
+        max_failures: int = 3
+    ) -> Dict[str, Union[bool, str]]:
+        """
+        Give up a claimed item after a failed attempt; same as release_waiting_list_item,
+        but only while this worker still holds the lease.
+        """
+        payload = {
+            "workerId": worker_id,
+            "failures": failures,
+            "note": note,
+            "maxFailures": max_failures
+        }
+
+        return self._make_request("POST", f"/api/items/waiting/{_id}/release", payload)
+
 
     def patch_data_by_field(self, item_id, field, data):
         """
@@ -329,4 +490,118 @@ class WallpaperAPI:
 
         payload = {field: data}
 
-        return self._make_request("PATCH", f"/api/items/add_one_image_list_item/{item_id}", payload)
\ No newline at end of file
+        return self._make_request("PATCH", f"/api/items/add_one_image_list_item/{item_id}", payload)
+
+    def _bulk_request(self, method: str, endpoint: str, operations: List[dict], batch_size: int = BULK_BATCH_SIZE,
+                      single: Optional[Callable[[dict], Dict[str, Union[bool, str]]]] = None) -> Dict[str, Union[bool, str, list]]:
+        """
+        Send operations in batches of `batch_size` per request.
+
+        The endpoint receives {"operations": [...]} and answers
+        {"results": [{"success": bool, "message": str}, ...]} in the same order.
+        A backend without the endpoint (404/405) gets the operations one by one
+        through `single` instead.
+
+        Returns:
+            Dictionary containing:
+            - success: True only if every operation succeeded
+            - message: Summary of succeeded/failed counts
+            - results: One {"success", "message"} entry per operation, in input order
+            - failed: Indexes of the operations that failed
+        """
+        results = []
+        for start in range(0, len(operations), batch_size):
+            batch = operations[start:start + batch_size]
+            if single and endpoint in self.unsupported_bulk_endpoints:
+                results.extend(self._single_results(single, batch))
+                continue
+            response = self._make_request(method, endpoint, {"operations": batch})
+            if single and response.get("status_code") in (404, 405):
+                print(f"{endpoint} not available ({response['status_code']}), sending items one by one")
+                self.unsupported_bulk_endpoints.add(endpoint)
+                results.extend(self._single_results(single, batch))
+                continue
+
+            batch_results = None
+            if response["success"]:
+                try:
+                    batch_results = json.loads(response["message"]).get("results")
+                except (json.JSONDecodeError, AttributeError):
+                    batch_results = None
+
+            if not isinstance(batch_results, list) or len(batch_results) != len(batch):
+                # Whole request failed (network, 5xx, bad body): every item in it failed
+                error = response["message"] if not response["success"] else "Malformed bulk response"
+                batch_results = [{"success": False, "message": error} for _ in batch]
+
+            results.extend({"success": bool(r.get("success")), "message": r.get("message", "")} for r in batch_results)
+
+        failed = [index for index, result in enumerate(results) if not result["success"]]
+        return {
+            "success": not failed,
+            "message": f"{len(results) - len(failed)} succeeded, {len(failed)} failed",
+            "results": results,
+            "failed": failed
+        }
+
+    @staticmethod
+    def _single_results(single, batch):
+        results = []
+        for operation in batch:
+            response = single(operation)
+            results.append({"success": bool(response["success"]), "message": response["message"]})
+        return results
+
+    def add_waiting_items_bulk(self, items: List[dict], batch_size: int = BULK_BATCH_SIZE) -> Dict[str, Union[bool, str, list]]:
+        """
+        Add many items to the waiting list, `batch_size` per request.
+
+        Args:
+            items: Dicts with the add_waiting_item() fields (source, url, note, priority, ...)
+
+        Returns:
+            Dictionary with success, message, per-item results and failed indexes
+        """
+        defaults = {"note": "", "url": "", "priority": 0, "assign": "", "status": "", "itemId": "", "itemUrl": "", "review": False}
+        operations = [{**defaults, **item} for item in items]
+        return self._bulk_request("POST", "/api/items/waiting/bulk", operations, batch_size,
+                                  single=lambda op: self._make_request("POST", "/api/items/waiting", op))
+
+    def patch_data_by_field_bulk(self, updates: List[Tuple[str, str, object]], batch_size: int = BULK_BATCH_SIZE) -> Dict[str, Union[bool, str, list]]:
+        """
+        Bulk version of patch_data_by_field().
+
+        Args:
+            updates: (item_id, field, data) tuples
+
+        Returns:
+            Dictionary with success, message, per-item results and failed indexes
+        """
+        operations = [{"itemId": item_id, "field": field, "data": data} for item_id, field, data in updates]
+        return self._bulk_request("PATCH", "/api/items/patch_field/bulk", operations, batch_size,
+                                  single=lambda op: self.patch_data_by_field(op["itemId"], op["field"], op["data"]))
+
+    def add_image_list_items_bulk(self, items: List[Tuple[str, dict]], batch_size: int = BULK_BATCH_SIZE) -> Dict[str, Union[bool, str, list]]:
+        """
+        Bulk version of add_one_image_list_item() for the 'imageList' field.
+
+        Args:
+            items: (item_id, image dict with type, resolution, link, blob) tuples
+
+        Returns:
+            Dictionary with success, message, per-item results and failed indexes
+        """
+        required_fields = ["type", "resolution", "link", "blob"]
+        for item_id, data in items:
+            missing_fields = [f for f in required_fields if f not in data]
+            if missing_fields:
+                return {
+                    "success": False,
+                    "message": f"Item {item_id} missing required fields: {', '.join(missing_fields)}",
+                    "results": [],
+                    "failed": list(range(len(items)))
+                }
+
+        operations = [{"itemId": item_id, "field": "imageList", "data": data} for item_id, data in items]
+        return self._bulk_request("PATCH", "/api/items/add_one_image_list_item/bulk", operations, batch_size,
+                                  single=lambda op: self.add_one_image_list_item(op["itemId"], "imageList", op["data"]))
@@ -0,0 +1,106 @@
+"""
+Object names for Firebase Storage uploads.
+
+Timestamp-first names (images/<folder>/20250305_055540_thumbnail_<uuid>.jpg)
+put every concurrent upload into one lexicographically adjacent key range,
+which Cloud Storage serves from a single shard until it splits. New names
+start with a short hash of the unique id, so parallel uploads spread over the
+key space, while the rest of the name keeps the old, parseable layout:
+
+    images/<folder>/<hash>_<YYYYMMDD_HHMMSS>_<folder>_<resolution>_<uuid><ext>
+
+The hash is derived from the uuid, so a name can be checked and parsed
+without any lookup. Old timestamp names and content-addressed names
+(content_store.py) parse with the same function.
+"""
+
+import hashlib
+import os
+import re
+import uuid
+from typing import Dict, Optional
+
+HASH_PREFIX_LENGTH = 4  # hex chars: 65536 ranges
+
+_TIMESTAMP = r"(?P<timestamp>\d{8}_\d{6})"
+_RESOLUTION = r"(?:_(?P<resolution>\d+x\d+))?"
+_UUID = r"(?P<id>[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})"
+_TIMESTAMP_NAME = re.compile(rf"^{_TIMESTAMP}_(?P<type>[A-Za-z]+){_RESOLUTION}_{_UUID}(?P<ext>\.\w+)?$")
+_HASHED_NAME = re.compile(rf"^(?P<hash>[0-9a-f]{{{HASH_PREFIX_LENGTH}}})_{_TIMESTAMP}_(?P<type>[A-Za-z]+){_RESOLUTION}_{_UUID}(?P<ext>\.\w+)?$")
+_CONTENT_NAME = re.compile(r"^(?P<id>[0-9a-f]{16,64})(?P<ext>\.\w+)?$")
+
+
+def hash_prefix(unique_id: str) -> str:
+    return hashlib.md5(unique_id.encode("utf-8")).hexdigest()[:HASH_PREFIX_LENGTH]
+
+
+def make_blob_name(folder: str, file_ext: str, time_string: str, resolution: str = "",
+                   unique_id: Optional[str] = None, hashed: bool = True) -> str:
+    """
+    Build the object name for a new upload.
+
+    Args:
+        folder (str): Storage folder / rendition type (e.g. "thumbnail", "LD")
+        file_ext (str): Extension including the dot
+        time_string (str): UTC time as produced by utility.get_utc_time() ("YYYYMMDD_HHMMSS_")
+        resolution (str): Optional "WxH"
+        unique_id (str): Defaults to a new uuid4
+        hashed (bool): Lead with the hash prefix; False gives the old timestamp-first name
+    """
+    unique_id = unique_id or str(uuid.uuid4())
+    resolution_name = f"{resolution}_" if resolution else ""
+    filename = f"{time_string}{folder}_{resolution_name}{unique_id}{file_ext}"
+    if hashed:
+        filename = f"{hash_prefix(unique_id)}_{filename}"
+    return f"images/{folder}/{filename}"
+
+
+def parse_blob_name(blob_name: str) -> Optional[Dict[str, str]]:
+    """
+    Split an object name into its parts.
+
+    Returns:
+        dict: scheme ("hashed", "timestamp" or "content"), folder, filename, id, ext,
+              and for the first two also timestamp, type and resolution ("" if absent).
+              None if the name follows none of the schemes.
+    """
+    folder, filename = os.path.split(blob_name)
+    folder = os.path.basename(folder)
+
+    match = _HASHED_NAME.match(filename)
+    if match and match.group("hash") == hash_prefix(match.group("id")):
+        scheme = "hashed"
+    else:
+        match = _TIMESTAMP_NAME.match(filename)
+        scheme = "timestamp"
+    if match:
+        return {
+            "scheme": scheme,
+            "folder": folder,
+            "filename": filename,
+            "timestamp": match.group("timestamp"),
+            "type": match.group("type"),
+            "resolution": match.group("resolution") or "",
+            "id": match.group("id"),
+            "ext": match.group("ext") or "",
+        }
+
+    match = _CONTENT_NAME.match(filename)
+    if match:
+        return {"scheme": "content", "folder": folder, "filename": filename,
+                "id": match.group("id"), "ext": match.group("ext") or ""}
+    return None
+
+
+def local_filename(blob_name: str) -> str:
+    """
+    Stable local filename for a blob: the old timestamp-first layout for both
+    old and hash-prefixed names, so files still sort by upload time.
+    """
+    parts = parse_blob_name(blob_name)
+    if parts is None:
+        return os.path.basename(blob_name)
+    if parts["scheme"] == "content":
+        return parts["filename"]
+    resolution_name = f"{parts['resolution']}_" if parts["resolution"] else ""
+    return f"{parts['timestamp']}_{parts['type']}_{resolution_name}{parts['id']}{parts['ext']}"
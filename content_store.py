@@ -0,0 +1,69 @@
+"""
+Content-addressed naming for Firebase Storage uploads.
+
+The object name is derived from the SHA-256 of the file's bytes, so uploading
+the same bytes twice (a retry, a re-run of an organizer backfill, or an HD
+rendition that is byte-identical to the thumbnail) resolves to the same blob.
+A local index of digests already uploaded answers most lookups without a
+request; otherwise one exists() check replaces the upload.
+"""
+
+import hashlib
+import os
+import threading
+from typing import Dict, Optional
+
+CONTENT_FOLDER = "content"  # images/content/<digest><ext>, shared by every rendition type
+INDEX_FILE = os.path.join("data", "uploaded_blobs.txt")
+DIGEST_LENGTH = 40  # hex chars of SHA-256 kept in the name (160 bits)
+
+
+def file_digest(path: str, chunk_size: int = 1 << 20) -> str:
+    """SHA-256 of a file, hex encoded, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:DIGEST_LENGTH]
+
+
+def content_blob_name(digest: str, file_ext: str) -> str:
+    return f"images/{CONTENT_FOLDER}/{digest}{file_ext.lower()}"
+
+
+class UploadIndex:
+    """Persistent digest -> blob name map of content-addressed uploads that completed."""
+
+    def __init__(self, path: str = INDEX_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self.blobs: Dict[str, str] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    digest, _, blob_name = line.strip().partition("\t")
+                    if digest and blob_name:
+                        self.blobs[digest] = blob_name
+
+    def get(self, digest: str) -> Optional[str]:
+        return self.blobs.get(digest)
+
+    def add(self, digest: str, blob_name: str):
+        with self._lock:
+            if self.blobs.get(digest) == blob_name:
+                return
+            self.blobs[digest] = blob_name
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(f"{digest}\t{blob_name}\n")
+
+
+_upload_index = None
+
+
+def get_upload_index() -> UploadIndex:
+    """Load the index from disk on first use"""
+    global _upload_index
+    if _upload_index is None:
+        _upload_index = UploadIndex()
+    return _upload_index
@@ -1,22 +1,34 @@
+import startup_timing  # first import: records process start time
 import discord
 from discord.ext import commands
 import aiohttp
 import asyncio
 from dotenv import load_dotenv
-from PIL import Image
+import json
 import os
-import pyautogui
+import re
+import socket
 import time
 from datetime import datetime
 import argparse
 from open_ai import ImageAnalyzer
 
-from utility import type_imagine, download_image, upload_to_firebase_3, initialize_firebase, safe_delete, click_somewhere, is_macos, resize_all_and_upload_to_firebase
+from utility import type_imagine, download_image, upload_to_firebase_3, upload_to_firebase_resumable, delete_uploaded_blobs, initialize_firebase, safe_delete, click_somewhere, is_macos, resize_all_and_upload_to_firebase
 from api.wallpaper_api import WallpaperAPI, ImageItem, DownloadItem
 from api.publish_manager import PublishManager, PublishConfig
-from image_url_detection import is_image_url
+from image_url_detection import probe_image_url, is_image_url_async, validate_image_urls
 from sendMessage import send_message
 from pexels_resource import add_one
+from url_dedupe import seed_from_backend
+from image_variants import sized_url, url_for, DESCRIBE_MIN_SIZE, REFERENCE_MIN_SIZE
+from profiler import ProfileController, parse_profile_command, format_for_discord
+from image_pool import start_image_pool, shutdown_image_pool
+from stream_upload import stream_url_to_firebase
+from job_pipeline import StageGraph, StageFailed
+from job_store import get_job_store, DONE, FAILED, ABANDONED
+from waiting_scheduler import WaitingScheduler, URGENT_PRIORITY, format_queue_stats
+
+startup_timing.mark("imports done")
 
 load_dotenv()
 discord_token = os.getenv('DISCORD_TOKEN')
@@ -29,6 +41,41 @@ print(directory)
 MAX_RETRIES = 3
 RETRY_DELAY = 3
 POLLING_INTERVAL = 60  # Check waiting list every 60 seconds
+RENDITION_EXTRA_FORMATS = ("webp",)  # Also upload these formats for LD/SD/HD, e.g. ("webp", "avif")
+STREAM_UPSCALED_UPLOAD = True  # Copy the upscaled image CDN -> bucket without a temp file (falls back to download + upload)
+UPSCALE_CLICK_DELAY = 6  # seconds for Discord to render the upscale buttons
+# Items carry an inline placeholder; set False to stop uploading the BL image once every client reads it
+UPLOAD_BL_RENDITION = True
+
+# Stall watchdog (auto mode): seconds per attempt of each job stage; an overdue stage is
+# retried STAGE_RETRIES times, then the job is abandoned and the waiting item released
+STAGE_DEADLINES = {
+    "download": 120,
+    "renditions": 300,
+    "thumbnail_upload": 120,
+    "analysis": 180,
+    "upscale_click": 240,  # click_somewhere itself retries for up to 150 s
+    "upscaled": 600,       # Midjourney upscale, counted from the click
+    "publish": 180,
+    "complete": 60,
+}
+STAGE_RETRIES = 1
+IMAGINE_DEADLINE = 900  # claimed item -> "- Image #" message (prompt, /imagine and the render)
+MAX_ITEM_FAILURES = 3   # then the waiting item is marked Failed instead of queued again
+PROMPT_MATCH_WORDS = 12  # leading prompt words a "- Image #" message must contain to belong to the current item
+WATCHDOG_INTERVAL = 30
+
+# Several workers (e.g. one per Xvfb display) can share the waiting list when the backend
+# supports leases: an item is claimed for LEASE_TTL seconds and renewed while the job runs
+WAITING_LIST_LEASES = os.getenv("WAITING_LIST_LEASES", "0") == "1"
+WORKER_ID = os.getenv("WORKER_ID") or f"{socket.gethostname()}{os.getenv('DISPLAY', '')}"  # stable across restarts
+LEASE_TTL = 300
+LEASE_RENEW_INTERVAL = 60
+
+# Pick waiting items client-side by priority, aging and per-source share (waiting_scheduler.py)
+# instead of taking the backend's next item
+SCHEDULED_PICKUP = os.getenv("SCHEDULED_PICKUP", "0") == "1"
+URGENT_TAG = "!urgent"  # in a #to_waiting_list message: queue with URGENT_PRIORITY
 
 class CustomBot(commands.Bot):
     def __init__(self):
@@ -44,12 +91,39 @@ class CustomBot(commands.Bot):
         self.upscaled_url = ""
         self.upscaled_blob = ""
         self.waiting_id = ""
+        self.waiting_failures = 0  # failed attempts at the current waiting item so far
+        self.current_prompt = ""  # prompt typed for the current item; matched against "- Image #" messages
         self.imageList_data = ""
+        self.placeholder = None  # BlurHash + tiny thumbnail, stored inline on the item
+        self.job = None  # StageGraph of the current Midjourney job
+        self.job_id = ""  # Its row in job_store, updated at every stage transition
         self.auto_polling_mode = False
         self.task_in_progress = False  # CRITICAL: Prevents multiple tasks running simultaneously
+        self.task_started_at = 0.0  # time.monotonic() when the current item was claimed
         self.polling_task = None  # Store the polling task reference
+        self.watchdog_task = None  # Abandons stalled jobs (check_stalled_job)
+        self.lease_task = None  # Renews the lease on the claimed waiting item
+        self.scheduler = WaitingScheduler()  # Chooses the next waiting item (SCHEDULED_PICKUP)
+        self.profiler = ProfileController()  # On-demand profiling from #to_waiting_list
+        self.profile_channel = None  # Where the "next job" profile summary is posted
+        self.firebase_task = None  # Firebase credential setup, runs concurrently with the Discord login
+        self.startup_reported = False
         print("CustomBot init")
-        initialize_firebase()
+
+    def start_firebase_init(self):
+        """Start Firebase credential setup in a worker thread so it overlaps the gateway connect"""
+        async def init_firebase():
+            try:
+                await asyncio.to_thread(initialize_firebase)
+                startup_timing.mark("firebase ready")
+            except Exception as e:
+                print(f"initialize_firebase Error: {str(e)}")
+
+        self.firebase_task = asyncio.create_task(init_firebase())
+
+    async def wait_firebase_ready(self):
+        if self.firebase_task:
+            await self.firebase_task
 
     async def cleanup(self):
         """Cleanup method to properly close connections"""
@@ -62,6 +136,9 @@ class CustomBot(commands.Bot):
                 except asyncio.CancelledError:
                     print("Polling task cancelled")
 
+            if self.watchdog_task and not self.watchdog_task.done():
+                self.watchdog_task.cancel()
+
             if self.session and not self.session.closed:
                 await self.session.close()
             if not self.is_closed():
@@ -73,12 +150,20 @@ class CustomBot(commands.Bot):
         print(f"Bot connected as {self.user.name}")
         print(f"Bot ID: {self.user.id}")
         self.reconnect_attempts = 0
+        if not self.startup_reported:
+            startup_timing.mark("on_ready")
+            print(startup_timing.report())
+            self.startup_reported = True
+            # Continue a job interrupted by a crash/restart before taking a new one
+            await recover_job()
 
         if client.auto_polling_mode:
             # Start the polling task
             if not self.polling_task or self.polling_task.done():
                 self.polling_task = asyncio.create_task(self.start_polling_loop())
                 print("Started automatic polling mode")
+            if not self.watchdog_task or self.watchdog_task.done():
+                self.watchdog_task = asyncio.create_task(self.start_watchdog_loop())
 
     async def on_connect(self):
         print("Bot successfully connected to Discord")
@@ -119,7 +204,26 @@ class CustomBot(commands.Bot):
                 # Wait a bit before retrying after error
                 await asyncio.sleep(POLLING_INTERVAL)
 
-client = CustomBot()
+    async def start_watchdog_loop(self):
+        """Background task that retries or abandons stalled jobs"""
+        print("=== Watchdog started ===")
+        await self.wait_until_ready()
+
+        while not self.is_closed():
+            try:
+                await asyncio.sleep(WATCHDOG_INTERVAL)
+                await check_stalled_job()
+            except asyncio.CancelledError:
+                print("Watchdog cancelled")
+                break
+            except Exception as e:
+                print(f"Error in watchdog: {e}")
+
+    async def on_message(self, message):
+        await handle_message(message)
+
+# Constructed under __main__ so image pool workers that import this module don't build a bot
+client = None
 
 async def handle_upload(message, attach_image_url):
     """
@@ -154,19 +258,23 @@ async def handle_upload(message, attach_image_url):
                 click_somewhere("img/linux/bot_textbox.png", interval_seconds=2, repeat=2, retry=3, retry_interval=2)
 
             # Type the generated prompt with aspect ratio
+            client.current_prompt = prompt_string
+            record_claim(prompt_string)
             type_imagine(f"{prompt_string} --ar 9:16")
 
             # Clean up the downloaded image
             safe_delete(local_image_path)
 
         else:
-            # Check if the message content itself is an image URL
-            is_image, content_type = is_image_url(message.content)
-            if is_image:
-                image_url = message.content
+            # Check if the message content itself is an image URL,
+            # keeping the response open so the image is downloaded only once.
+            # Only a small variant is needed for the GPT description.
+            image_url = sized_url(message.content.strip(), DESCRIBE_MIN_SIZE)
+            probe = await probe_image_url(image_url)
+            if probe.is_image:
 
                 # Download the image from the URL
-                local_image_path = await download_image(image_url)
+                local_image_path = await download_image(image_url, probe=probe)
 
                 if not local_image_path:
                     print("Failed to download image from URL")
@@ -184,6 +292,8 @@ async def handle_upload(message, attach_image_url):
                     click_somewhere("img/linux/bot_textbox.png", interval_seconds=2, repeat=2, retry=3, retry_interval=2)
 
                 # Type the generated prompt with aspect ratio
+                client.current_prompt = prompt_string
+                record_claim(prompt_string)
                 type_imagine(f"{prompt_string} --ar 9:16")
 
                 # Clean up the downloaded image
@@ -198,103 +308,603 @@ async def handle_upload(message, attach_image_url):
         traceback.print_exc()
         await message.channel.send(f"Error processing image: {str(e)}")
 
+def prompt_words(text):
+    """Lowercase words of a prompt, without Midjourney's markdown and punctuation"""
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+def midjourney_prompt(content):
+    """The prompt Midjourney echoes in bold at the start of its messages"""
+    match = re.search(r"\*\*(.+?)\*\*", content)
+    return match.group(1) if match else ""
+
+def prompt_matches(prompt, content):
+    """Whether a Midjourney message contains the first PROMPT_MATCH_WORDS words of prompt"""
+    words = " ".join(prompt_words(prompt)[:PROMPT_MATCH_WORDS])
+    return words in " ".join(prompt_words(content))
+
+def is_current_prompt(content):
+    """Whether a Midjourney message is the render of the prompt typed for the current item"""
+    if not client.current_prompt:
+        # Auto mode: no item claimed, e.g. a late render of an abandoned one.
+        # Manual mode: a /imagine typed by hand.
+        return not client.auto_polling_mode
+    return prompt_matches(client.current_prompt, content)
+
+def record_claim(prompt=""):
+    """Persist the claimed waiting item (and its prompt once typed) as the job's first stage"""
+    if client.job_id and client.job is None:
+        get_job_store().record_stage(client.job_id, "claim", {"waiting_id": client.waiting_id, "prompt": prompt})
+
 async def handle_to_waiting_list(message, attach_image_url):
     note = ""
     try:
         if "command_stop_progress" in message.content:
             client.task_in_progress = False
+            stop_lease_heartbeat()  # the claimed item returns to the queue when its lease expires
             await message.channel.send(f"=== set task_in_progress to False ===")
             return
 
+        if "command_seed_dedupe" in message.content:
+            added = await asyncio.to_thread(seed_from_backend)
+            await message.channel.send(f"=== URL dedupe index seeded, {added} new urls ===")
+            return
+
+        if "command_queue_stats" in message.content:
+            await message.channel.send(format_queue_stats(await asyncio.to_thread(get_queue_stats)))
+            return
+
+        profile_command = parse_profile_command(message.content)
+        if profile_command:
+            await handle_profile_command(message, *profile_command)
+            return
+
+        content = message.content
+        priority = 0
+        if URGENT_TAG in content:
+            content = content.replace(URGENT_TAG, "").strip()
+            priority = URGENT_PRIORITY
+
         temp_url = ""
         result = False
+        added_count = 0
         #if message.content in "Discord Message:":
         #    print("pass")
         #    pass
+        bulk_urls = [word for word in content.split() if word.startswith("http")]
         if attach_image_url:
             temp_url = attach_image_url
-            result = add_one("discord", note, temp_url)
+            result = add_one("discord", note, temp_url, priority=priority)
+        elif len(bulk_urls) > 1:
+            # Several URLs in one message: validate them concurrently
+            for url, is_image, content_type in await validate_image_urls(bulk_urls):
+                if is_image and add_one("discord", note, url, priority=priority):
+                    added_count += 1
+            if added_count:
+                await message.channel.send(f"Discord Message: Added {added_count} of {len(bulk_urls)} urls successfully")
         else:
-            is_image, content_type = is_image_url(message.content)
+            is_image, content_type = await is_image_url_async(content)
             if is_image:
-                image_url = message.content
+                image_url = content
                 temp_url = image_url
-                result = add_one("discord", note, temp_url)
+                result = add_one("discord", note, temp_url, priority=priority)
         if result:
             await message.channel.send(f"Discord Message: Added url successfully: {temp_url}")
 
+        if priority and (result or added_count) and client.auto_polling_mode and not client.task_in_progress:
+            # Urgent and the bot is idle: don't wait for the next polling interval
+            asyncio.create_task(polling_waiting_list())
+
     except Exception as e:
         print(f"Error in handle_upload: {e}")
 
+async def handle_profile_command(message, action, mode, seconds):
+    """Start or stop an on-demand profile capture of the running bot process."""
+    try:
+        if action == "stop":
+            _, summary = client.profiler.stop()
+            await message.channel.send(format_for_discord(summary))
+            return
+
+        if client.profiler.is_active():
+            await message.channel.send("A profile capture is already running, send command_profile_stop first")
+            return
+
+        if action == "next_job":
+            client.profiler.start(mode, until_job_end=True, label="next_job")
+            client.profile_channel = message.channel
+            await message.channel.send(f"=== {mode} capture armed until the next job completes ===")
+        elif action == "seconds":
+            await message.channel.send(f"=== {mode} capture started for {seconds}s ===")
+
+            async def capture_and_report():
+                _, summary = await client.profiler.capture_for(seconds, mode)
+                await message.channel.send(format_for_discord(summary))
+
+            asyncio.create_task(capture_and_report())
+
+    except Exception as e:
+        print(f"Error in handle_profile_command: {e}")
+        await message.channel.send(f"Profiling error: {str(e)}")
+
+async def finish_job_profile():
+    """Stop a "next job" capture (if armed) and post its summary."""
+    summary = client.profiler.stop_for_job()
+    if summary and client.profile_channel:
+        await client.profile_channel.send(format_for_discord(summary))
+        client.profile_channel = None
+
+def analyze_thumbnail(image_path):
+    """Blocking title/tags analysis, run in a worker thread"""
+    analyzer = ImageAnalyzer()
+    return analyzer.analyze_image(image_path)
+
+def click_upscale():
+    """Blocking: wait for the upscale button on screen and click it (run in a worker thread)"""
+    if is_macos():
+        click_somewhere("img/mac/upscale_subtle.png",interval_seconds = 0.5, repeat = 2, retry= 30, retry_interval = 5)
+    else:
+        click_somewhere("img/linux/upscale_subtle.png",interval_seconds = 0.5, repeat = 2, retry= 30, retry_interval = 5)
+
+def build_job_graph(message, attach_image_url, job_id=""):
+    """
+    Stages of one Midjourney job, from the "- Image #" message to the completed waiting item:
+
+        download -> renditions, thumbnail_upload, analysis, upscale_click
+        upscaled (external: the "- Upscaled" message)
+        renditions, thumbnail_upload, analysis, upscaled -> publish -> complete
+
+    Every stage result is JSON-serialisable and is written to the job store as
+    soon as the stage finishes, so recover_job() can skip it after a restart.
+    """
+    store = get_job_store()
+
+    def record_stage(name, result):
+        if job_id:
+            store.record_stage(job_id, name, result)
+
+    graph = StageGraph(f"job {client.waiting_id or 'manual'}", on_stage_done=record_stage)
+
+    async def download():
+        path = await download_image(attach_image_url)
+        if not path:
+            raise RuntimeError("Failed to download thumbnail")
+        client.thumbnail_path = path
+        return path
+
+    async def renditions(download):
+        client.imageList_data, client.placeholder = await resize_all_and_upload_to_firebase(
+            download, False, extra_formats=RENDITION_EXTRA_FORMATS,
+            include_blur=UPLOAD_BL_RENDITION, with_placeholder=True)
+        if (client.imageList_data):
+            print("Downsize all type and added to firebase successfully!")
+        return {"imageList": client.imageList_data, "placeholder": client.placeholder}
+
+    async def thumbnail_upload(download):
+        firebase_url, blob_name = await asyncio.to_thread(upload_to_firebase_3, download, "thumbnail")
+        if not firebase_url:
+            raise RuntimeError("Failed to upload thumbnail to Firebase")
+        client.thumbnail_url = firebase_url
+        client.thumbnail_blob = blob_name
+        print("Thumbnail added to firebase successfully!")
+        return [firebase_url, blob_name]
+
+    async def analysis(download):
+        # Title/tags only need the thumbnail: overlap the GPT call with the upscale wait
+        try:
+            title, tags = await asyncio.to_thread(analyze_thumbnail, download)
+        except Exception as e:
+            print(f"Analysis failed, retrying: {e}")
+            title, tags = await asyncio.to_thread(analyze_thumbnail, download)
+        return [title, tags]
+
+    async def upscale_click(download):
+        # Nothing else has to finish first; only give Discord time to render the buttons
+        print("click upscale button...")
+        await asyncio.sleep(UPSCALE_CLICK_DELAY)
+        await asyncio.to_thread(click_upscale)
+
+    async def publish(renditions, thumbnail_upload, analysis, upscaled):
+        title, tags = analysis
+        new_itemId = await publish_item(message, title, tags, thumbnail_upload, upscaled, renditions)
+        if new_itemId == "":
+            raise RuntimeError("Publish item failed")
+        return new_itemId
+
+    async def complete(publish, thumbnail_upload):
+        api_client = WallpaperAPI()
+        thumbnail_url, _ = thumbnail_upload
+        worker_id = ""
+        if WAITING_LIST_LEASES and client.waiting_id:
+            # Only the lease holder may complete the item
+            response = await asyncio.to_thread(api_client.renew_lease, client.waiting_id, WORKER_ID, LEASE_TTL)
+            if not response["success"]:
+                raise RuntimeError(f"Lease on waiting item {client.waiting_id} lost before completion")
+            worker_id = WORKER_ID
+        response = await asyncio.to_thread(api_client.complete_waiting_list_item, client.waiting_id, publish,
+                                           thumbnail_url, worker_id=worker_id)
+        if response.get("status_code") == 409:
+            raise RuntimeError(f"Lease on waiting item {client.waiting_id} lost before completion")
+        return publish
+
+    graph.add("download", download, deadline=STAGE_DEADLINES.get("download"))
+    graph.add("renditions", renditions, deps=["download"], deadline=STAGE_DEADLINES.get("renditions"))
+    graph.add("thumbnail_upload", thumbnail_upload, deps=["download"], deadline=STAGE_DEADLINES.get("thumbnail_upload"))
+    graph.add("analysis", analysis, deps=["download"], deadline=STAGE_DEADLINES.get("analysis"))
+    graph.add("upscale_click", upscale_click, deps=["download"], deadline=STAGE_DEADLINES.get("upscale_click"))
+    graph.external("upscaled", after=["upscale_click"], deadline=STAGE_DEADLINES.get("upscaled"))
+    graph.add("publish", publish, deps=["renditions", "thumbnail_upload", "analysis", "upscaled"],
+              deadline=STAGE_DEADLINES.get("publish"))
+    graph.add("complete", complete, deps=["publish", "thumbnail_upload"], deadline=STAGE_DEADLINES.get("complete"))
+    return graph
+
+def restore_client_state(stages):
+    """Put the results of stages finished in an earlier run back on the client."""
+    client.thumbnail_path = stages.get("download") or ""
+    if "renditions" in stages:
+        client.imageList_data = stages["renditions"]["imageList"]
+        client.placeholder = stages["renditions"]["placeholder"]
+    if "thumbnail_upload" in stages:
+        client.thumbnail_url, client.thumbnail_blob = stages["thumbnail_upload"]
+    if "upscaled" in stages:
+        client.upscaled_url, client.upscaled_blob = stages["upscaled"]
+
+def start_job(message, attach_image_url, job_id, completed=None):
+    """Build and start the job graph, abandoning whatever job was still running."""
+    if client.job is not None:
+        client.job.cancel()
+        if client.job_id and client.job_id != job_id:
+            get_job_store().finish_job(client.job_id, ABANDONED)
+    client.job_id = job_id
+    client.job = build_job_graph(message, attach_image_url, job_id).start(completed)
+    return client.job
+
+async def watch_job_stages(message, job):
+    """
+    Abandon the job as soon as a stage before publish fails, instead of when
+    the external "upscaled" stage runs out of retries.
+    """
+    names = [name for name in ("renditions", "thumbnail_upload", "analysis", "upscale_click") if name in job.stages]
+    try:
+        await asyncio.gather(*[job.result(name) for name in names])
+    except StageFailed as e:
+        if client.job is job:
+            await message.channel.send(f"Job stage failed: {str(e)}")
+            await abandon_job(str(e), FAILED)
+
+async def find_upscaled_message(channel, image_message):
+    """The first "- Upscaled" result posted after the job's "- Image #" message, if any."""
+    async for candidate in channel.history(after=image_message, limit=50):
+        if "- Upscaled" in candidate.content and candidate.attachments:
+            return candidate
+    return None
+
+async def recover_job():
+    """
+    Continue the job that was running when the bot stopped (see job_store.py).
+
+    Completed stages are not repeated. The "- Image #" message is fetched again
+    for a fresh attachment URL, and an upscale that was posted while the bot
+    was down is picked up from the channel history.
+    """
+    store = get_job_store()
+    saved = await asyncio.to_thread(store.active_job)
+    if saved is None:
+        return
+
+    job_id = saved["job_id"]
+    completed = dict(saved["stages"])
+    print(f"Recovering job {job_id} (waiting item {saved['waiting_id']}), done: {', '.join(completed) or 'nothing'}")
+    if "complete" in completed:
+        store.finish_job(job_id, DONE)
+        return
+    if not saved["message_id"]:
+        await recover_claim(saved)
+        return
+
+    try:
+        channel = client.get_channel(saved["channel_id"]) or await client.fetch_channel(saved["channel_id"])
+        message = await channel.fetch_message(saved["message_id"])
+        attach_image_url = message.attachments[0].url
+    except Exception as e:
+        print(f"✗ Cannot recover job {job_id}: {e}")
+        store.finish_job(job_id, ABANDONED)
+        return
+
+    # The thumbnail is a temp file; download it again if a stage that still has to run needs it
+    download_users = ("renditions", "thumbnail_upload", "analysis", "upscale_click")
+    if "download" in completed and not os.path.exists(completed["download"] or "") \
+            and not all(name in completed for name in download_users):
+        del completed["download"]
+
+    upscaled_message = None
+    if "upscaled" not in completed:
+        upscaled_message = await find_upscaled_message(channel, message)
+        if upscaled_message is not None:
+            completed.setdefault("upscale_click", None)  # already clicked, don't upscale twice
+
+    publish_deps = ("renditions", "thumbnail_upload", "analysis", "upscaled")
+    if "publish" not in completed and saved["waiting_id"] and all(name in completed for name in publish_deps):
+        # publish may have added the item before the crash: look it up by its waiting id instead of adding it twice
+        api_client = WallpaperAPI()
+        existing_item_id = await asyncio.to_thread(api_client.find_wallpaper_by_waiting_id, saved["waiting_id"])
+        if existing_item_id is None:
+            print(f"✗ Cannot tell whether job {job_id} was already published, not recovering it")
+            store.finish_job(job_id, ABANDONED)
+            return
+        if existing_item_id:
+            print(f"Job {job_id} already published as item {existing_item_id}")
+            completed["publish"] = existing_item_id
+            store.record_stage(job_id, "publish", existing_item_id)
+
+    if WAITING_LIST_LEASES and saved["waiting_id"]:
+        # Still ours only if no other worker claimed the item while this one was down
+        api_client = WallpaperAPI()
+        response = await asyncio.to_thread(api_client.renew_lease, saved["waiting_id"], WORKER_ID, LEASE_TTL)
+        if not response["success"]:
+            print(f"✗ Lease on waiting item {saved['waiting_id']} lost, not recovering job {job_id}")
+            store.finish_job(job_id, ABANDONED)
+            return
+        start_lease_heartbeat(saved["waiting_id"])
+
+    await client.wait_firebase_ready()
+    client.task_in_progress = True
+    client.task_started_at = time.monotonic()
+    client.waiting_id = saved["waiting_id"]
+    client.waiting_failures = saved["data"].get("failures", 0)
+    client.current_prompt = (saved["data"].get("prompt") or (completed.get("claim") or {}).get("prompt")
+                             or midjourney_prompt(message.content))
+    restore_client_state(completed)
+    job = start_job(message, attach_image_url, job_id, completed)
+
+    if "upscaled" in completed:
+        asyncio.create_task(wait_job_finished(message))
+        return
+    asyncio.create_task(watch_job_stages(message, job))
+    if upscaled_message is not None:
+        attachment = upscaled_message.attachments[0]
+        asyncio.create_task(handle_bot(upscaled_message, attachment.url, attachment.filename))
+    # Otherwise the "- Upscaled" message arrives as usual once the (re)clicked upscale is done
+
+async def find_image_message(prompt):
+    """Midjourney's "- Image #" reply to prompt in #bot, if it was posted"""
+    for channel in client.get_all_channels():
+        if getattr(channel, "name", "") != "bot" or not hasattr(channel, "history"):
+            continue
+        async for candidate in channel.history(limit=50):
+            if "- Image #" in candidate.content and candidate.attachments and prompt_matches(prompt, candidate.content):
+                return candidate
+    return None
+
+async def recover_claim(saved):
+    """
+    The bot stopped between claiming a waiting item and handling Midjourney's
+    "- Image #" reply: resume from the reply if it was posted, otherwise give
+    the item back to the waiting list.
+    """
+    store = get_job_store()
+    job_id, waiting_id = saved["job_id"], saved["waiting_id"]
+    prompt = (saved["stages"].get("claim") or {}).get("prompt", "")
+    image_message = await find_image_message(prompt) if prompt else None
+    if image_message is not None:
+        print(f"Found the Midjourney image of job {job_id}, resuming it")
+        store.attach_message(job_id, image_message.channel.id, image_message.id, image_message.attachments[0].url)
+        await recover_job()
+        return
+
+    store.finish_job(job_id, ABANDONED)
+    if not waiting_id:
+        return
+    # Not a failure of the item itself: give it back with the failure count it had
+    failures = saved["data"].get("failures", 0)
+    note = "bot restarted before Midjourney answered"
+    api_client = WallpaperAPI()
+    if WAITING_LIST_LEASES:
+        response = await asyncio.to_thread(api_client.release_lease, waiting_id, WORKER_ID, failures, note, MAX_ITEM_FAILURES)
+    else:
+        response = await asyncio.to_thread(api_client.release_waiting_list_item, waiting_id, failures, note, MAX_ITEM_FAILURES)
+    print(f"{'✓' if response['success'] else '✗'} Claimed waiting item {waiting_id} given back to the queue")
+
+async def finish_upscaled_job(message, firebase_url, blob_name):
+    """Hand the upscaled upload to the running job graph and wait for publish + complete."""
+    job = client.job
+    if job is None:
+        # Late upscale of an abandoned job
+        await message.channel.send("No job in progress for this upscaled image")
+        if blob_name:
+            await asyncio.to_thread(delete_uploaded_blobs, [blob_name])
+        return
+    if "upscaled" not in job.pending():
+        # A second upscale (e.g. after the watchdog clicked again); the first one is used
+        await message.channel.send("Upscaled image already received for this job")
+        if blob_name and blob_name != client.upscaled_blob:
+            await asyncio.to_thread(delete_uploaded_blobs, [blob_name])
+        return
+
+    if firebase_url:
+        client.upscaled_url = firebase_url
+        client.upscaled_blob = blob_name
+        await message.channel.send(f"Upscaled added to firebase successfully!")
+        job.set_result("upscaled", [firebase_url, blob_name])
+    else:
+        await message.channel.send("Failed to upload upscaled image to Firebase")
+        job.set_failed("upscaled", RuntimeError("Failed to upload upscaled image to Firebase"))
+
+    await wait_job_finished(message)
+
+async def wait_job_finished(message):
+    """Wait for publish + complete, record the outcome and move on to the next item."""
+    job, job_id = client.job, client.job_id
+    try:
+        await job.result("complete")
+    except StageFailed as e:
+        if client.job is not job:
+            return  # abandoned by the watchdog, which already cleaned up
+        print(f"Job failed: {e}! Marking task as not in progress")
+        if job.is_done("upscaled"):
+            await message.channel.send(f"Error publishing item: {str(e)}")
+        await abandon_job(str(e), FAILED)
+        return
+
+    if job_id:
+        get_job_store().finish_job(job_id, DONE)
+    clear_job_state()
+
+    # Mark task as completed
+    client.task_in_progress = False
+    print("✓ Task completed, ready for next item")
+    await finish_job_profile()
+
+    # Immediately check for next item
+    await polling_waiting_list()
+
+def start_lease_heartbeat(waiting_id):
+    """Renew the lease on the claimed item until the job ends; abandon the job if it's lost."""
+    stop_lease_heartbeat()
+
+    async def heartbeat():
+        api_client = WallpaperAPI()
+        while True:
+            await asyncio.sleep(LEASE_RENEW_INTERVAL)
+            response = await asyncio.to_thread(api_client.renew_lease, waiting_id, WORKER_ID, LEASE_TTL)
+            if response["success"]:
+                continue
+            if response.get("status_code") != 409:
+                print(f"✗ Lease renewal failed, retrying: {response['message']}")
+                continue
+            # Expired and claimed by another worker: it owns the item now
+            if client.waiting_id == waiting_id:
+                await abandon_job(f"lease on waiting item {waiting_id} lost", release=False)
+            return
+
+    client.lease_task = asyncio.create_task(heartbeat())
+
+def stop_lease_heartbeat():
+    task = client.lease_task
+    client.lease_task = None
+    if task and not task.done() and task is not asyncio.current_task():
+        task.cancel()
+
+def clear_job_state():
+    """Forget the current job and delete its temp files."""
+    stop_lease_heartbeat()
+    client.job = None
+    client.job_id = ""
+    safe_delete(client.upscaled_path)
+    safe_delete(client.thumbnail_path)
+    client.thumbnail_url = ""
+    client.thumbnail_blob = ""
+    client.upscaled_url = ""
+    client.upscaled_blob = ""
+    client.waiting_id = ""
+    client.waiting_failures = 0
+    client.current_prompt = ""
+    client.imageList_data = ""
+    client.placeholder = None
+
+async def abandon_job(reason, status=ABANDONED, release=True):
+    """
+    Give up on the current item: stop its stages, delete the blobs it uploaded,
+    give the waiting item back to the queue with its failure count, and move on.
+
+    Args:
+        release (bool): False when the item already belongs to another worker (lease lost)
+    """
+    job, job_id, waiting_id = client.job, client.job_id, client.waiting_id
+    print(f"✗ Giving up on waiting item {waiting_id or '(manual)'}: {reason}")
+    published = job is not None and job.is_done("publish")
+    blobs = [client.thumbnail_blob, client.upscaled_blob]
+    blobs += [entry.get("blob") for entry in (client.imageList_data or []) if isinstance(entry, dict)]
+    failures = client.waiting_failures + 1
+
+    # Detach first, so the job's own waiters see it's no longer current
+    clear_job_state()
+    if job is not None:
+        job.cancel(reason)
+    if job_id:
+        get_job_store().finish_job(job_id, status)
+
+    if published:
+        # The item is live and uses the blobs; only the waiting item's completion is missing
+        print(f"Item was already published, keeping its blobs; waiting item {waiting_id} not released")
+    else:
+        deleted = await asyncio.to_thread(delete_uploaded_blobs, blobs)
+        if deleted:
+            print(f"Deleted {deleted} partial blobs")
+        if waiting_id and release:
+            api_client = WallpaperAPI()
+            if WAITING_LIST_LEASES:
+                response = await asyncio.to_thread(
+                    api_client.release_lease, waiting_id, WORKER_ID, failures, reason, MAX_ITEM_FAILURES)
+            else:
+                response = await asyncio.to_thread(
+                    api_client.release_waiting_list_item, waiting_id, failures, reason, MAX_ITEM_FAILURES)
+            state = "marked Failed" if failures >= MAX_ITEM_FAILURES else "back in the queue"
+            print(f"{'✓' if response['success'] else '✗'} Waiting item {waiting_id} {state} ({failures} failures)")
+
+    client.task_in_progress = False
+    await finish_job_profile()
+    channel = client.get_channel(int(CHANNEL_ID))
+    if channel:
+        await channel.send(f"=== Job abandoned: {reason} ===")
+
+    await polling_waiting_list()
+
+async def check_stalled_job():
+    """Retry stages that overran their deadline; abandon the job when retries are used up."""
+    if not client.task_in_progress:
+        return
+    job = client.job
+    if job is None:
+        if client.task_started_at and time.monotonic() - client.task_started_at > IMAGINE_DEADLINE:
+            await abandon_job(f"no Midjourney image within {IMAGINE_DEADLINE}s")
+        return
+
+    for name in job.overdue():
+        stage = job.stages[name]
+        if stage.attempts >= STAGE_RETRIES:
+            await abandon_job(f"stage {name} stalled ({stage.attempts + 1} attempts of {stage.deadline}s)")
+            return
+        print(f"⏱ Stage {name} overran {stage.deadline}s, retrying")
+        job.restart(name)
+        if name == "upscaled":
+            # No "- Upscaled" message: the click most likely missed the button
+            asyncio.create_task(asyncio.to_thread(click_upscale))
+
 async def handle_bot(message, attach_image_url, file_name):
     try:
+        await client.wait_firebase_ready()
         if file_name.lower().endswith((".png", ".jpg", ".jpeg", ".gif")):
             if "- Upscaled" in message.content:
-                client.upscaled_path = await download_image(attach_image_url)
-                if client.upscaled_path:
-                    firebase_url, blob_name = upload_to_firebase_3(client.upscaled_path, "upscaled")
-                    if firebase_url:
-                        client.upscaled_url = firebase_url
-                        client.upscaled_blob = blob_name
-                        await message.channel.send(f"Upscaled added to firebase successfully!")
-
-                        # Initialize the image analyzer
-                        analyzer = ImageAnalyzer()
-                        try:
-                            # Analyze the thumbnail image
-                            title, tags = analyzer.analyze_image(client.thumbnail_path)
-                            new_itemId = await publish_item(message, title, tags)
-                            safe_delete(client.upscaled_path)
-                            safe_delete(client.thumbnail_path)
-                            if new_itemId != "":
-                                api_client = WallpaperAPI()
-                                api_client.complete_waiting_list_item(client.waiting_id, new_itemId, client.thumbnail_url)
-
-                                # Clear the URLs after successful publishing
-                                client.thumbnail_url = ""
-                                client.thumbnail_blob = ""
-                                client.upscaled_url = ""
-                                client.upscaled_blob = ""
-                                client.waiting_id = ""
-                                client.imageList_data = ""
-
-                                # Mark task as completed
-                                client.task_in_progress = False
-                                print("✓ Task completed, ready for next item")
-
-                                # Immediately check for next item
-                                await polling_waiting_list()
-                            else:
-                                print("Publish item failed! Marking task as not in progress")
-                                client.task_in_progress = False
-
-                        except Exception as e:
-                            await message.channel.send(f"Error analyzing image: {str(e)}")
-                            client.task_in_progress = False
-                    else:
-                        await message.channel.send("Failed to upload upscaled image to Firebase")
-                        client.task_in_progress = False
+                if not is_current_prompt(message.content):
+                    print("Upscale of another prompt (abandoned item?), ignored")
+                    return
+                firebase_url, blob_name = None, None
+                if STREAM_UPSCALED_UPLOAD:
+                    # Pipe the Discord CDN response straight into the bucket, no temp file
+                    client.upscaled_path = ""
+                    firebase_url, blob_name = await stream_url_to_firebase(attach_image_url, "upscaled")
+                if not firebase_url:
+                    client.upscaled_path = await download_image(attach_image_url)
+                    if client.upscaled_path:
+                        # Multi-MB file: chunked with per-chunk retry, so a dropped connection doesn't waste the job
+                        firebase_url, blob_name = await upload_to_firebase_resumable(client.upscaled_path, "upscaled")
+                await finish_upscaled_job(message, firebase_url, blob_name)
 
             elif "- Image #" in message.content:
-                client.thumbnail_path = await download_image(attach_image_url)
-                if client.thumbnail_path:
-                    client.imageList_data = await resize_all_and_upload_to_firebase(client.thumbnail_path, False)
-                    if (client.imageList_data):
-                        print("Downsize all type and added to firebase successfully!")
-                    firebase_url, blob_name = upload_to_firebase_3(client.thumbnail_path, "thumbnail")
-                    if firebase_url:
-                        client.thumbnail_url = firebase_url
-                        client.thumbnail_blob = blob_name
-                        # await message.channel.send(f"Thumbnail added to firebase successfully!")
-                        print("Thumbnail added to firebase successfully!, click upscale button...")
-
-                        time.sleep(6)
-                        if is_macos():
-                            click_somewhere("img/mac/upscale_subtle.png",interval_seconds = 0.5, repeat = 2, retry= 30, retry_interval = 5)
-                        else:
-                            click_somewhere("img/linux/upscale_subtle.png",interval_seconds = 0.5, repeat = 2, retry= 30, retry_interval = 5)
-                    else:
-                        await message.channel.send("Failed to upload thumbnail to Firebase")
+                if not is_current_prompt(message.content):
+                    print("Image of another prompt (abandoned item?), ignored")
+                    return
+                store = get_job_store()
+                if client.job_id and client.job is None:
+                    # The job created when the item was claimed
+                    job_id = client.job_id
+                    store.attach_message(job_id, message.channel.id, message.id, attach_image_url)
+                else:
+                    job_id = store.create_job(client.waiting_id, message.channel.id, message.id, attach_image_url,
+                                              {"failures": client.waiting_failures, "prompt": client.current_prompt})
+                # Renditions, thumbnail upload, analysis and the upscale click run concurrently
+                job = start_job(message, attach_image_url, job_id)
+                await watch_job_stages(message, job)
             elif "- <@" in message.content and "discordapp" in attach_image_url:
                 print("click U4 option...")
 
@@ -309,8 +919,15 @@ async def handle_bot(message, attach_image_url, file_name):
     except Exception as e:
         print(f"Error in handle_bot: {e}")
         client.task_in_progress = False  # Reset flag on error
+        await finish_job_profile()
 
-async def publish_item(message, title, tags):
+async def publish_item(message, title, tags, thumbnail, upscaled, renditions):
+    """
+    Args:
+        thumbnail (list): [url, blob] from the thumbnail_upload stage
+        upscaled (list): [url, blob] from the upscaled stage
+        renditions (dict): {"imageList", "placeholder"} from the renditions stage
+    """
     try:
         # Create a custom configuration
         config = PublishConfig(
@@ -322,22 +939,25 @@ async def publish_item(message, title, tags):
         # Initialize the manager
         publisher = PublishManager(config)
 
-        # Get the URLs from the bot's state
-        if not client.thumbnail_url or not client.upscaled_url:
+        thumbnail_url, thumbnail_blob = thumbnail
+        upscaled_url, upscaled_blob = upscaled
+        if not thumbnail_url or not upscaled_url:
             await message.channel.send("Error: Missing thumbnail or upscaled image URLs")
             return ""
 
-        # Publish the item with actual URLs from the bot's state
+        # Publish the item with the results of the job's stages
         new_itemId = await publisher.publish(
             message=message,
-            thumbnail_url=client.thumbnail_url,
-            thumbnail_blob=client.thumbnail_blob,
-            upscaled_url=client.upscaled_url,
-            upscaled_blob=client.upscaled_blob,
+            thumbnail_url=thumbnail_url,
+            thumbnail_blob=thumbnail_blob,
+            upscaled_url=upscaled_url,
+            upscaled_blob=upscaled_blob,
             title=title,
             tags=tags,
             resolution="1632x2912",
-            imagesList = client.imageList_data
+            imagesList = renditions["imageList"],
+            placeholder = renditions["placeholder"],
+            waiting_id = client.waiting_id
         )
         return new_itemId
 
@@ -346,8 +966,7 @@ async def publish_item(message, title, tags):
         await message.channel.send(f"Error during publication: {str(e)}")
         return ""
 
-@client.event
-async def on_message(message):
+async def handle_message(message):
     try:
         channel_name = message.channel.name
         print(f"\n===== message (channel: {channel_name}) =====")
@@ -369,13 +988,14 @@ async def on_message(message):
             await handle_to_waiting_list(message, attach_image_url)
 
     except Exception as e:
-        print(f"Error in on_message: {e}")
+        print(f"Error in handle_message: {e}")
         await message.channel.send("An error occurred while processing the message.")
 
 async def main():
     try:
         async with aiohttp.ClientSession() as session:
             client.session = session
+            client.start_firebase_init()
             await client.start(discord_token)
     except discord.errors.ConnectionClosed:
         print("Connection closed. Attempting to reconnect...")
@@ -402,17 +1022,89 @@ async def shutdown():
     await client.cleanup()
     print("Shutdown complete.")
 
+def fetch_waiting_items(api_client):
+    """All waiting list items (any status), None on error"""
+    response = api_client.get_waiting_list()
+    if not response["success"]:
+        print(f"✗ Error fetching waiting list: {response['message']}")
+        return None
+    try:
+        return json.loads(response["message"])
+    except json.JSONDecodeError:
+        print("✗ Error fetching waiting list: invalid JSON")
+        return None
+
+def get_queue_stats():
+    """Depth and wait time per class of the pending waiting items (blocking)"""
+    return client.scheduler.queue_stats(fetch_waiting_items(WallpaperAPI()) or [])
+
+def pick_from_waiting_list(api_client):
+    """
+    Let the scheduler choose among the pending items (blocking). Returns the same
+    shape as get_one_from_waiting_list; the chosen item is claimed with leases and
+    assigned without. If the list can't be fetched, the backend picks as usual.
+    """
+    items = fetch_waiting_items(api_client)
+    if items is None:
+        if WAITING_LIST_LEASES:
+            return api_client.claim_waiting_item(WORKER_ID, LEASE_TTL, assign="midjourney")
+        return api_client.get_one_from_waiting_list(assign="midjourney")
+    chosen = client.scheduler.pick(items)
+    print(format_queue_stats(client.scheduler.queue_stats(items)))
+    if chosen is None:
+        return {"success": False, "message": "No waiting items found."}
+
+    if WAITING_LIST_LEASES:
+        response = api_client.claim_waiting_item(WORKER_ID, LEASE_TTL, assign="midjourney", item_id=chosen["_id"])
+        if not response["success"]:
+            # Another worker was faster; take whatever the backend gives
+            response = api_client.claim_waiting_item(WORKER_ID, LEASE_TTL, assign="midjourney")
+        return response
+
+    response = api_client.assign_waiting_item(chosen["_id"], assign="midjourney")
+    if not response["success"]:
+        print(f"✗ Error assigning waiting item {chosen['_id']}: {response['message']}")
+    return {
+        "success": True,
+        "data": {
+            "_id": chosen["_id"],
+            "url": chosen.get("url"),
+            "variants": chosen.get("variants", []),
+            "failures": chosen.get("failures", 0)
+        }
+    }
+
+def drop_claim():
+    """Forget a claim that never reached Midjourney (the item stays assigned, as before)"""
+    stop_lease_heartbeat()
+    if client.job_id and client.job is None:
+        get_job_store().finish_job(client.job_id, ABANDONED)
+        client.job_id = ""
+    client.task_in_progress = False
+
 async def get_next_url_from_waiting_list():
     """Get the next URL from waiting list and send it to Discord channel"""
     api_client = WallpaperAPI()
-    response = api_client.get_one_from_waiting_list(assign="midjourney")
+    if SCHEDULED_PICKUP:
+        response = await asyncio.to_thread(pick_from_waiting_list, api_client)
+    elif WAITING_LIST_LEASES:
+        response = api_client.claim_waiting_item(WORKER_ID, LEASE_TTL, assign="midjourney")
+    else:
+        response = api_client.get_one_from_waiting_list(assign="midjourney")
 
     # Check if the request was successful
     if response["success"]:
         # Access the extracted data
         _id = response["data"]["_id"]
-        url = response["data"]["url"]
+        # Post the smallest source variant that is still a good reference, not the original
+        url = url_for(response["data"]["url"], response["data"].get("variants"), REFERENCE_MIN_SIZE)
         client.waiting_id = _id
+        client.waiting_failures = response["data"].get("failures", 0)
+        # Persist the claim first: after a crash, recover_job resumes or releases the item
+        client.job_id = get_job_store().create_job(_id, data={"failures": client.waiting_failures})
+        record_claim()
+        if WAITING_LIST_LEASES:
+            start_lease_heartbeat(_id)
 
         print(f"✓ GET one item from waiting list!")
         print(f"  _id: {_id}")
@@ -426,10 +1118,10 @@ async def get_next_url_from_waiting_list():
                 print(f"✓ URL sent to #upload channel")
             else:
                 print(f"✗ Error: Channel with ID {CHANNEL_ID} not found")
-                client.task_in_progress = False
+                drop_claim()
         except Exception as e:
             print(f"✗ Error sending message: {e}")
-            client.task_in_progress = False
+            drop_claim()
     else:
         # Handle error case
         print(f"✗ Error: {response['message']}")
@@ -462,6 +1154,7 @@ async def polling_waiting_list():
     if count > 0:
         # Set flag to prevent concurrent tasks
         client.task_in_progress = True
+        client.task_started_at = time.monotonic()
         print("✓ Items available, starting task...")
 
         try:
@@ -485,12 +1178,17 @@ if __name__ == "__main__":
                         help='Run the bot in automatic mode')
     args = parser.parse_args()
 
+    client = CustomBot()
     if args.automatic:
         print("🤖 Auto mode enabled!")
         client.auto_polling_mode = True
     else:
         print("👤 Normal mode!")
 
+    # Fork the image workers before any thread starts; they warm up while the bot logs in
+    start_image_pool(on_ready=lambda: startup_timing.mark("image pool warm"))
+    startup_timing.mark("image pool started")
+
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
@@ -499,4 +1197,5 @@ if __name__ == "__main__":
     except Exception as e:
         print(f"Fatal error: {e}")
     finally:
+        shutdown_image_pool()
         print("Bot has been shut down.")
\ No newline at end of file
@@ -0,0 +1,223 @@
+"""
+Adaptive encoding for the LD/SD/HD/BL renditions.
+
+Instead of a fixed quality, search the quality per image to hit either a byte
+budget for the rendition type or a perceptual-similarity (SSIM) floor, and
+report the chosen settings so they can be stored in the imageList entry.
+JPEG is always produced; WebP and AVIF variants can be added alongside it.
+"""
+
+from io import BytesIO
+from typing import Dict, Optional, Sequence
+
+# Byte budget per rendition type for a 9:16 Midjourney thumbnail (816x1456 source)
+RENDITION_BUDGETS = {
+    "LD": 20_000,    # 204x364 grid thumbnail
+    "SD": 60_000,    # 408x728
+    "HD": 220_000,   # 816x1456
+    "BL": 6_000,     # blurred placeholder, detail doesn't matter
+}
+
+MIN_QUALITY = 30
+MAX_QUALITY = 95
+
+_SUBSAMPLING_NAMES = {0: "4:4:4", 1: "4:2:2", 2: "4:2:0"}
+
+# format name used in imageList -> (Pillow format, file extension)
+IMAGE_FORMATS = {
+    "jpeg": ("JPEG", ".jpg"),
+    "webp": ("WEBP", ".webp"),
+    "avif": ("AVIF", ".avif"),
+}
+
+
+def is_format_supported(fmt: str) -> bool:
+    """AVIF needs Pillow >= 11.2 built with libavif, or the pillow-avif-plugin package."""
+    from PIL import features
+    if fmt == "avif":
+        if features.check("avif"):
+            return True
+        try:
+            import pillow_avif  # noqa: F401  registers the AVIF plugin
+            return True
+        except ImportError:
+            return False
+    if fmt == "webp":
+        return features.check("webp")
+    return fmt == "jpeg"
+
+
+def _encode(img, quality, subsampling, progressive, fmt="jpeg") -> bytes:
+    buffer = BytesIO()
+    if fmt == "webp":
+        img.save(buffer, 'WEBP', quality=quality, method=4)
+    elif fmt == "avif":
+        img.save(buffer, 'AVIF', quality=quality, speed=6)
+    else:
+        img.save(buffer, 'JPEG', quality=quality, subsampling=subsampling, progressive=progressive, optimize=True)
+    return buffer.getvalue()
+
+
+def _luma(img):
+    import numpy as np
+    return np.asarray(img.convert('L'), dtype=np.float64)
+
+
+def ssim(reference, candidate) -> float:
+    """
+    Mean SSIM over 8x8 blocks of the luma channel.
+
+    Block statistics instead of a Gaussian window keep this a handful of NumPy
+    reductions, which is accurate enough to rank JPEG qualities.
+    """
+    c1 = (0.01 * 255) ** 2
+    c2 = (0.03 * 255) ** 2
+
+    height = min(reference.shape[0], candidate.shape[0]) // 8 * 8
+    width = min(reference.shape[1], candidate.shape[1]) // 8 * 8
+    if not height or not width:
+        return 1.0
+
+    a = reference[:height, :width].reshape(height // 8, 8, width // 8, 8)
+    b = candidate[:height, :width].reshape(height // 8, 8, width // 8, 8)
+    mean_a = a.mean(axis=(1, 3))
+    mean_b = b.mean(axis=(1, 3))
+    var_a = a.var(axis=(1, 3))
+    var_b = b.var(axis=(1, 3))
+    covariance = ((a - mean_a[:, None, :, None]) * (b - mean_b[:, None, :, None])).mean(axis=(1, 3))
+
+    ssim_map = ((2 * mean_a * mean_b + c1) * (2 * covariance + c2)) / \
+               ((mean_a ** 2 + mean_b ** 2 + c1) * (var_a + var_b + c2))
+    return float(ssim_map.mean())
+
+
+def _similarity(reference_luma, data: bytes) -> float:
+    from PIL import Image
+    with Image.open(BytesIO(data)) as decoded:
+        return ssim(reference_luma, _luma(decoded))
+
+
+def _search(img, subsampling, progressive, target_bytes, min_similarity, reference_luma, fmt="jpeg"):
+    """Binary search the quality for one subsampling/progressive combination."""
+    cache = {}
+
+    def encoded(quality):
+        if quality not in cache:
+            cache[quality] = _encode(img, quality, subsampling, progressive, fmt)
+        return cache[quality]
+
+    quality = MAX_QUALITY
+
+    if target_bytes is not None:
+        # Highest quality that fits the budget (size grows with quality)
+        low, high, best = MIN_QUALITY, MAX_QUALITY, MIN_QUALITY
+        while low <= high:
+            middle = (low + high) // 2
+            if len(encoded(middle)) <= target_bytes:
+                best, low = middle, middle + 1
+            else:
+                high = middle - 1
+        quality = best
+
+    similarity = None
+    if min_similarity is not None:
+        # Lowest quality that still meets the floor; the floor wins over the budget
+        low, high, floor_quality = MIN_QUALITY, MAX_QUALITY, MAX_QUALITY
+        while low <= high:
+            middle = (low + high) // 2
+            if _similarity(reference_luma, encoded(middle)) >= min_similarity:
+                floor_quality, high = middle, middle - 1
+            else:
+                low = middle + 1
+        if target_bytes is None or floor_quality > quality:
+            quality = floor_quality
+        similarity = _similarity(reference_luma, encoded(quality))
+
+    return quality, encoded(quality), similarity
+
+
+def encode_jpeg(
+    img,
+    output_path: str,
+    target_bytes: Optional[int] = None,
+    min_similarity: Optional[float] = None,
+    subsampling_options: Sequence[int] = (2,),
+    progressive_options: Sequence[bool] = (True,)
+) -> Dict[str, object]:
+    """
+    Save `img` as JPEG with the quality searched per image.
+
+    Args:
+        img (PIL.Image.Image): Image to encode
+        output_path (str): Where to write the JPEG
+        target_bytes (int): Largest acceptable file size (highest quality under it wins)
+        min_similarity (float): SSIM floor against `img` (lowest quality above it wins)
+        subsampling_options: Chroma subsampling values to try (0=4:4:4, 1=4:2:2, 2=4:2:0)
+        progressive_options: Progressive modes to try
+
+    Returns:
+        dict: Chosen settings: quality, subsampling, progressive, bytes (and ssim if measured)
+    """
+    if img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+    reference_luma = _luma(img) if min_similarity is not None else None
+
+    best = None
+    for subsampling in subsampling_options:
+        for progressive in progressive_options:
+            quality, data, similarity = _search(img, subsampling, progressive, target_bytes, min_similarity, reference_luma)
+            # Prefer higher quality under a byte budget, otherwise fewer bytes
+            score = (quality, -len(data)) if target_bytes is not None and min_similarity is None else (-len(data), quality)
+            if best is None or score > best[0]:
+                best = (score, quality, subsampling, progressive, data, similarity)
+
+    _, quality, subsampling, progressive, data, similarity = best
+    with open(output_path, 'wb') as f:
+        f.write(data)
+
+    encoding = {
+        "quality": quality,
+        "subsampling": _SUBSAMPLING_NAMES.get(subsampling, str(subsampling)),
+        "progressive": progressive,
+        "bytes": len(data)
+    }
+    if similarity is not None:
+        encoding["ssim"] = round(similarity, 4)
+    return encoding
+
+
+def encode_variant(
+    img,
+    output_path: str,
+    fmt: str,
+    target_bytes: Optional[int] = None,
+    min_similarity: Optional[float] = None
+) -> Dict[str, object]:
+    """
+    Save `img` as WebP or AVIF with the quality searched per image.
+
+    Pass the SSIM the JPEG rendition reached as `min_similarity` to get the
+    smallest file with the same visual quality as the JPEG.
+
+    Returns:
+        dict: Chosen settings: format, quality, bytes (and ssim if measured)
+    """
+    if img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+    reference_luma = _luma(img) if min_similarity is not None else None
+
+    quality, data, similarity = _search(img, None, None, target_bytes, min_similarity, reference_luma, fmt)
+    with open(output_path, 'wb') as f:
+        f.write(data)
+
+    encoding = {"format": fmt, "quality": quality, "bytes": len(data)}
+    if similarity is not None:
+        encoding["ssim"] = round(similarity, 4)
+    return encoding
+
+
+def similarity_of_file(reference_img, encoded_path: str) -> float:
+    """SSIM between an in-memory image and an encoded file of the same size."""
+    from PIL import Image
+    with Image.open(encoded_path) as decoded:
+        return ssim(_luma(reference_img), _luma(decoded))
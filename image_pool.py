@@ -0,0 +1,133 @@
+"""
+Process pool for CPU-bound image work (resize, blur, encode, PNG->JPEG).
+
+Pillow holds the GIL for most of this work, so running it on the bot's event
+loop (or in a thread) delays Discord heartbeats and incoming messages. Jobs
+are plain module-level functions that take and return file paths, so only
+small picklable values cross the process boundary.
+
+Start the pool once at startup, before other threads exist, so the workers
+fork from a clean process. Starting doesn't wait for the workers: they import
+Pillow/NumPy in the background while the bot logs in.
+Workers never use the `spawn` start method (the macOS default), which would
+re-import the bot's main module in every worker: Linux forks directly, macOS
+(where forking after the GUI frameworks are loaded is unsafe) forks from a
+fork server that imports the main module once. Keep anything expensive in the
+main module, such as constructing the bot, under `if __name__ == "__main__"`.
+A pool that crashes is rebuilt in a thread from a fork server, since the
+process has threads by then; calls run in a thread until it is back.
+
+    start_image_pool()
+    path, resolution = await run_image_task(resize_image_sync, file, "LD", 0.25)
+
+Without a started pool, run_image_task falls back to a worker thread, which
+keeps the scripts in organizer.py working unchanged.
+"""
+
+import asyncio
+import functools
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Optional
+
+DEFAULT_WORKERS = max(1, min(4, (os.cpu_count() or 2) - 1))  # leave a core for the event loop
+
+_executor: Optional[ProcessPoolExecutor] = None
+_workers = 0
+
+
+def _mp_context(restart: bool = False):
+    """fork on Linux at startup, forkserver on macOS and for restarts; Windows only has spawn"""
+    methods = multiprocessing.get_all_start_methods()
+    if (restart or sys.platform == "darwin") and "forkserver" in methods:
+        return multiprocessing.get_context("forkserver")
+    if "fork" in methods:
+        return multiprocessing.get_context("fork")
+    return multiprocessing.get_context()
+
+
+def _warm_up():
+    """Import the heavy modules in the worker so the first real job doesn't pay for it."""
+    import numpy  # noqa: F401
+    from PIL import Image, ImageFilter  # noqa: F401
+    import image_encoder  # noqa: F401
+    import fast_blur  # noqa: F401
+    return os.getpid()
+
+
+def start_image_pool(max_workers: int = DEFAULT_WORKERS, on_ready: Optional[Callable[[], None]] = None,
+                     restart: bool = False) -> Optional[ProcessPoolExecutor]:
+    """
+    Create the worker pool and start warming every worker, without waiting for them.
+
+    Args:
+        on_ready: Called (from a pool thread) once every worker is warm
+        restart (bool): Rebuilding a crashed pool, from a process that has threads
+    """
+    global _executor, _workers
+    if _executor is not None:
+        return _executor
+
+    started_at = time.perf_counter()
+    try:
+        context = _mp_context(restart)
+        executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=context)
+        # One warm-up job per worker, submitted together, forces all of them to start now
+        warm_ups = [executor.submit(_warm_up) for _ in range(max_workers)]
+    except Exception as e:
+        print(f"Image pool unavailable, image work runs in threads: {e}")
+        return None
+
+    def warm_up_done(_):
+        if not all(future.done() for future in warm_ups):
+            return
+        failed = [future.exception() for future in warm_ups if future.exception() is not None]
+        if failed:
+            print(f"Image pool warm-up failed: {failed[0]}")
+            return
+        pids = {future.result() for future in warm_ups}
+        print(f"Image pool ready: {len(pids)} {context.get_start_method()} worker(s) "
+              f"in {time.perf_counter() - started_at:.2f}s")
+        if on_ready:
+            on_ready()
+
+    for future in warm_ups:
+        future.add_done_callback(warm_up_done)
+    _executor, _workers = executor, max_workers
+    return _executor
+
+
+def shutdown_image_pool():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+async def run_image_task(func, *args, **kwargs):
+    """
+    Run func(*args, **kwargs) in the process pool and await the result.
+
+    func must be a module-level function and its arguments/result picklable
+    (file paths, sizes, dicts). A crashed worker pool is restarted once;
+    without a pool the call runs in a thread.
+    """
+    call = functools.partial(func, *args, **kwargs)
+    executor = _executor
+    if executor is None:
+        return await asyncio.to_thread(call)
+
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(executor, call)
+    except BrokenProcessPool:
+        if _executor is executor:  # the first caller to see it broken rebuilds it
+            print(f"Image pool broken while running {getattr(func, '__name__', func)}, restarting it")
+            workers = _workers
+            shutdown_image_pool()
+            asyncio.create_task(asyncio.to_thread(start_image_pool, workers, None, True))
+        return await asyncio.to_thread(call)
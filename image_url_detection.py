@@ -1,7 +1,13 @@
-import requests
+import asyncio
+import time
+from collections import OrderedDict
 from io import BytesIO
-from PIL import Image
-from typing import Tuple, Optional
+from typing import Tuple, Optional, List
+
+SNIFF_BYTES = 16384         # bytes read to decide whether a URL is an image
+VERDICT_TTL_SECONDS = 600   # how long a per-URL verdict is trusted
+VERDICT_CACHE_SIZE = 512
+BROWSER_USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
 
 def is_image_url(url: str, timeout: int = 5) -> Tuple[bool, Optional[str]]:
     """
@@ -20,9 +26,12 @@ def is_image_url(url: str, timeout: int = 5) -> Tuple[bool, Optional[str]]:
     if not url or not isinstance(url, str):
         return False, None
 
+    import requests
+    from PIL import Image
+
     # Use a streaming request with a small chunk size to minimize data transfer
     headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+        'User-Agent': BROWSER_USER_AGENT,
         'Range': 'bytes=0-16384'  # Request only the first 16KB
     }
 
@@ -74,6 +83,207 @@ def is_image_url(url: str, timeout: int = 5) -> Tuple[bool, Optional[str]]:
         print(f"Error validating image: {e}")
         return False, None
 
+def sniff_image_type(prefix: bytes) -> Optional[str]:
+    """
+    Identify an image format from its leading bytes (magic numbers).
+
+    Args:
+        prefix (bytes): The first bytes of the file
+
+    Returns:
+        Optional[str]: The image MIME type, or None if the bytes are not a known image format
+    """
+    if prefix.startswith(b'\xff\xd8\xff'):
+        return 'image/jpeg'
+    if prefix.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'image/png'
+    if prefix.startswith((b'GIF87a', b'GIF89a')):
+        return 'image/gif'
+    if prefix[:4] == b'RIFF' and prefix[8:12] == b'WEBP':
+        return 'image/webp'
+    if prefix.startswith(b'BM'):
+        return 'image/bmp'
+    if prefix[4:8] == b'ftyp':
+        brand = prefix[8:12]
+        if brand in (b'avif', b'avis'):
+            return 'image/avif'
+        if brand in (b'heic', b'heix', b'mif1', b'msf1'):
+            return 'image/heic'
+    return None
+
+
+class _VerdictCache:
+    """Small LRU of (is_image, content_type) verdicts per URL, each valid for `ttl` seconds."""
+
+    def __init__(self, max_size: int = VERDICT_CACHE_SIZE, ttl: float = VERDICT_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items = OrderedDict()
+
+    def get(self, url):
+        entry = self._items.get(url)
+        if entry is None:
+            return None
+        verdict, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._items[url]
+            return None
+        self._items.move_to_end(url)
+        return verdict
+
+    def put(self, url, verdict):
+        self._items[url] = (verdict, time.monotonic() + self.ttl)
+        self._items.move_to_end(url)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+
+_verdict_cache = _VerdictCache()
+
+
+class ImageProbe:
+    """
+    Result of probe_image_url().
+
+    When the URL is an image and the probe was made with keep_open=True, the
+    HTTP response is still open: `prefix` holds the bytes already read and the
+    rest of the body can be streamed by the downloader (see utility.download_image),
+    so the image is fetched exactly once. Use `async with probe:` or call close().
+    """
+
+    def __init__(self, url, is_image=False, content_type=None, prefix=b"", response=None, session=None, owns_session=False):
+        self.url = url
+        self.is_image = is_image
+        self.content_type = content_type
+        self.prefix = prefix
+        self.response = response
+        self.session = session
+        self.owns_session = owns_session
+
+    async def iter_body(self, chunk_size: int = 65536):
+        """Yield the whole body: the buffered prefix first, then the rest of the open response."""
+        if self.prefix:
+            yield self.prefix
+        if self.response is not None:
+            async for chunk in self.response.content.iter_chunked(chunk_size):
+                yield chunk
+
+    async def close(self):
+        if self.response is not None:
+            self.response.release()
+            self.response = None
+        if self.owns_session and self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+
+async def probe_image_url(url: str, session=None, keep_open: bool = True, timeout: int = 10) -> ImageProbe:
+    """
+    Async replacement for is_image_url(): sniffs magic bytes and headers without
+    blocking the event loop, and caches the verdict per URL.
+
+    Args:
+        url (str): URL to check
+        session (aiohttp.ClientSession): Optional shared session (the probe creates one otherwise)
+        keep_open (bool): Keep the response open for a valid image so the caller can download
+                          the rest of the body instead of fetching the URL again
+        timeout (int): Request timeout in seconds
+
+    Returns:
+        ImageProbe: The verdict, plus the open response and buffered prefix if kept open
+    """
+    import aiohttp
+
+    if not url or not isinstance(url, str) or not url.startswith(('http://', 'https://')):
+        return ImageProbe(url)
+
+    cached = _verdict_cache.get(url)
+    if cached is not None and (not cached[0] or not keep_open):
+        # Known non-image, or a known image that the caller doesn't want to download
+        return ImageProbe(url, is_image=cached[0], content_type=cached[1])
+
+    headers = {'User-Agent': BROWSER_USER_AGENT}
+    if not keep_open:
+        headers['Range'] = f'bytes=0-{SNIFF_BYTES}'  # Request only the first 16KB
+
+    owns_session = session is None
+    if owns_session:
+        session = aiohttp.ClientSession()
+
+    probe = ImageProbe(url, session=session, owns_session=owns_session)
+    try:
+        response = await session.get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=None, sock_connect=timeout, sock_read=timeout))
+        probe.response = response
+        probe.content_type = response.headers.get('Content-Type', '')
+
+        if response.status not in (200, 206):
+            _verdict_cache.put(url, (False, probe.content_type))
+            await probe.close()
+            return probe
+
+        # Read up to SNIFF_BYTES (the body may arrive in several chunks)
+        buffer = BytesIO()
+        while buffer.tell() < SNIFF_BYTES:
+            data = await response.content.read(SNIFF_BYTES - buffer.tell())
+            if not data:
+                break
+            buffer.write(data)
+        probe.prefix = buffer.getvalue()
+
+        sniffed_type = sniff_image_type(probe.prefix)
+        probe.is_image = sniffed_type is not None
+        if probe.is_image and not probe.content_type.startswith('image/'):
+            # Some CDNs answer application/octet-stream for images
+            probe.content_type = sniffed_type
+        _verdict_cache.put(url, (probe.is_image, probe.content_type))
+
+        if not (probe.is_image and keep_open):
+            await probe.close()
+        return probe
+
+    except Exception as e:
+        print(f"Error validating image: {e}")
+        await probe.close()
+        probe.is_image = False
+        return probe
+
+
+async def is_image_url_async(url: str, session=None, timeout: int = 10) -> Tuple[bool, Optional[str]]:
+    """Non-blocking equivalent of is_image_url(), returns (is_image, content_type)."""
+    probe = await probe_image_url(url, session=session, keep_open=False, timeout=timeout)
+    return probe.is_image, probe.content_type
+
+
+async def validate_image_urls(urls: List[str], concurrency: int = 8, timeout: int = 10) -> List[Tuple[str, bool, Optional[str]]]:
+    """
+    Validate many URLs concurrently over one shared session.
+
+    Args:
+        urls (List[str]): URLs to check
+        concurrency (int): Maximum number of probes in flight
+
+    Returns:
+        List[Tuple[str, bool, Optional[str]]]: (url, is_image, content_type) in input order
+    """
+    import aiohttp
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with aiohttp.ClientSession() as session:
+        async def check(url):
+            async with semaphore:
+                is_image, content_type = await is_image_url_async(url, session=session, timeout=timeout)
+                return url, is_image, content_type
+
+        return await asyncio.gather(*(check(url) for url in urls))
+
+
 # Example usage
 if __name__ == "__main__":
     # Test URLs - including both real images and non-images
@@ -0,0 +1,107 @@
+"""
+Source-size variants for waiting-list images.
+
+Pexels serves every photo in several sizes (original, large2x, large, medium,
+portrait, ...). Ingestion records all of them with their dimensions, and each
+consumer asks for the smallest variant that is big enough for its purpose
+instead of moving the 20-40 MP original around.
+"""
+
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+# Smallest source each consumer needs (pixels on the short side)
+DESCRIBE_MIN_SIZE = 512       # GPT description: vision models downscale to ~768 px anyway
+REFERENCE_MIN_SIZE = 1200     # Image posted to #upload / used as the Midjourney reference
+
+
+def _fit_within(width, height, box_width, box_height, dpr=1):
+    """Size of a width x height image scaled down to fit a box (never upscaled)."""
+    if not width or not height:
+        return box_width * dpr, box_height * dpr
+    scale = min(1.0, box_width * dpr / width, box_height * dpr / height)
+    return int(width * scale), int(height * scale)
+
+
+def _variant_size(url, width, height):
+    """Dimensions Pexels renders for a src URL, from its w/h/dpr/fit query params."""
+    params = dict(parse_qsl(urlsplit(url).query))
+    if "w" not in params and "h" not in params:
+        return width, height
+    dpr = int(params.get("dpr", 1))
+    box_width = int(params.get("w", 0)) or width
+    box_height = int(params.get("h", 0)) or height
+    if params.get("fit") == "crop":
+        return box_width * dpr, box_height * dpr
+    return _fit_within(width, height, box_width, box_height, dpr)
+
+
+def pexels_variants(photo: dict) -> List[Dict[str, object]]:
+    """
+    All size variants of a Pexels search result, smallest first.
+
+    Args:
+        photo (dict): One entry of the Pexels `photos` list
+
+    Returns:
+        list: Dicts with name, url, width, height
+    """
+    width = photo.get('width', 0)
+    height = photo.get('height', 0)
+    variants = []
+    for name, url in photo.get('src', {}).items():
+        if not url:
+            continue
+        variant_width, variant_height = _variant_size(url, width, height)
+        variants.append({"name": name, "url": url, "width": variant_width, "height": variant_height})
+    return sorted(variants, key=lambda variant: variant["width"] * variant["height"])
+
+
+def select_variant(variants: List[Dict[str, object]], min_size: int, keep_aspect: bool = True) -> Optional[Dict[str, object]]:
+    """
+    Pick the smallest variant whose short side is at least `min_size`.
+
+    Cropped variants (portrait, landscape, tiny) are skipped when keep_aspect
+    is set, because they change the composition. Falls back to the largest
+    variant when none is big enough.
+    """
+    candidates = variants
+    if keep_aspect:
+        candidates = [variant for variant in variants if "fit=crop" not in str(variant["url"])] or variants
+    if not candidates:
+        return None
+    candidates = sorted(candidates, key=lambda variant: variant["width"] * variant["height"])
+    for variant in candidates:
+        if min(variant["width"], variant["height"]) >= min_size:
+            return variant
+    return candidates[-1]
+
+
+def sized_url(url: str, min_size: int) -> str:
+    """
+    Ask the image CDN for a smaller rendition of `url` when it supports it.
+
+    images.pexels.com resizes on the fly from query params, so any Pexels URL
+    (including the stored original) can be turned into a variant whose short
+    side is about `min_size`. Other URLs are returned unchanged.
+    """
+    parts = urlsplit(url)
+    if parts.hostname != "images.pexels.com":
+        return url
+
+    # Pexels photos in the waiting list are portrait, so width is the short side
+    params = {key: value for key, value in parse_qsl(parts.query) if key not in ("w", "h", "dpr", "fit", "crop")}
+    params.update({"auto": "compress", "cs": "tinysrgb", "w": str(min_size)})
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(params), ""))
+
+
+def url_for(url: str, variants: Optional[List[Dict[str, object]]], min_size: int) -> str:
+    """
+    Smallest recorded variant for `min_size`. When only the original is big
+    enough (or nothing was recorded), ask the CDN for a sized rendition instead.
+    """
+    if variants:
+        variant = select_variant(variants, min_size)
+        if variant and variant["name"] != "original" and min(variant["width"], variant["height"]) >= min_size:
+            return str(variant["url"])
+    return sized_url(url, min_size)
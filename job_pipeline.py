@@ -0,0 +1,236 @@
+"""
+Dependency-graph executor for the stages of one Midjourney job.
+
+Each stage is an async function that starts as soon as all of its
+dependencies have finished and receives their results. Independent stages
+run concurrently, so the upscale click no longer waits for the renditions,
+and publish waits only for what it really needs.
+
+Some inputs come from outside the graph (the "- Upscaled" message arrives
+later as a separate Discord event); those are declared as external stages
+and fulfilled with set_result().
+
+A stage can carry a deadline: overdue() lists stages that have been waiting
+on their own work (not on dependencies) for longer, so a watchdog can
+restart() them or give up on the job.
+
+    graph = StageGraph("job-1")
+    graph.add("download", download)
+    graph.add("renditions", make_renditions, deps=["download"])
+    graph.external("upscaled")
+    graph.add("publish", publish, deps=["renditions", "upscaled"])
+    graph.start()
+    ...
+    graph.set_result("upscaled", (url, blob))
+    item_id = await graph.result("publish")
+"""
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+
+class StageFailed(Exception):
+    """A stage (or one of its dependencies) raised; the original error is chained"""
+
+
+class Stage:
+    def __init__(self, name: str, func: Optional[Callable[..., Awaitable[Any]]], deps: Iterable[str],
+                 deadline: Optional[float] = None):
+        self.name = name
+        self.func = func  # None for external stages
+        self.deps = list(deps)
+        self.deadline = deadline  # seconds per attempt, None = no limit
+        self.attempts = 0  # restarts so far
+        self.future: Optional[asyncio.Future] = None
+        self.task: Optional[asyncio.Task] = None
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+
+class StageGraph:
+    def __init__(self, name: str = "job", on_stage_done: Optional[Callable[[str, Any], None]] = None):
+        """
+        Args:
+            name (str): Label used in log lines
+            on_stage_done: Called with (stage name, result) after each stage succeeds
+        """
+        self.name = name
+        self.stages: Dict[str, Stage] = {}
+        self.on_stage_done = on_stage_done
+        self.started = False
+        self.started_at: Optional[float] = None
+
+    def add(self, name: str, func: Callable[..., Awaitable[Any]], deps: Iterable[str] = (),
+            deadline: Optional[float] = None):
+        """Add a stage; func is awaited with the dependency results as keyword arguments."""
+        if name in self.stages:
+            raise ValueError(f"Stage {name} already exists")
+        self.stages[name] = Stage(name, func, deps, deadline)
+        return self
+
+    def external(self, name: str, after: Iterable[str] = (), deadline: Optional[float] = None):
+        """
+        Add a stage whose result is supplied later with set_result().
+
+        Args:
+            after: Stages that trigger the external event; its deadline counts from when they finish
+        """
+        return self.add(name, None, after, deadline)
+
+    def _check(self):
+        for stage in self.stages.values():
+            for dep in stage.deps:
+                if dep not in self.stages:
+                    raise ValueError(f"Stage {stage.name} depends on unknown stage {dep}")
+        # Reject cycles (depth-first search)
+        visiting, done = set(), set()
+
+        def visit(name):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Dependency cycle through stage {name}")
+            visiting.add(name)
+            for dep in self.stages[name].deps:
+                visit(dep)
+            visiting.discard(name)
+            done.add(name)
+
+        for name in self.stages:
+            visit(name)
+
+    def start(self, completed: Optional[Dict[str, Any]] = None):
+        """
+        Validate the graph and start every stage task (each waits for its own dependencies).
+
+        Args:
+            completed (dict): Results of stages that already finished in an earlier run
+                              (job_store.py); they are not run again
+        """
+        self._check()
+        completed = completed or {}
+        loop = asyncio.get_running_loop()
+        self.started_at = time.monotonic()
+        for stage in self.stages.values():
+            stage.future = loop.create_future()
+            # Failures are reported through result(); don't warn about unretrieved exceptions
+            stage.future.add_done_callback(lambda future: future.cancelled() or future.exception())
+            if stage.name in completed:
+                stage.finished_at = self.started_at
+                stage.future.set_result(completed[stage.name])
+        for stage in self.stages.values():
+            if stage.func is not None and stage.name not in completed:
+                stage.task = asyncio.create_task(self._run(stage))
+        self.started = True
+        return self
+
+    async def _run(self, stage: Stage):
+        try:
+            inputs = {dep: await self.stages[dep].future for dep in stage.deps}
+        except Exception as e:
+            self._finish(stage, error=StageFailed(f"{stage.name}: dependency failed"), cause=e)
+            return
+
+        stage.started_at = time.monotonic()
+        try:
+            result = await stage.func(**inputs)
+        except asyncio.CancelledError:
+            # A restart() replaced this task; only the current attempt owns the future
+            if stage.task is asyncio.current_task() and not stage.future.done():
+                stage.future.cancel()
+            raise
+        except Exception as e:
+            print(f"[{self.name}] stage {stage.name} failed: {e}")
+            self._finish(stage, error=StageFailed(f"{stage.name}: {e}"), cause=e)
+            return
+        self._finish(stage, result=result)
+
+    def _finish(self, stage: Stage, result: Any = None, error: Optional[Exception] = None, cause: Optional[Exception] = None):
+        if stage.future.done():
+            return
+        stage.finished_at = time.monotonic()
+        if error is not None:
+            error.__cause__ = cause
+            stage.future.set_exception(error)
+            return
+        stage.future.set_result(result)
+        if stage.started_at is not None:
+            print(f"[{self.name}] stage {stage.name} done in {stage.finished_at - stage.started_at:.2f}s")
+        if self.on_stage_done:
+            try:
+                self.on_stage_done(stage.name, result)
+            except Exception as e:
+                print(f"[{self.name}] on_stage_done({stage.name}) error: {e}")
+
+    def set_result(self, name: str, result: Any):
+        """Fulfil an external stage."""
+        self._finish(self.stages[name], result=result)
+
+    def set_failed(self, name: str, error: Exception):
+        """Fail an external stage; everything that depends on it fails too."""
+        self._finish(self.stages[name], error=StageFailed(f"{name}: {error}"), cause=error)
+
+    async def result(self, name: str) -> Any:
+        """Await a stage's result; raises StageFailed if it or a dependency failed."""
+        return await asyncio.shield(self.stages[name].future)
+
+    def _clock_start(self, stage: Stage) -> Optional[float]:
+        """When the stage's current attempt started waiting on its own work."""
+        if stage.func is not None:
+            return stage.started_at
+        if stage.started_at is not None:  # restarted external stage
+            return stage.started_at
+        dep_times = [self.stages[dep].finished_at for dep in stage.deps]
+        if any(finished_at is None for finished_at in dep_times):
+            return None
+        return max(dep_times, default=self.started_at)
+
+    def overdue(self, now: Optional[float] = None) -> List[str]:
+        """Unfinished stages whose current attempt has run past its deadline."""
+        now = now if now is not None else time.monotonic()
+        names = []
+        for stage in self.stages.values():
+            if stage.deadline is None or stage.future is None or stage.future.done():
+                continue
+            clock_start = self._clock_start(stage)
+            if clock_start is not None and now - clock_start > stage.deadline:
+                names.append(stage.name)
+        return names
+
+    def restart(self, name: str):
+        """
+        Start a new attempt of a stage: a function stage is cancelled and run again,
+        an external stage only gets a fresh deadline (the caller re-triggers the event).
+        """
+        stage = self.stages[name]
+        if stage.future.done():
+            return
+        stage.attempts += 1
+        print(f"[{self.name}] restarting stage {name} (attempt {stage.attempts + 1})")
+        if stage.func is None:
+            stage.started_at = time.monotonic()
+            return
+        old_task = stage.task
+        stage.started_at = None
+        stage.task = asyncio.create_task(self._run(stage))
+        if old_task and not old_task.done():
+            old_task.cancel()
+
+    def is_done(self, name: str) -> bool:
+        future = self.stages[name].future
+        return future is not None and future.done() and not future.cancelled() and future.exception() is None
+
+    def pending(self) -> List[str]:
+        return [name for name, stage in self.stages.items() if stage.future is None or not stage.future.done()]
+
+    def cancel(self, reason: str = "job cancelled"):
+        """
+        Cancel all running stages (e.g. when the job is abandoned); anything
+        still waiting on result() gets StageFailed.
+        """
+        for stage in self.stages.values():
+            if stage.future and not stage.future.done():
+                stage.future.set_exception(StageFailed(f"{stage.name}: {reason}"))
+            if stage.task and not stage.task.done():
+                stage.task.cancel()
@@ -0,0 +1,130 @@
+"""
+Durable state for Midjourney jobs (SQLite).
+
+A job is created when its waiting item is claimed (stage "claim": waiting id
+and prompt), so an item claimed just before a crash is never left assigned.
+Every stage transition of the job graph (job_pipeline.StageGraph) is written
+in its own transaction, together with the ids needed to find the job's
+Discord messages again. After a crash or restart the bot loads the last
+unfinished job and continues from its last completed stage instead of
+wasting the render, the uploaded renditions and the upscale.
+
+    store = get_job_store()
+    job_id = store.create_job(waiting_id)
+    store.record_stage(job_id, "claim", {"waiting_id": waiting_id, "prompt": prompt})
+    store.attach_message(job_id, channel_id, message_id, attach_url)
+    store.record_stage(job_id, "renditions", {...})
+    store.finish_job(job_id, "done")
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, Optional
+
+JOB_DB_FILE = os.path.join("data", "jobs.sqlite3")
+
+# Job status values
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+ABANDONED = "abandoned"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    waiting_id TEXT,
+    status TEXT NOT NULL,
+    channel_id INTEGER,
+    message_id INTEGER,
+    attach_url TEXT,
+    data TEXT NOT NULL DEFAULT '{}',
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS stages (
+    job_id TEXT NOT NULL REFERENCES jobs(job_id),
+    stage TEXT NOT NULL,
+    result TEXT,
+    finished_at REAL NOT NULL,
+    PRIMARY KEY (job_id, stage)
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, updated_at);
+"""
+
+
+class JobStore:
+    def __init__(self, path: str = JOB_DB_FILE):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        # WAL + synchronous=NORMAL: each commit survives a process crash without an fsync per write
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.conn:
+            self.conn.executescript(_SCHEMA)
+
+    def create_job(self, waiting_id: str, channel_id: Optional[int] = None, message_id: Optional[int] = None,
+                   attach_url: str = "", data: Optional[dict] = None) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO jobs (job_id, waiting_id, status, channel_id, message_id, attach_url, data, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, waiting_id, RUNNING, channel_id, message_id, attach_url, json.dumps(data or {}), now, now))
+        return job_id
+
+    def record_stage(self, job_id: str, stage: str, result: Any = None):
+        """Store a finished stage and its (JSON-serialisable) result in one transaction."""
+        now = time.time()
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO stages (job_id, stage, result, finished_at) VALUES (?, ?, ?, ?)",
+                (job_id, stage, json.dumps(result), now))
+            self.conn.execute("UPDATE jobs SET updated_at = ? WHERE job_id = ?", (now, job_id))
+
+    def attach_message(self, job_id: str, channel_id: int, message_id: int, attach_url: str):
+        """Link a claimed job to its Midjourney "- Image #" message."""
+        with self._lock, self.conn:
+            self.conn.execute(
+                "UPDATE jobs SET channel_id = ?, message_id = ?, attach_url = ?, updated_at = ? WHERE job_id = ?",
+                (channel_id, message_id, attach_url, time.time(), job_id))
+
+    def finish_job(self, job_id: str, status: str = DONE):
+        with self._lock, self.conn:
+            self.conn.execute("UPDATE jobs SET status = ?, updated_at = ? WHERE job_id = ?", (status, time.time(), job_id))
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self.conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            stages = self.conn.execute("SELECT stage, result FROM stages WHERE job_id = ?", (job_id,)).fetchall()
+        job = dict(row)
+        job["data"] = json.loads(job["data"])
+        job["stages"] = {stage["stage"]: json.loads(stage["result"]) for stage in stages}
+        return job
+
+    def active_job(self) -> Optional[Dict[str, Any]]:
+        """The most recently updated unfinished job, with its completed stages."""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT job_id FROM jobs WHERE status = ? ORDER BY updated_at DESC LIMIT 1", (RUNNING,)).fetchone()
+        return self.get_job(row["job_id"]) if row else None
+
+
+_job_store = None
+
+
+def get_job_store() -> JobStore:
+    """Open the database on first use"""
+    global _job_store
+    if _job_store is None:
+        _job_store = JobStore()
+    return _job_store
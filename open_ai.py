@@ -1,10 +1,13 @@
 import os
 from dotenv import load_dotenv
-from openai import OpenAI
 import base64
 import json
 from typing import Tuple, Dict
 
+# Images are downscaled to this long side before upload: the vision model
+# resizes larger inputs itself, so extra pixels only cost upload time.
+MAX_IMAGE_SIDE = 1024
+
 class ImageAnalyzer:
     def __init__(self):
         # Load environment variables from .env file
@@ -13,20 +16,34 @@ class ImageAnalyzer:
         if not api_key:
             raise ValueError("OpenAI API key not found in environment variables")
 
-        # Initialize the OpenAI client
+        # Initialize the OpenAI client (imported here, the SDK is slow to import)
+        from openai import OpenAI
         self.client = OpenAI(api_key=api_key)
 
-    def _encode_image(self, image_path: str) -> str:
+    def _encode_image(self, image_path: str, max_side: int = MAX_IMAGE_SIDE) -> str:
         """
-        Encode image to base64 string
+        Encode image to base64 string, downscaled to at most max_side pixels
 
         Args:
             image_path (str): Path to the image file
+            max_side (int): Longest side sent to the API (0 keeps the original file)
 
         Returns:
-            str: Base64 encoded image string
+            str: Base64 encoded JPEG image string
         """
         try:
+            if max_side:
+                from io import BytesIO
+                from PIL import Image
+                with Image.open(image_path) as img:
+                    if max(img.size) > max_side:
+                        img.draft('RGB', (max_side, max_side))
+                        img = img.convert('RGB')
+                        img.thumbnail((max_side, max_side), Image.LANCZOS)
+                        buffer = BytesIO()
+                        img.save(buffer, 'JPEG', quality=90)
+                        return base64.b64encode(buffer.getvalue()).decode('utf-8')
+
             with open(image_path, 'rb') as image_file:
                 return base64.b64encode(image_file.read()).decode('utf-8')
         except Exception as e:
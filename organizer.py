@@ -2,7 +2,8 @@ import asyncio
 import time
 import json
 import os
-from api.wallpaper_api import WallpaperAPI, ImageItem, DownloadItem
+from blob_names import local_filename
+from api.wallpaper_api import WallpaperAPI, ImageItem, DownloadItem, BULK_BATCH_SIZE
 from utility import type_imagine, download_and_convert_image, upload_to_firebase_3, initialize_firebase, safe_delete, click_somewhere, is_macos, resize_image, download_image, resize_all_and_upload_to_firebase, blur_image, resize_one_blur_and_upload_to_firebase
 
 api_client = WallpaperAPI()
@@ -13,7 +14,7 @@ async def downsize_all_images(item_id, thumbnail):
     # Download the thumbnail image
     target_local_file = await download_image(thumbnail)
 
-    imageList_Result = resize_all_and_upload_to_firebase(target_local_file)
+    imageList_Result, _ = await resize_all_and_upload_to_firebase(target_local_file)
 
     return imageList_Result
 
@@ -57,6 +58,45 @@ async def downsize_all_images(item_id, thumbnail):
 
 
 
+def flush_field_updates(pending_updates):
+    """
+    Send queued (item_id, field, data) updates as bulk requests.
+
+    Returns:
+        bool: True if every update succeeded
+    """
+    if not pending_updates:
+        return True
+
+    response = api_client.patch_data_by_field_bulk(pending_updates)
+    for index in response["failed"]:
+        item_id = pending_updates[index][0]
+        print(f"API call failed for item {item_id}: {response['results'][index]['message']}")
+    print(f"Bulk update: {response['message']}")
+
+    pending_updates.clear()
+    return response["success"]
+
+def flush_image_list_items(pending_items):
+    """
+    Send queued (item_id, image dict) imageList additions as bulk requests.
+
+    Returns:
+        bool: True if every addition succeeded
+    """
+    if not pending_items:
+        return True
+
+    response = api_client.add_image_list_items_bulk(pending_items)
+    for index in response.get("failed", []):
+        item_id = pending_items[index][0]
+        message = response["results"][index]["message"] if response["results"] else response["message"]
+        print(f"Failed to add image for item {item_id}: {message}")
+    print(f"Bulk imageList add: {response['message']}")
+
+    pending_items.clear()
+    return response["success"]
+
 async def main():
     try:
         initialize_firebase()
@@ -69,6 +109,7 @@ async def main():
     #print(result)
     total_items = 0
     test_index = 0
+    pending_updates = []  # (item_id, "imageList", data), sent BULK_BATCH_SIZE per request
     # Extract data from the result
     try:
         # Clean the message string and parse JSON
@@ -111,20 +152,17 @@ async def main():
 
                 #print(updated_data)
 
-                # Call the API and check the response
-                response = api_client.patch_data_by_field(item_id, "imageList", updated_data)
-
-                # Check if the API call was successful
-                if not response.get('success', False):
-                    print(f"API call failed: {response.get('message', 'Unknown error')}")
+                # Queue the update, the API is called once per batch
+                pending_updates.append((item_id, "imageList", updated_data))
+                if len(pending_updates) >= BULK_BATCH_SIZE and not flush_field_updates(pending_updates):
                     break  # Break the loop if the API call failed
-                else:
-                    print(f"Successfully updated imageList for item {item_id}")
 
             else:
                 print(f"Error first_image_name or item_id {item_id}")
                 break
 
+        flush_field_updates(pending_updates)
+
     except json.JSONDecodeError as e:
         print(f"Error parsing JSON: {e}")
     except Exception as e:
@@ -147,6 +185,7 @@ async def add_blur_to_all_wallpapers():
 
     result = api_client.get_wallpapers()
     test_index = 0
+    pending_items = []  # (item_id, BL image dict), sent BULK_BATCH_SIZE per request
 
     try:
         message_str = result.get('message', '').strip()
@@ -168,20 +207,78 @@ async def add_blur_to_all_wallpapers():
             # This should return a dict with type, resolution, link, blob
             updated_data = await resize_one_blur_and_upload_to_firebase(target_local_file)
 
-            # Add the BL image to existing imageList
-            response = api_client.add_one_image_list_item(item_id, "imageList", updated_data)
-
-            if not response.get('success', False):
-                print(f"Failed to add blur image for item {item_id}")
-                print(f"API call failed: {response.get('message', 'Unknown error')}")
+            # Queue the BL image for the existing imageList, the API is called once per batch
+            pending_items.append((item_id, updated_data))
+            print(f"✓ Blur image ready for item {item_id} ({test_index}/{len(wallpapers)})")
+            if len(pending_items) >= BULK_BATCH_SIZE and not flush_image_list_items(pending_items):
                 break
-            else:
-                print(f"✓ Successfully added blur image to item {item_id} ({test_index}/{len(wallpapers)})")
 
             # if test_index >= 2:
             #     print(f" ===== TEST break =====")
             #     break
 
+        flush_image_list_items(pending_items)
+
+    except json.JSONDecodeError as e:
+        print(f"Error parsing JSON: {e}")
+    except Exception as e:
+        print(f"Error processing data: {e}")
+
+async def add_placeholder_to_all_wallpapers():
+    """
+    Compute the inline placeholder (BlurHash + tiny thumbnail) for every item from
+    its existing LD image and store it in the item's "placeholder" field.
+    Items that already have one are skipped, so the job can be re-run.
+    """
+    from placeholder import make_placeholder
+
+    result = api_client.get_wallpapers()
+    test_index = 0
+    pending_updates = []  # (item_id, "placeholder", data), sent BULK_BATCH_SIZE per request
+
+    try:
+        message_str = result.get('message', '').strip()
+        wallpapers = json.loads(message_str)
+
+        if isinstance(wallpapers, list):
+            print(f"Total: {len(wallpapers)}")
+
+        print("\n=== ADDING PLACEHOLDERS ===")
+        for item in wallpapers:
+            test_index += 1
+            item_id = item.get('itemId', '0')
+
+            if item.get('placeholder'):
+                print(f"({test_index}/{len(wallpapers)}) Placeholder already set: {item_id}")
+                continue
+
+            # The LD rendition is already small, fall back to the thumbnail for old items
+            source_url = next((img.get('link') for img in item.get('imageList', [])
+                               if img.get('type') == "LD" and img.get('format', "jpeg") == "jpeg" and img.get('link')),
+                              item.get('thumbnail'))
+            if not source_url:
+                print(f"({test_index}/{len(wallpapers)}) ✗ No LD image or thumbnail for item {item_id}")
+                continue
+
+            local_file = await download_image(source_url)
+            if not local_file:
+                print(f"({test_index}/{len(wallpapers)}) ✗ Download failed for item {item_id}")
+                continue
+            try:
+                placeholder = make_placeholder(local_file)
+            except Exception as e:
+                print(f"({test_index}/{len(wallpapers)}) ✗ Error creating placeholder for {item_id}: {e}")
+                continue
+            finally:
+                safe_delete(local_file)
+
+            pending_updates.append((item_id, "placeholder", placeholder))
+            print(f"✓ Placeholder ready for item {item_id} ({test_index}/{len(wallpapers)}): {placeholder['blurhash']}")
+            if len(pending_updates) >= BULK_BATCH_SIZE and not flush_field_updates(pending_updates):
+                break
+
+        flush_field_updates(pending_updates)
+
     except json.JSONDecodeError as e:
         print(f"Error parsing JSON: {e}")
     except Exception as e:
@@ -271,8 +368,9 @@ async def download_all_images_by_type(type="BL", file_name_prefix="images_"):
             try:
                 # Extract original filename from blob path
                 if blob_path:
-                    # Example blob: "images/BL/20250228_145732_BL_xxx.jpg"
-                    original_filename = os.path.basename(blob_path)
+                    # Example blobs: "images/BL/20250228_145732_BL_xxx.jpg", "images/BL/3fa2_20250228_145732_BL_xxx.jpg"
+                    # Hash-prefixed names map back to the timestamp-first name, so files keep sorting by time
+                    original_filename = local_filename(blob_path)
                 else:
                     # Fallback: try to extract from URL
                     from urllib.parse import urlparse, unquote
@@ -282,7 +380,7 @@ async def download_all_images_by_type(type="BL", file_name_prefix="images_"):
                     if '/o/' in path:
                         filename_with_path = path.split('/o/')[-1].split('?')[0]
                         filename_with_path = unquote(filename_with_path)
-                        original_filename = os.path.basename(filename_with_path)
+                        original_filename = local_filename(filename_with_path)
                     else:
                         # Last resort: use itemId with type
                         file_extension = '.jpg'
@@ -340,6 +438,7 @@ if __name__ == "__main__":
     # asyncio.run(main())                       # Transfer old data and update all imageList
     # asyncio.run(test_area())                  # test generate blur image
     # asyncio.run(add_blur_to_all_wallpapers())   # Generate all blur to database
+    # asyncio.run(add_placeholder_to_all_wallpapers())  # Store BlurHash + tiny thumbnail on every item
 
     # Download BL (blur) images - default settings
     asyncio.run(download_all_images_by_type(type="BL", file_name_prefix="images_"))
\ No newline at end of file
@@ -0,0 +1,236 @@
+"""
+Concurrent Pexels harvester for the waiting list.
+
+Fetches many queries and pages at once under a token bucket (the hourly rate,
+paused when the rate-limit headers say the quota is used up), streams portrait photos into the waiting list (one
+bulk request per page) and remembers the last finished page per query, so
+re-runs continue where they stopped.
+
+    python3 pexels_harvester.py nature space "minimalistic wallpaper" --pages 10
+    python3 pexels_harvester.py nature --pages 50 --concurrency 6
+"""
+
+import asyncio
+import json
+import os
+import time
+from typing import Dict, List, Optional
+
+from pexels_resource import add_many
+from image_variants import pexels_variants
+
+PEXELS_SEARCH_URL = "https://api.pexels.com/v1/search"
+PER_PAGE = 80  # max 80
+CHECKPOINT_FILE = os.path.join("data", "pexels_checkpoint.json")
+
+# Pexels default quota: 200 requests per hour
+DEFAULT_RATE_PER_HOUR = 200
+DEFAULT_BURST = 10
+
+
+class TokenBucket:
+    """
+    Async token bucket at the configured hourly rate, checked against rate-limit headers.
+
+    X-Ratelimit-Remaining / X-Ratelimit-Reset describe the monthly quota, so
+    they don't set the rate: they only cap the tokens at what is left, and
+    when nothing is left the bucket blocks until the reset time.
+    """
+
+    def __init__(self, rate_per_hour: float = DEFAULT_RATE_PER_HOUR, burst: int = DEFAULT_BURST):
+        self.rate = rate_per_hour / 3600.0
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def update_from_headers(self, headers):
+        """Sync with X-Ratelimit-Limit / -Remaining / -Reset (epoch seconds)."""
+        try:
+            remaining = int(headers.get("X-Ratelimit-Remaining", ""))
+            reset_at = int(headers.get("X-Ratelimit-Reset", ""))
+        except ValueError:
+            return
+
+        seconds_to_reset = max(0.0, reset_at - time.time())
+        if remaining <= 0:
+            self.tokens = 0
+            self.blocked_until = time.monotonic() + seconds_to_reset
+            print(f"Pexels quota exhausted, pausing {seconds_to_reset:.0f}s until reset")
+            return
+
+        # Quota left: a block from earlier headers is over
+        self.blocked_until = 0.0
+        self.tokens = min(self.tokens, float(remaining))
+
+
+def load_checkpoint(path: str = CHECKPOINT_FILE) -> Dict[str, dict]:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_checkpoint(checkpoint: Dict[str, dict], path: str = CHECKPOINT_FILE):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = path + ".tmp"
+    with open(temp_path, "w") as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(temp_path, path)
+
+
+def portrait_photos(photos: List[dict]) -> Dict[str, list]:
+    """Same filter as printImageUrl: portrait photos only, original URL -> all size variants."""
+    variants_by_url = {}
+    for photo in photos:
+        if photo.get('height', 0) > photo.get('width', 0):
+            original_url = photo.get('src', {}).get('original')
+            if original_url:
+                variants_by_url[original_url] = pexels_variants(photo)
+    return variants_by_url
+
+
+class PexelsHarvester:
+    def __init__(self, api_key: str, concurrency: int = 4, bucket: Optional[TokenBucket] = None,
+                 checkpoint_path: str = CHECKPOINT_FILE):
+        self.api_key = api_key
+        self.concurrency = concurrency
+        self.bucket = bucket or TokenBucket()
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint = load_checkpoint(checkpoint_path)
+        self.added_count = 0
+        self.skipped_count = 0
+        self._finished_pages: Dict[str, set] = {}
+
+    def _query_state(self, query):
+        return self.checkpoint.setdefault(query, {"last_page": 0, "exhausted": False})
+
+    def _mark_page_done(self, query, page):
+        # Pages finish out of order; only advance the checkpoint over a contiguous run
+        state = self._query_state(query)
+        finished = self._finished_pages.setdefault(query, set())
+        finished.add(page)
+        while state["last_page"] + 1 in finished:
+            state["last_page"] += 1
+            finished.discard(state["last_page"])
+        save_checkpoint(self.checkpoint, self.checkpoint_path)
+
+    async def _fetch_page(self, session, query, page):
+        await self.bucket.acquire()
+        params = {"query": query, "per_page": PER_PAGE, "page": page}
+        async with session.get(PEXELS_SEARCH_URL, params=params, headers={"Authorization": self.api_key}) as response:
+            self.bucket.update_from_headers(response.headers)
+            if response.status == 429:
+                return None
+            if response.status != 200:
+                # Don't treat as an empty page: the page stays unfinished and is retried next run
+                raise RuntimeError(f"HTTP {response.status}")
+            return await response.json()
+
+    async def _ingest(self, query, page, variants_by_url):
+        note = f"search?query={query}&per_page={PER_PAGE}&page={page}"
+
+        # One bulk request per page instead of one POST per photo
+        added = await asyncio.to_thread(add_many, "pexels.com API", note, list(variants_by_url), 0, variants_by_url)
+        self.added_count += added
+        self.skipped_count += len(variants_by_url) - added
+        return added
+
+    async def _worker(self, session, jobs: asyncio.Queue):
+        while True:
+            query, page = await jobs.get()
+            try:
+                state = self._query_state(query)
+                if state["exhausted"]:
+                    continue
+
+                data = await self._fetch_page(session, query, page)
+                while data is None:  # 429: the bucket is now blocked until the reset
+                    data = await self._fetch_page(session, query, page)
+
+                photos = data.get("photos", [])
+                if not photos:
+                    state["exhausted"] = True
+                    print(f"query='{query}' has no more results after page {page - 1}")
+                else:
+                    added = await self._ingest(query, page, portrait_photos(photos))
+                    print(f"query='{query}' page={page}: {len(photos)} photos, {added} added")
+                    if not data.get("next_page"):
+                        state["exhausted"] = True
+                self._mark_page_done(query, page)
+            except Exception as e:
+                print(f"Error harvesting query='{query}' page={page}: {e}")
+            finally:
+                jobs.task_done()
+
+    async def run(self, queries: List[str], pages_per_query: int):
+        """
+        Harvest the next `pages_per_query` pages of every query, continuing after
+        the last checkpointed page.
+        """
+        import aiohttp
+
+        jobs = asyncio.Queue()
+        for page_offset in range(1, pages_per_query + 1):
+            # Interleave queries so one slow query doesn't hold up the others
+            for query in queries:
+                state = self._query_state(query)
+                if not state["exhausted"]:
+                    jobs.put_nowait((query, state["last_page"] + page_offset))
+
+        started_at = time.time()
+        async with aiohttp.ClientSession() as session:
+            workers = [asyncio.create_task(self._worker(session, jobs)) for _ in range(self.concurrency)]
+            await jobs.join()
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+        print(f"\n Total added: {self.added_count}, skipped: {self.skipped_count}, "
+              f"in {time.time() - started_at:.0f}s\n")
+        for query in queries:
+            print(f"  {query}: last page {self._query_state(query)['last_page']}")
+
+
+if __name__ == "__main__":
+    import argparse
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    api_key = os.getenv('PEXELS_COM_API')
+    if not api_key:
+        print("Error: PEXELS_COM_API not found in environment variables")
+        exit(1)
+
+    parser = argparse.ArgumentParser(description='Harvest Pexels search results into the waiting list')
+    parser.add_argument('queries', nargs='+', help='Search queries, e.g. nature space')
+    parser.add_argument('--pages', type=int, default=5, help='Pages per query for this run')
+    parser.add_argument('--concurrency', type=int, default=4, help='Pages fetched in parallel')
+    parser.add_argument('--reset', action='store_true', help='Forget the saved page checkpoints for these queries')
+    args = parser.parse_args()
+
+    harvester = PexelsHarvester(api_key, concurrency=args.concurrency)
+    if args.reset:
+        for query in args.queries:
+            harvester.checkpoint.pop(query, None)
+
+    asyncio.run(harvester.run(args.queries, args.pages))
@@ -1,16 +1,25 @@
-from pexels_api import API
 import asyncio
 import os
 from dotenv import load_dotenv
-import requests
 from api.wallpaper_api import WallpaperAPI, ImageItem, DownloadItem
+from url_dedupe import get_url_index, canonicalize_url
+from image_variants import pexels_variants
 
 # Initialize the Pexels API with your API key
 PEXELS_API_KEY = 'your_api_key_here'
-api_client = WallpaperAPI()
+_api_client = None
+
+
+def get_api_client():
+    """Create the WallpaperAPI client on first use instead of at import time"""
+    global _api_client
+    if _api_client is None:
+        _api_client = WallpaperAPI()
+    return _api_client
 
 
 def testFunction(api_key):
+    from pexels_api import API
     api = API(api_key)
     # Search for mobile wallpapers
     query = 'mobile wallpaper'
@@ -25,6 +34,7 @@ def testFunction(api_key):
 
 # Document: https://www.pexels.com/api/documentation/#photos-search
 def printImageUrl(api_key, query_text, current_page):
+    import requests
     query = query_text
     per_page = 80 # max 80
     page = current_page
@@ -49,34 +59,85 @@ def printImageUrl(api_key, query_text, current_page):
                 original_url = photo.get('src', {}).get('original')
                 if original_url:
                     print(original_url)
-                    add_one("pexels.com API", temp_note, original_url)
+                    add_one("pexels.com API", temp_note, original_url, variants=pexels_variants(photo))
                     add_one_count = add_one_count + 1
     else:
         print(f'Error: {response.status_code}')
     print("\n Total added:" + str(add_one_count) + "\n")
 
-def add_one(source, note, url):
+def add_one(source, note, url, variants=None, priority=0):
+    # Reject URLs already queued or published before spending a backend round trip
+    url_index = get_url_index()
+    if url_index.contains(url):
+        print(f"Duplicate url skipped: {url}")
+        return False
+
     # Add a new item to the waiting list
-    response = api_client.add_waiting_item(
+    response = get_api_client().add_waiting_item(
         source=source,
         note=note,
         url=url,
-        priority=0,
+        priority=priority,
         assign="",
         status="",
         itemId="",
         itemUrl="",
-        review=False
+        review=False,
+        variants=variants
     )
 
     # Check the response
     if response["success"]:
+        url_index.add(url)
         print("Item added successfully.")
         return True
     else:
         print(f"Failed to add item: {response['message']}")
         return False
 
+def add_many(source, note, urls, priority=0, variants_by_url=None):
+    """
+    Add many URLs to the waiting list with bulk requests, skipping known duplicates.
+
+    Args:
+        variants_by_url (dict): Optional url -> size variants (see image_variants.pexels_variants)
+
+    Returns:
+        int: Number of URLs added
+    """
+    url_index = get_url_index()
+
+    # Drop duplicates within the batch and against the index
+    new_urls = {}
+    for url in urls:
+        key = canonicalize_url(url)
+        if key not in new_urls and not url_index.contains(url):
+            new_urls[key] = url
+    new_urls = list(new_urls.values())
+    if not new_urls:
+        return 0
+
+    variants_by_url = variants_by_url or {}
+    items = []
+    for url in new_urls:
+        item = {"source": source, "note": note, "url": url, "priority": priority}
+        if variants_by_url.get(url):
+            item["variants"] = variants_by_url[url]
+        items.append(item)
+
+    response = get_api_client().add_waiting_items_bulk(items)
+
+    added_urls = []
+    for url, result in zip(new_urls, response["results"]):
+        if result["success"]:
+            added_urls.append(url)
+        else:
+            print(f"Failed to add item {url}: {result['message']}")
+    url_index.add_many(added_urls)
+
+    print(f"Items added: {response['message']}")
+    return len(added_urls)
+
 if __name__ == "__main__":
     # Load environment variables from .env file
     load_dotenv()
@@ -87,6 +148,9 @@ if __name__ == "__main__":
         print("Error: PEXELS_COM_API not found in environment variables")
         exit(1)
 
+    # For bulk ingestion use pexels_harvester.py, it resumes from the last page per query:
+    #   python3 pexels_harvester.py nature space "minimalistic wallpaper" --pages 10
+
     # printImageUrl(api_key, 'nature', 1)     # 20250228 added to waiting list (28)
     # printImageUrl(api_key, 'nature', 2)     # 20250228 added to waiting list (26)
     # printImageUrl(api_key, 'nature', 3)     # 20250228 added to waiting list (31)
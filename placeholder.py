@@ -0,0 +1,125 @@
+"""
+Inline image placeholders stored on the wallpaper item.
+
+A BlurHash string (~60 characters) and a ~32 px base64 JPEG thumbnail are
+computed from an already-downsampled rendition (LD) and saved in the item
+record, so the app can paint a blurry placeholder without fetching a
+separate BL image.
+"""
+
+import base64
+import math
+from io import BytesIO
+from typing import Dict
+
+BLURHASH_COMPONENTS = (4, 7)   # (x, y) components, 9:16 portrait wallpapers
+BLURHASH_SAMPLE_WIDTH = 32     # BlurHash only keeps low frequencies, 32 px is plenty
+THUMBNAIL_WIDTH = 32
+THUMBNAIL_QUALITY = 50
+
+_BASE83_CHARACTERS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~"
+
+
+def _encode_base83(value: int, length: int) -> str:
+    result = ""
+    for i in range(1, length + 1):
+        digit = (value // (83 ** (length - i))) % 83
+        result += _BASE83_CHARACTERS[digit]
+    return result
+
+
+def _linear_to_srgb(value: float) -> int:
+    value = max(0.0, min(1.0, value))
+    if value <= 0.0031308:
+        return int(value * 12.92 * 255 + 0.5)
+    return int((1.055 * math.pow(value, 1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def _sign_pow(value: float, exponent: float) -> float:
+    return math.copysign(math.pow(abs(value), exponent), value)
+
+
+def blurhash_encode(img, components_x: int = BLURHASH_COMPONENTS[0], components_y: int = BLURHASH_COMPONENTS[1]) -> str:
+    """
+    Encode an image as a BlurHash string (https://blurha.sh).
+
+    Args:
+        img (PIL.Image.Image): Source image, downsampled internally
+        components_x (int): Horizontal components (1-9)
+        components_y (int): Vertical components (1-9)
+
+    Returns:
+        str: The BlurHash string
+    """
+    import numpy as np
+    from PIL import Image
+
+    width = BLURHASH_SAMPLE_WIDTH
+    height = max(1, round(img.size[1] * width / img.size[0]))
+    small = img.convert('RGB').resize((width, height), Image.BILINEAR)
+
+    srgb = np.asarray(small, dtype=np.float64) / 255.0
+    linear = np.where(srgb <= 0.04045, srgb / 12.92, ((srgb + 0.055) / 1.055) ** 2.4)
+
+    xs = np.arange(width)
+    ys = np.arange(height)
+    factors = []
+    for j in range(components_y):
+        for i in range(components_x):
+            normalisation = 1.0 if i == 0 and j == 0 else 2.0
+            basis = np.cos(math.pi * j * ys / height)[:, None] * np.cos(math.pi * i * xs / width)[None, :]
+            factors.append(normalisation * (basis[:, :, None] * linear).sum(axis=(0, 1)) / (width * height))
+
+    dc, ac = factors[0], factors[1:]
+
+    result = _encode_base83((components_x - 1) + (components_y - 1) * 9, 1)
+
+    if ac:
+        actual_max = max(float(np.abs(factor).max()) for factor in ac)
+        quantised_max = max(0, min(82, int(math.floor(actual_max * 166 - 0.5))))
+        max_value = (quantised_max + 1) / 166
+        result += _encode_base83(quantised_max, 1)
+    else:
+        max_value = 1.0
+        result += _encode_base83(0, 1)
+
+    r, g, b = (_linear_to_srgb(float(channel)) for channel in dc)
+    result += _encode_base83((r << 16) + (g << 8) + b, 4)
+
+    for factor in ac:
+        quantised = [max(0, min(18, int(math.floor(_sign_pow(float(channel) / max_value, 0.5) * 9 + 9.5)))) for channel in factor]
+        result += _encode_base83(quantised[0] * 19 * 19 + quantised[1] * 19 + quantised[2], 2)
+
+    return result
+
+
+def tiny_thumbnail_data_uri(img, width: int = THUMBNAIL_WIDTH, quality: int = THUMBNAIL_QUALITY) -> str:
+    """~32 px wide JPEG as a data URI (well under 1 KB for a 9:16 image)."""
+    from PIL import Image
+
+    height = max(1, round(img.size[1] * width / img.size[0]))
+    small = img.convert('RGB').resize((width, height), Image.LANCZOS)
+    buffer = BytesIO()
+    small.save(buffer, 'JPEG', quality=quality, optimize=True)
+    return "data:image/jpeg;base64," + base64.b64encode(buffer.getvalue()).decode('ascii')
+
+
+def make_placeholder(image_path: str) -> Dict[str, object]:
+    """
+    Compute the inline placeholder for an image file, ideally the LD rendition.
+
+    Returns:
+        dict: blurhash, thumbnail (data URI) and the source width/height
+    """
+    from PIL import Image
+
+    with Image.open(image_path) as img:
+        width, height = img.size
+        # JPEG DCT scaling: decode straight at a small size, only low frequencies are needed
+        img.draft('RGB', (BLURHASH_SAMPLE_WIDTH * 2, BLURHASH_SAMPLE_WIDTH * 4))
+        return {
+            "blurhash": blurhash_encode(img),
+            "thumbnail": tiny_thumbnail_data_uri(img),
+            "width": width,
+            "height": height
+        }
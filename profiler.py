@@ -0,0 +1,238 @@
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Optional, Tuple
+
+PROFILE_FOLDER = os.path.join("output", "profiles")
+DEFAULT_SAMPLE_INTERVAL = 0.005  # 5 ms between stack samples
+DEFAULT_TOP_COUNT = 10
+
+
+def _timestamp():
+    return time.strftime("%Y%m%d_%H%M%S")
+
+
+class SamplingProfiler:
+    """
+    Low-overhead wall-clock sampler covering every thread in the process.
+
+    A daemon thread snapshots all thread stacks every `interval` seconds and
+    counts identical stacks, which is exactly the collapsed-stack format used
+    by flamegraph.pl / speedscope ("frame;frame;frame count").
+    """
+
+    def __init__(self, interval: float = DEFAULT_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self.sample_count = 0
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        own_id = threading.get_ident()
+        thread_names = {}
+        while not self._stop_event.is_set():
+            for thread in threading.enumerate():
+                thread_names[thread.ident] = thread.name
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(thread_names.get(thread_id, str(thread_id)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.sample_count += 1
+            time.sleep(self.interval)
+
+    def write_collapsed(self, path):
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+    def summary(self, top=DEFAULT_TOP_COUNT):
+        """Top leaf frames by sample count (self time)."""
+        leaf_counts = Counter()
+        for stack, count in self.stacks.items():
+            leaf_counts[stack.rsplit(";", 1)[-1]] += count
+        total = sum(leaf_counts.values()) or 1
+        lines = [f"{self.sample_count} samples every {self.interval * 1000:.0f} ms, top {top} frames (self):"]
+        for frame, count in leaf_counts.most_common(top):
+            lines.append(f"{count * 100 / total:5.1f}%  {frame}")
+        return "\n".join(lines)
+
+
+class ProfileSession:
+    """
+    One on-demand capture, either cProfile ("cprofile") or stack sampling ("sample").
+
+    cProfile hooks only the thread that starts it, which for the bot is the
+    Discord event-loop thread where all handlers run. Use "sample" to also see
+    worker threads (asyncio.to_thread, executors).
+    """
+
+    def __init__(self, mode: str = "cprofile", label: str = ""):
+        if mode not in ("cprofile", "sample"):
+            raise ValueError(f"Unknown profile mode '{mode}'. Use 'cprofile' or 'sample'.")
+        self.mode = mode
+        self.label = label
+        self.started_at = 0.0
+        self.profiler = None
+
+    def start(self):
+        self.started_at = time.time()
+        if self.mode == "cprofile":
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        else:
+            self.profiler = SamplingProfiler()
+            self.profiler.start()
+        print(f"Profiler started: mode={self.mode}, label={self.label}")
+
+    def stop(self, top=DEFAULT_TOP_COUNT) -> Tuple[str, str]:
+        """
+        Stop the capture and write the report file.
+
+        Returns:
+            tuple: (report file path, short top-functions summary)
+        """
+        if self.mode == "cprofile":
+            self.profiler.disable()
+        else:
+            self.profiler.stop()
+
+        elapsed = time.time() - self.started_at
+        os.makedirs(PROFILE_FOLDER, exist_ok=True)
+        name = f"{_timestamp()}_{self.mode}_{self.label or 'capture'}"
+
+        if self.mode == "cprofile":
+            report_path = os.path.join(PROFILE_FOLDER, f"{name}.pstats")
+            self.profiler.dump_stats(report_path)
+            stream = io.StringIO()
+            stats = pstats.Stats(self.profiler, stream=stream)
+            stats.strip_dirs().sort_stats("cumulative").print_stats(top)
+            summary = _trim_pstats_output(stream.getvalue())
+        else:
+            report_path = os.path.join(PROFILE_FOLDER, f"{name}.collapsed")
+            self.profiler.write_collapsed(report_path)
+            summary = self.profiler.summary(top)
+
+        print(f"Profiler stopped after {elapsed:.1f}s, report: {report_path}")
+        return report_path, f"Profile {self.mode} ({elapsed:.1f}s): {report_path}\n{summary}"
+
+
+def _trim_pstats_output(text):
+    """Drop the pstats banner lines so the summary fits in one Discord message."""
+    lines = [line for line in text.splitlines() if line.strip()]
+    for index, line in enumerate(lines):
+        if line.lstrip().startswith("ncalls"):
+            return "\n".join(lines[index:])
+    return "\n".join(lines)
+
+
+class ProfileController:
+    """
+    Holds at most one active capture for the bot process.
+
+    Captures are started from Discord control commands and stopped either
+    after N seconds or when the current job finishes (see stop_for_job()).
+    """
+
+    def __init__(self):
+        self.session: Optional[ProfileSession] = None
+        self.until_job_end = False
+
+    def is_active(self):
+        return self.session is not None
+
+    def start(self, mode="cprofile", until_job_end=False, label=""):
+        if self.session:
+            raise RuntimeError("A profile capture is already running")
+        self.session = ProfileSession(mode, label)
+        self.until_job_end = until_job_end
+        self.session.start()
+
+    def stop(self):
+        if not self.session:
+            return None, "No profile capture running"
+        session = self.session
+        self.session = None
+        self.until_job_end = False
+        return session.stop()
+
+    def stop_for_job(self):
+        """Stop the capture if it was started for 'the next job'. Returns the summary or None."""
+        if self.session and self.until_job_end:
+            _, summary = self.stop()
+            return summary
+        return None
+
+    async def capture_for(self, seconds, mode="cprofile", label=""):
+        import asyncio
+        self.start(mode, until_job_end=False, label=label or f"{int(seconds)}s")
+        session = self.session
+        await asyncio.sleep(seconds)
+        if self.session is not session:
+            # Stopped by hand meanwhile (and maybe a new capture started): leave that one alone
+            return None, "Profile capture was already stopped"
+        return self.stop()
+
+
+def parse_profile_command(content: str):
+    """
+    Parse a profiling control command from a Discord message.
+
+    Supported commands:
+        command_profile_next_job            cProfile until the next job completes
+        command_sample_next_job             stack sampling until the next job completes
+        command_profile_seconds <N>         cProfile for N seconds
+        command_sample_seconds <N>          stack sampling for N seconds
+        command_profile_stop                stop the running capture now
+
+    Returns:
+        tuple: (action, mode, seconds) or None if the message is not a profiling command
+    """
+    parts = content.strip().split()
+    if not parts:
+        return None
+    command = parts[0]
+    if command == "command_profile_stop":
+        return "stop", None, 0
+    if command in ("command_profile_next_job", "command_sample_next_job"):
+        mode = "cprofile" if command.startswith("command_profile") else "sample"
+        return "next_job", mode, 0
+    if command in ("command_profile_seconds", "command_sample_seconds"):
+        mode = "cprofile" if command.startswith("command_profile") else "sample"
+        seconds = 30
+        if len(parts) > 1:
+            try:
+                seconds = max(1, min(int(parts[1]), 3600))
+            except ValueError:
+                pass
+        return "seconds", mode, seconds
+    return None
+
+
+def format_for_discord(summary, limit=1900):
+    """Discord rejects messages over 2000 characters; wrap in a code block and truncate."""
+    if len(summary) > limit:
+        summary = summary[:limit] + "\n..."
+    return f"```\n{summary}\n```"
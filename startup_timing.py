@@ -0,0 +1,88 @@
+"""
+Startup timing report for the Discord bot.
+
+Two views:
+  - Stage marks recorded while the bot starts (imports done, Firebase ready,
+    on_ready), printed once the bot is connected.
+  - An import-time breakdown of `customDiscordBot` per top-level package,
+    produced by running `python -X importtime` in a subprocess:
+
+        python3 startup_timing.py            # top 20 packages by import time
+        python3 startup_timing.py --top 40
+"""
+
+import time
+
+# Imported first by customDiscordBot, so this is (close to) process start.
+_START = time.perf_counter()
+_marks = []
+
+
+def mark(stage: str):
+    """Record the time elapsed since startup for a named stage."""
+    elapsed = time.perf_counter() - _START
+    _marks.append((stage, elapsed))
+    print(f"[startup] {stage}: {elapsed:.2f}s")
+
+
+def report() -> str:
+    """Return the recorded stage marks as a small table."""
+    lines = ["=== Startup timing ==="]
+    previous = 0.0
+    for stage, elapsed in _marks:
+        lines.append(f"{stage:<24} {elapsed:7.2f}s  (+{elapsed - previous:.2f}s)")
+        previous = elapsed
+    return "\n".join(lines)
+
+
+def import_time_breakdown(module: str = "customDiscordBot", top: int = 20):
+    """
+    Measure import time per top-level package with `python -X importtime`.
+
+    Each module's self time is attributed to its top-level package, so nested
+    imports are not double counted (e.g. firebase_admin vs google vs grpc).
+
+    Returns:
+        list: (package, seconds) sorted slowest first
+    """
+    import subprocess
+    import sys
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True
+    )
+
+    # Lines look like: "import time:   self [us] | cumulative | imported package"
+    totals = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        try:
+            self_us, _, name = line[len("import time:"):].split("|")
+        except ValueError:
+            continue
+        package = name.strip().split(".")[0]
+        totals[package] = totals.get(package, 0) + int(self_us) / 1_000_000
+
+    if result.returncode != 0:
+        print(f"Import of {module} failed:\n{result.stderr.splitlines()[-1] if result.stderr else ''}")
+
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)[:top]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Import-time breakdown for the bot')
+    parser.add_argument('--module', default='customDiscordBot', help='Module to import')
+    parser.add_argument('--top', type=int, default=20, help='Number of packages to show')
+    args = parser.parse_args()
+
+    breakdown = import_time_breakdown(args.module, args.top)
+    total = sum(seconds for _, seconds in breakdown)
+    print(f"=== Import time of {args.module} (top {args.top}) ===")
+    for package, seconds in breakdown:
+        print(f"{package:<28} {seconds:7.3f}s")
+    print(f"{'total (shown)':<28} {total:7.3f}s")
@@ -0,0 +1,268 @@
+"""
+Chunked resumable uploads to Firebase Storage.
+
+Pass-through: stream a remote file straight into Firebase Storage.
+
+The upscaled Midjourney image is never modified, so instead of downloading it
+to disk and uploading it afterwards, the Discord CDN response body is piped
+into a GCS resumable upload session chunk by chunk. A reader task fills a
+small bounded queue while the uploader sends the previous chunk, so the two
+transfers overlap and at most a few chunks are held in memory.
+
+    url, blob_name = await stream_url_to_firebase(attach_image_url, "upscaled")
+
+Local files go through upload_file_resumable (via utility.upload_to_firebase_resumable).
+Every chunk is retried with exponential backoff, and after a failure the
+session is asked how much it committed, so only the missing bytes are resent.
+"""
+
+import asyncio
+import mimetypes
+import os
+import random
+from typing import Optional, Tuple
+from urllib.parse import urlsplit
+
+UPLOAD_GRANULARITY = 256 * 1024      # GCS: every chunk but the last must be a multiple of 256 KiB
+CHUNK_SIZE = 8 * UPLOAD_GRANULARITY  # 2 MiB per PUT
+QUEUE_CHUNKS = 2                     # chunks buffered between the download and the upload
+
+# Per-chunk retry on flaky connections: 1, 2, 4, 8, 16 s (+/- 50% jitter)
+MAX_CHUNK_RETRIES = 5
+RETRY_BACKOFF_SECONDS = 1.0
+RETRYABLE_STATUS = (408, 429, 500, 502, 503, 504)
+
+
+class TransientUploadError(Exception):
+    """A chunk was rejected with a status worth retrying (429, 5xx)"""
+
+
+def start_upload_session(blob_name: str, content_type: str) -> str:
+    """
+    Open a resumable upload session for blob_name (public, immutable cache headers,
+    same as upload_to_firebase_3) and return its session URL.
+    """
+    from utility import get_bucket, UPLOAD_CACHE_CONTROL
+
+    blob = get_bucket().blob(blob_name)
+    blob.cache_control = UPLOAD_CACHE_CONTROL
+    return blob.create_resumable_upload_session(content_type=content_type, predefined_acl="publicRead")
+
+
+def _committed_from_response(status, headers, total):
+    """Bytes the server has after a chunk PUT or status query; None means the upload is complete."""
+    if status in (200, 201):
+        return None
+    if status == 308:
+        # Range: bytes=0-N is what the server has; no header means nothing yet
+        committed_range = headers.get("Range", "")
+        return int(committed_range.rsplit("-", 1)[1]) + 1 if committed_range else 0
+    return -1
+
+
+async def query_committed(session, session_url: str, total: Optional[int] = None) -> Optional[int]:
+    """Ask the session how many bytes it has committed (None if the upload already completed)."""
+    content_range = f"bytes */{total if total is not None else '*'}"
+    async with session.put(session_url, headers={"Content-Range": content_range}) as response:
+        committed = _committed_from_response(response.status, response.headers, total)
+        if committed == -1:
+            raise RuntimeError(f"Upload status query failed: HTTP {response.status}")
+        return committed
+
+
+async def put_chunk(session, session_url: str, data: bytes, offset: int, total: Optional[int] = None) -> int:
+    """
+    Send one chunk of a resumable upload.
+
+    Args:
+        data (bytes): Chunk; a multiple of UPLOAD_GRANULARITY unless it's the last one
+        offset (int): Byte offset of the chunk in the object
+        total (int): Object size, only known (and required) for the last chunk
+
+    Returns:
+        int: Bytes committed by the server after this chunk
+    """
+    if data:
+        content_range = f"bytes {offset}-{offset + len(data) - 1}/{total if total is not None else '*'}"
+    else:
+        content_range = f"bytes */{total}"
+
+    async with session.put(session_url, data=data, headers={"Content-Range": content_range}) as response:
+        committed = _committed_from_response(response.status, response.headers, total)
+        if committed is None:
+            return total
+        if committed == -1:
+            error = TransientUploadError if response.status in RETRYABLE_STATUS else RuntimeError
+            raise error(f"Chunk upload failed: HTTP {response.status} {await response.text()}")
+        return committed
+
+
+async def put_chunk_with_retry(session, session_url: str, data: bytes, offset: int, total: Optional[int] = None,
+                               max_retries: int = MAX_CHUNK_RETRIES, backoff: Optional[float] = None) -> int:
+    """
+    put_chunk, retried with exponential backoff on network errors and 429/5xx.
+
+    Before each retry the session is asked what it already committed, and only
+    the missing tail of the chunk is sent again.
+
+    Args:
+        backoff (float): First retry delay in seconds (default RETRY_BACKOFF_SECONDS), doubled per retry
+    """
+    import aiohttp
+
+    if backoff is None:
+        backoff = RETRY_BACKOFF_SECONDS
+
+    end = offset + len(data)
+    attempt = 0
+    while True:
+        try:
+            committed = await put_chunk(session, session_url, data, offset, total)
+        except (aiohttp.ClientError, asyncio.TimeoutError, TransientUploadError) as e:
+            attempt += 1
+            if attempt > max_retries:
+                raise
+            delay = backoff * (2 ** (attempt - 1)) * (0.5 + random.random())
+            print(f"Chunk at offset {offset} failed ({e}), retry {attempt}/{max_retries} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            try:
+                committed = await query_committed(session, session_url, total)
+            except (aiohttp.ClientError, asyncio.TimeoutError, RuntimeError) as query_error:
+                print(f"Upload status query failed ({query_error}), resending the chunk")
+                continue
+            if committed is None:
+                return total
+
+        if committed >= end:
+            return committed
+        if committed < offset:
+            raise RuntimeError(f"Upload session lost data: committed {committed}, chunk starts at {offset}")
+        # Only part of the chunk arrived: send the rest
+        data, offset = data[committed - offset:], committed
+
+
+def _aligned(chunk_size: int) -> int:
+    return max(UPLOAD_GRANULARITY, chunk_size // UPLOAD_GRANULARITY * UPLOAD_GRANULARITY)
+
+
+async def upload_file_resumable(local_path: str, blob_name: str, content_type: Optional[str] = None,
+                                chunk_size: int = CHUNK_SIZE, max_retries: int = MAX_CHUNK_RETRIES,
+                                timeout: int = 60) -> int:
+    """
+    Upload a local file in chunks through a resumable session.
+
+    Args:
+        local_path (str): File to upload
+        blob_name (str): Destination object name
+        chunk_size (int): Bytes per PUT, rounded down to a multiple of 256 KiB
+        max_retries (int): Retries per chunk before giving up
+        timeout (int): Seconds without progress on the connection before a chunk is retried
+
+    Returns:
+        int: Bytes uploaded
+    """
+    import aiohttp
+
+    chunk_size = _aligned(chunk_size)
+    content_type = content_type or mimetypes.guess_type(local_path)[0] or "application/octet-stream"
+    total = os.path.getsize(local_path)
+    session_url = await asyncio.to_thread(start_upload_session, blob_name, content_type)
+
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=None, sock_connect=timeout, sock_read=timeout)) as session:
+        offset = 0
+        with open(local_path, "rb") as f:
+            while True:
+                # Always read from the committed offset, so a resumed chunk starts where the server stopped
+                f.seek(offset)
+                data = f.read(chunk_size)
+                is_last = offset + len(data) >= total
+                committed = await put_chunk_with_retry(session, session_url, data, offset,
+                                                       total if is_last else None, max_retries)
+                if is_last:
+                    return total
+                offset = committed
+
+
+async def _read_chunks(response, queue: asyncio.Queue, chunk_size: int):
+    """Download side: re-slice the response body into upload-sized chunks."""
+    buffer = bytearray()
+    try:
+        async for data in response.content.iter_chunked(64 * 1024):
+            buffer.extend(data)
+            while len(buffer) >= chunk_size:
+                await queue.put(bytes(buffer[:chunk_size]))
+                del buffer[:chunk_size]
+        await queue.put(bytes(buffer))
+        await queue.put(None)  # end of body
+    except Exception as e:
+        await queue.put(e)
+
+
+async def stream_url_to_firebase(url: str, firebase_folder: str, resolution: str = "",
+                                 chunk_size: int = CHUNK_SIZE, timeout: int = 60,
+                                 max_retries: int = MAX_CHUNK_RETRIES) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Copy a remote file into Firebase Storage without a temp file.
+
+    Args:
+        url (str): Source URL (e.g. the Discord attachment)
+        firebase_folder (str): Storage folder, as for upload_to_firebase_3
+        resolution (str): Optional "WxH" for the object name
+        chunk_size (int): Bytes per PUT, rounded down to a multiple of 256 KiB
+        timeout (int): Seconds without data on either connection before a chunk is retried
+        max_retries (int): Retries per chunk; the download itself isn't retried
+
+    Returns:
+        tuple: (download URL, blob name), or (None, None) if the copy failed
+    """
+    import aiohttp
+    from utility import get_utc_time, public_blob_url, get_bucket, HASH_PREFIXED_BLOB_NAMES
+    from blob_names import make_blob_name
+
+    chunk_size = _aligned(chunk_size)
+    file_ext = os.path.splitext(urlsplit(url).path)[1].lower() or ".jpg"
+    content_type = mimetypes.guess_type(f"file{file_ext}")[0] or "application/octet-stream"
+    # The bytes aren't known up front, so this can't be content-addressed
+    blob_name = make_blob_name(firebase_folder, file_ext, get_utc_time(), resolution, hashed=HASH_PREFIXED_BLOB_NAMES)
+
+    try:
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=None, sock_connect=timeout, sock_read=timeout)) as session:
+            # Open the upload session while the download request is being made
+            session_url_task = asyncio.create_task(asyncio.to_thread(start_upload_session, blob_name, content_type))
+            async with session.get(url) as response:
+                if response.status != 200:
+                    session_url_task.cancel()
+                    print(f"Failed to download image. Status code: {response.status}")
+                    return None, None
+                session_url = await session_url_task
+
+                queue = asyncio.Queue(maxsize=QUEUE_CHUNKS)
+                reader = asyncio.create_task(_read_chunks(response, queue, chunk_size))
+                offset = 0
+                try:
+                    chunk = await queue.get()
+                    while True:
+                        if isinstance(chunk, Exception):
+                            raise chunk
+                        next_chunk = await queue.get()
+                        if isinstance(next_chunk, Exception):
+                            raise next_chunk
+                        # The last chunk is the one followed by the end marker; only it carries the total
+                        is_last = next_chunk is None
+                        total = offset + len(chunk) if is_last else None
+                        committed = await put_chunk_with_retry(session, session_url, chunk, offset, total, max_retries)
+                        if committed != offset + len(chunk):
+                            raise RuntimeError(f"Server committed {committed} of {offset + len(chunk)} bytes")
+                        offset = committed
+                        if is_last:
+                            break
+                        chunk = next_chunk
+                finally:
+                    reader.cancel()
+
+        print(f"File streamed to Firebase Storage: {blob_name} ({offset} bytes)")
+        return public_blob_url(get_bucket().name, blob_name), blob_name
+
+    except Exception as e:
+        print(f"Error in stream_url_to_firebase: {e}")
+        return None, None
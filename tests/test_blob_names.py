@@ -0,0 +1,36 @@
+from blob_names import hash_prefix, local_filename, make_blob_name, parse_blob_name
+
+UUID = "0f8fad5b-d9cb-469f-a165-70867728950e"
+
+
+def test_hashed_name_round_trip():
+    name = make_blob_name("LD", ".jpg", "20250305_055540_", "408x728", unique_id=UUID)
+    assert name == f"images/LD/{hash_prefix(UUID)}_20250305_055540_LD_408x728_{UUID}.jpg"
+    parts = parse_blob_name(name)
+    assert parts["scheme"] == "hashed"
+    assert (parts["folder"], parts["timestamp"], parts["type"], parts["resolution"], parts["id"], parts["ext"]) == \
+        ("LD", "20250305_055540", "LD", "408x728", UUID, ".jpg")
+
+
+def test_old_timestamp_names_still_parse():
+    name = make_blob_name("thumbnail", ".jpg", "20250305_055540_", unique_id=UUID, hashed=False)
+    assert name == f"images/thumbnail/20250305_055540_thumbnail_{UUID}.jpg"
+    parts = parse_blob_name(name)
+    assert parts["scheme"] == "timestamp" and parts["resolution"] == "" and parts["id"] == UUID
+
+
+def test_content_names_and_unknown_names():
+    digest = "ab" * 32
+    parts = parse_blob_name(f"images/content/{digest}.webp")
+    assert parts == {"scheme": "content", "folder": "content", "filename": f"{digest}.webp",
+                     "id": digest, "ext": ".webp"}
+    assert parse_blob_name("images/LD/photo.jpg") is None
+    # A prefix that isn't the hash of the uuid isn't a hashed name
+    assert parse_blob_name(f"images/LD/zzzz_20250305_055540_LD_{UUID}.jpg") is None
+
+
+def test_local_filename_drops_the_hash_prefix():
+    hashed = make_blob_name("HD", ".jpg", "20250305_055540_", "1632x2912", unique_id=UUID)
+    old = make_blob_name("HD", ".jpg", "20250305_055540_", "1632x2912", unique_id=UUID, hashed=False)
+    assert local_filename(hashed) == local_filename(old) == f"20250305_055540_HD_1632x2912_{UUID}.jpg"
+    assert local_filename("images/LD/photo.jpg") == "photo.jpg"
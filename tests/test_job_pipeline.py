@@ -0,0 +1,168 @@
+import asyncio
+
+import pytest
+
+from job_pipeline import StageFailed, StageGraph
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_stages_get_their_dependency_results():
+    done = []
+
+    async def main():
+        async def download():
+            return "file.png"
+
+        async def renditions(download):
+            return f"{download}:renditions"
+
+        async def publish(renditions, upscaled):
+            return (renditions, upscaled)
+
+        graph = StageGraph("test", on_stage_done=lambda name, result: done.append(name))
+        graph.add("download", download)
+        graph.add("renditions", renditions, deps=["download"])
+        graph.external("upscaled", after=["download"])
+        graph.add("publish", publish, deps=["renditions", "upscaled"])
+        graph.start()
+        await graph.result("renditions")
+        assert graph.pending() == ["upscaled", "publish"]
+        graph.set_result("upscaled", "upscaled.png")
+        return await graph.result("publish")
+
+    assert run(main()) == ("file.png:renditions", "upscaled.png")
+    assert done == ["download", "renditions", "upscaled", "publish"]
+
+
+def test_failure_propagates_to_dependants():
+    async def main():
+        async def download():
+            raise RuntimeError("404")
+
+        async def renditions(download):
+            return "never"
+
+        graph = StageGraph("test")
+        graph.add("download", download)
+        graph.add("renditions", renditions, deps=["download"])
+        graph.start()
+        with pytest.raises(StageFailed, match="renditions: dependency failed"):
+            await graph.result("renditions")
+        assert not graph.is_done("download")
+
+    run(main())
+
+
+def test_completed_stages_are_not_run_again():
+    calls = []
+
+    async def main():
+        async def download():
+            calls.append("download")
+            return "fresh.png"
+
+        async def publish(download):
+            calls.append("publish")
+            return download
+
+        graph = StageGraph("test")
+        graph.add("download", download)
+        graph.add("publish", publish, deps=["download"])
+        graph.start({"download": "saved.png"})
+        return await graph.result("publish")
+
+    assert run(main()) == "saved.png"
+    assert calls == ["publish"]
+
+
+def test_invalid_graphs_are_rejected():
+    async def noop(**_):
+        return None
+
+    async def main():
+        graph = StageGraph("test")
+        graph.add("a", noop, deps=["missing"])
+        with pytest.raises(ValueError, match="unknown stage"):
+            graph.start()
+
+        graph = StageGraph("test")
+        graph.add("a", noop, deps=["b"])
+        graph.add("b", noop, deps=["a"])
+        with pytest.raises(ValueError, match="cycle"):
+            graph.start()
+
+    run(main())
+    with pytest.raises(ValueError, match="already exists"):
+        StageGraph("test").add("a", noop).add("a", noop)
+
+
+def test_overdue_stage_is_restarted():
+    attempts = []
+
+    async def main():
+        async def slow():
+            attempts.append(len(attempts))
+            if len(attempts) == 1:
+                await asyncio.sleep(60)
+            return "ok"
+
+        graph = StageGraph("test")
+        graph.add("slow", slow, deadline=10)
+        graph.start()
+        await asyncio.sleep(0)
+        started_at = graph.stages["slow"].started_at
+        assert graph.overdue(now=started_at + 5) == []
+        assert graph.overdue(now=started_at + 11) == ["slow"]
+
+        graph.restart("slow")
+        assert await graph.result("slow") == "ok"
+        assert graph.stages["slow"].attempts == 1
+        assert graph.overdue(now=started_at + 100) == []
+
+    run(main())
+    assert attempts == [0, 1]
+
+
+def test_external_deadline_counts_from_its_trigger():
+    async def main():
+        async def click():
+            return None
+
+        graph = StageGraph("test")
+        graph.add("click", click)
+        graph.external("upscaled", after=["click"], deadline=30)
+        graph.start()
+        await graph.result("click")
+        clicked_at = graph.stages["click"].finished_at
+        assert graph.overdue(now=clicked_at + 31) == ["upscaled"]
+
+        restarted_at = clicked_at + 31
+        graph.restart("upscaled")
+        graph.stages["upscaled"].started_at = restarted_at
+        assert graph.overdue(now=restarted_at + 10) == []
+
+    run(main())
+
+
+def test_cancel_fails_waiters_and_stops_tasks():
+    async def main():
+        async def forever():
+            await asyncio.sleep(60)
+
+        graph = StageGraph("test")
+        graph.add("forever", forever)
+        graph.external("upscaled")
+        graph.start()
+        await asyncio.sleep(0)
+        graph.cancel("abandoned")
+        with pytest.raises(StageFailed, match="abandoned"):
+            await graph.result("upscaled")
+        with pytest.raises(StageFailed, match="abandoned"):
+            await graph.result("forever")
+        await asyncio.sleep(0)
+        assert graph.stages["forever"].task.cancelled()
+
+    run(main())
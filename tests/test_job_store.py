@@ -0,0 +1,54 @@
+import os
+
+from job_store import ABANDONED, DONE, RUNNING, JobStore
+
+
+def test_stages_survive_a_reopen(tmp_path):
+    path = os.path.join(tmp_path, "jobs.sqlite3")
+    store = JobStore(path)
+    job_id = store.create_job("waiting-1", 10, 20, "https://cdn.example.com/a.png", {"failures": 1})
+    store.record_stage(job_id, "download", "/tmp/a.png")
+    store.record_stage(job_id, "thumbnail_upload", ["https://example.com/t.jpg", "images/thumbnail/t.jpg"])
+    store.conn.close()
+
+    job = JobStore(path).active_job()
+    assert job["job_id"] == job_id and job["status"] == RUNNING
+    assert (job["waiting_id"], job["channel_id"], job["message_id"]) == ("waiting-1", 10, 20)
+    assert job["data"] == {"failures": 1}
+    assert job["stages"] == {"download": "/tmp/a.png",
+                             "thumbnail_upload": ["https://example.com/t.jpg", "images/thumbnail/t.jpg"]}
+
+
+def test_recording_a_stage_again_replaces_it(tmp_path):
+    store = JobStore(os.path.join(tmp_path, "jobs.sqlite3"))
+    job_id = store.create_job("waiting-1")
+    store.record_stage(job_id, "publish", "000001")
+    store.record_stage(job_id, "publish", "000002")
+    assert store.get_job(job_id)["stages"] == {"publish": "000002"}
+
+
+def test_finished_jobs_are_not_active(tmp_path):
+    store = JobStore(os.path.join(tmp_path, "jobs.sqlite3"))
+    first = store.create_job("waiting-1")
+    second = store.create_job("waiting-2")
+    store.record_stage(first, "download", "a.png")  # most recently updated
+    assert store.active_job()["job_id"] == first
+
+    store.finish_job(first, DONE)
+    assert store.active_job()["job_id"] == second
+    store.finish_job(second, ABANDONED)
+    assert store.active_job() is None
+    assert store.get_job(second)["status"] == ABANDONED
+    assert store.get_job("missing") is None
+
+
+def test_claim_is_linked_to_its_message_later(tmp_path):
+    store = JobStore(os.path.join(tmp_path, "jobs.sqlite3"))
+    job_id = store.create_job("waiting-1", data={"failures": 0})
+    store.record_stage(job_id, "claim", {"waiting_id": "waiting-1", "prompt": "a red fox"})
+    claimed = store.active_job()
+    assert claimed["message_id"] is None and claimed["stages"]["claim"]["prompt"] == "a red fox"
+
+    store.attach_message(job_id, 10, 20, "https://cdn.example.com/a.png")
+    job = store.get_job(job_id)
+    assert (job["channel_id"], job["message_id"], job["attach_url"]) == (10, 20, "https://cdn.example.com/a.png")
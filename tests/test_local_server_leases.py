@@ -0,0 +1,108 @@
+import threading
+
+import pytest
+
+from api.local_server import LocalStore, make_server
+from api.wallpaper_api import WallpaperAPI
+
+
+@pytest.fixture
+def store():
+    return LocalStore()
+
+
+@pytest.fixture
+def api(store):
+    server = make_server(port=0, store=store)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield WallpaperAPI(f"http://127.0.0.1:{server.server_port}")
+    server.shutdown()
+
+
+def expire(store, _id):
+    store.waiting[_id]["lease"]["expiresAt"] = 0
+
+
+def test_claimed_item_is_hidden_until_the_lease_expires(api, store):
+    _id = store.add_waiting({"source": "test", "url": "https://example.com/1.jpg", "status": ""})
+    claimed = api.claim_waiting_item("worker-a", ttl=60)
+    assert claimed["success"] and claimed["data"]["_id"] == _id
+    assert claimed["data"]["lease"]["workerId"] == "worker-a"
+
+    assert not api.claim_waiting_item("worker-b", ttl=60)["success"]
+    assert api.get_count_from_waiting_list() == 0
+
+    expire(store, _id)
+    claimed = api.claim_waiting_item("worker-b", ttl=60)
+    assert claimed["success"] and claimed["data"]["lease"]["workerId"] == "worker-b"
+
+
+def test_claim_a_chosen_item(api, store):
+    store.add_waiting({"source": "test", "url": "https://example.com/1.jpg", "status": ""})
+    second = store.add_waiting({"source": "test", "url": "https://example.com/2.jpg", "status": ""})
+    claimed = api.claim_waiting_item("worker-a", item_id=second)
+    assert claimed["data"]["_id"] == second
+    assert not api.claim_waiting_item("worker-b", item_id=second)["success"]
+
+
+def test_renew_only_by_the_holder(api, store):
+    _id = store.add_waiting({"source": "test", "status": ""})
+    api.claim_waiting_item("worker-a", ttl=60)
+    assert api.renew_lease(_id, "worker-a", ttl=120)["success"]
+    assert api.renew_lease(_id, "worker-b")["status_code"] == 409
+
+    # An expired lease the holder renews before anyone re-claims it is still its own
+    expire(store, _id)
+    assert api.renew_lease(_id, "worker-a")["success"]
+
+    expire(store, _id)
+    api.claim_waiting_item("worker-b")
+    assert api.renew_lease(_id, "worker-a")["status_code"] == 409
+
+
+def test_release_puts_the_item_back_or_fails_it(api, store):
+    _id = store.add_waiting({"source": "test", "status": ""})
+    api.claim_waiting_item("worker-a")
+    assert api.release_lease(_id, "worker-b", failures=1)["status_code"] == 409
+    assert api.release_lease(_id, "worker-a", failures=1, note="timeout")["success"]
+    item = store.waiting[_id]
+    assert "lease" not in item and item["status"] == "" and item["failures"] == 1
+
+    api.claim_waiting_item("worker-a")
+    assert api.release_lease(_id, "worker-a", failures=3, max_failures=3)["success"]
+    assert store.waiting[_id]["status"] == "Failed"
+    assert not api.claim_waiting_item("worker-a")["success"]
+
+
+def test_only_the_lease_holder_completes(api, store):
+    _id = store.add_waiting({"source": "test", "status": ""})
+    api.claim_waiting_item("worker-a")
+
+    response = api.complete_waiting_list_item(_id, "000001", "https://example.com/t.jpg", worker_id="worker-b")
+    assert response["status_code"] == 409
+    assert api.complete_waiting_list_item(_id, "000001", "https://example.com/t.jpg")["status_code"] == 409
+    assert store.waiting[_id]["status"] == ""
+
+    response = api.complete_waiting_list_item(_id, "000001", "https://example.com/t.jpg", worker_id="worker-a")
+    assert response["success"]
+    item = store.waiting[_id]
+    assert item["status"] == "Completed" and "lease" not in item and "workerId" not in item
+    assert api.renew_lease(_id, "worker-a")["status_code"] == 409
+
+
+def test_items_without_a_lease_complete_as_before(api, store):
+    _id = store.add_waiting({"source": "test", "status": ""})
+    assert api.get_one_from_waiting_list()["data"]["_id"] == _id
+    assert api.complete_waiting_list_item(_id, "000001", "https://example.com/t.jpg")["success"]
+    assert store.waiting[_id]["status"] == "Completed"
+
+
+def test_assigned_items_are_handed_out_once_until_released(api, store):
+    first = store.add_waiting({"source": "test", "status": "", "assign": ""})
+    second = store.add_waiting({"source": "test", "status": "", "assign": ""})
+    assert api.get_one_from_waiting_list()["data"]["_id"] == first
+    assert api.get_one_from_waiting_list()["data"]["_id"] == second
+    assert not api.get_one_from_waiting_list()["success"]
+
+    assert api.release_waiting_list_item(first, failures=1, note="timeout")["success"]
+    assert api.get_one_from_waiting_list()["data"]["_id"] == first
@@ -0,0 +1,49 @@
+import asyncio
+import time
+
+from pexels_harvester import TokenBucket, portrait_photos
+
+
+def test_headers_with_quota_left_keep_the_configured_rate():
+    bucket = TokenBucket(rate_per_hour=200, burst=10)
+    bucket.update_from_headers({"X-Ratelimit-Remaining": "5", "X-Ratelimit-Reset": str(int(time.time()) + 30 * 86400)})
+    assert bucket.rate == 200 / 3600.0
+    assert bucket.tokens == 5
+    assert bucket.blocked_until == 0.0
+
+
+def test_exhausted_quota_blocks_until_reset_only():
+    bucket = TokenBucket()
+    bucket.update_from_headers({"X-Ratelimit-Remaining": "0", "X-Ratelimit-Reset": str(int(time.time()) + 60)})
+    assert bucket.tokens == 0
+    assert 50 < bucket.blocked_until - time.monotonic() <= 61
+    # Later headers with quota left lift the block
+    bucket.update_from_headers({"X-Ratelimit-Remaining": "100", "X-Ratelimit-Reset": str(int(time.time()) + 60)})
+    assert bucket.blocked_until == 0.0
+
+
+def test_bad_headers_are_ignored():
+    bucket = TokenBucket(burst=3)
+    bucket.update_from_headers({})
+    assert bucket.tokens == 3
+
+
+def test_acquire_spends_burst_without_waiting():
+    bucket = TokenBucket(rate_per_hour=3600, burst=3)
+
+    async def take(n):
+        for _ in range(n):
+            await bucket.acquire()
+
+    started = time.monotonic()
+    asyncio.run(take(3))
+    assert time.monotonic() - started < 0.5
+    assert bucket.tokens < 1
+
+
+def test_portrait_photos_filters_landscape():
+    photos = [
+        {"width": 1000, "height": 2000, "src": {"original": "https://images.pexels.com/photos/1/a.jpeg"}},
+        {"width": 2000, "height": 1000, "src": {"original": "https://images.pexels.com/photos/2/b.jpeg"}},
+    ]
+    assert list(portrait_photos(photos)) == ["https://images.pexels.com/photos/1/a.jpeg"]
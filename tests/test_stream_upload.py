@@ -0,0 +1,249 @@
+import asyncio
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+import stream_upload
+from stream_upload import (TransientUploadError, UPLOAD_GRANULARITY, _committed_from_response,
+                           put_chunk_with_retry, stream_url_to_firebase, upload_file_resumable)
+
+CHUNK = UPLOAD_GRANULARITY
+
+
+class FakeResumableSession:
+    """
+    A GCS resumable upload session plus a download URL, served by aiohttp.
+
+    `script` decides what happens to each chunk PUT, in order (then "ok"):
+        "ok"             keep the chunk, answer with the committed range
+        int              answer with that status and keep nothing (e.g. 503)
+        ("stored", int)  keep the chunk but answer with that status (response lost)
+        ("partial", n)   keep only the first n bytes of the chunk
+        "no_range"       keep nothing, answer 308 without a Range header
+        "lost"           keep the chunk, but claim only 10 bytes are committed
+    """
+
+    def __init__(self, source=b""):
+        self.source = source
+        self.received = bytearray()
+        self.total = None
+        self.script = []
+        self.requests = []  # (Content-Range, body length) of every PUT, status queries included
+        self.url = ""
+
+    async def upload(self, request):
+        content_range = request.headers["Content-Range"]
+        body = await request.read()
+        self.requests.append((content_range, len(body)))
+        span, total = content_range.split(" ")[1].split("/")
+        if total != "*":
+            self.total = int(total)
+        if span == "*" or not body:
+            return self.status()
+
+        action = self.script.pop(0) if self.script else "ok"
+        if isinstance(action, int):
+            return web.Response(status=action, text="try again")
+        start = int(span.split("-")[0])
+        if start == len(self.received) and action != "no_range":
+            keep = body[:action[1]] if action[0] == "partial" else body
+            self.received.extend(keep)
+        if action == "lost":
+            return web.Response(status=308, headers={"Range": "bytes=0-9"})
+        if action[0] == "stored":
+            return web.Response(status=action[1], text="response lost")
+        return self.status()
+
+    def status(self):
+        if self.total is not None and len(self.received) == self.total:
+            return web.Response(status=200, text="{}")
+        if not self.received:
+            return web.Response(status=308)
+        return web.Response(status=308, headers={"Range": f"bytes=0-{len(self.received) - 1}"})
+
+    async def download(self, request):
+        return web.Response(body=self.source)
+
+
+def run_with_fake(test, source=b""):
+    """Start the fake on a free port and run test(fake, http session)."""
+    async def main():
+        fake = FakeResumableSession(source)
+        app = web.Application()
+        app.router.add_put("/upload", fake.upload)
+        app.router.add_get("/source.png", fake.download)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        fake.url = f"http://127.0.0.1:{port}"
+        try:
+            async with aiohttp.ClientSession() as session:
+                return await test(fake, session)
+        finally:
+            await runner.cleanup()
+
+    return asyncio.run(main())
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(stream_upload, "RETRY_BACKOFF_SECONDS", 0.0)
+
+
+def test_committed_from_response():
+    assert _committed_from_response(308, {"Range": "bytes=0-99"}, None) == 100
+    assert _committed_from_response(308, {}, None) == 0
+    assert _committed_from_response(200, {}, 100) is None
+    assert _committed_from_response(503, {}, None) == -1
+
+
+def test_308_without_range_resends_the_chunk():
+    data = bytes(range(256)) * (CHUNK // 256)
+
+    async def test(fake, session):
+        fake.script = ["no_range"]
+        committed = await put_chunk_with_retry(session, f"{fake.url}/upload", data, 0)
+        assert committed == CHUNK
+        assert fake.requests == [(f"bytes 0-{CHUNK - 1}/*", CHUNK)] * 2
+        assert fake.received == data
+
+    run_with_fake(test)
+
+
+def test_partial_commit_resends_only_the_tail():
+    data = bytes(range(256)) * (CHUNK // 256)
+
+    async def test(fake, session):
+        fake.script = [("partial", 1000)]
+        committed = await put_chunk_with_retry(session, f"{fake.url}/upload", data, 0)
+        assert committed == CHUNK
+        assert fake.requests[1] == (f"bytes 1000-{CHUNK - 1}/*", CHUNK - 1000)
+        assert fake.received == data
+
+    run_with_fake(test)
+
+
+def test_transient_errors_are_retried_after_a_status_query():
+    data = b"x" * 100
+
+    async def test(fake, session):
+        fake.script = [503, 429]
+        committed = await put_chunk_with_retry(session, f"{fake.url}/upload", data, 0, total=100)
+        assert committed == 100
+        # chunk, query, chunk, query, chunk
+        assert [content_range for content_range, _ in fake.requests] == \
+            ["bytes 0-99/100", "bytes */100", "bytes 0-99/100", "bytes */100", "bytes 0-99/100"]
+
+    run_with_fake(test)
+
+
+def test_gives_up_after_max_retries():
+    async def test(fake, session):
+        fake.script = [503, 503, 503]
+        with pytest.raises(TransientUploadError):
+            await put_chunk_with_retry(session, f"{fake.url}/upload", b"x" * 100, 0, total=100, max_retries=2)
+        assert sum(1 for content_range, _ in fake.requests if content_range == "bytes 0-99/100") == 3
+
+    run_with_fake(test)
+
+
+def test_client_errors_are_not_retried():
+    async def test(fake, session):
+        fake.script = [403]
+        with pytest.raises(RuntimeError, match="HTTP 403"):
+            await put_chunk_with_retry(session, f"{fake.url}/upload", b"x" * 100, 0, total=100)
+        assert len(fake.requests) == 1
+
+    run_with_fake(test)
+
+
+def test_committed_before_the_chunk_is_an_error():
+    async def test(fake, session):
+        await put_chunk_with_retry(session, f"{fake.url}/upload", b"a" * CHUNK, 0)
+        fake.script = ["lost"]
+        with pytest.raises(RuntimeError, match="lost data"):
+            await put_chunk_with_retry(session, f"{fake.url}/upload", b"b" * CHUNK, CHUNK)
+
+    run_with_fake(test)
+
+
+def stub_storage(monkeypatch, fake):
+    import utility
+
+    class Bucket:
+        name = "bucket"
+
+    monkeypatch.setattr(stream_upload, "start_upload_session", lambda blob_name, content_type: f"{fake.url}/upload")
+    monkeypatch.setattr(utility, "get_bucket", lambda: Bucket())
+
+
+@pytest.mark.parametrize("size", [2 * CHUNK, 2 * CHUNK + 123, 100])
+def test_stream_copies_the_body(monkeypatch, size):
+    source = bytes(i % 251 for i in range(size))
+
+    async def test(fake, session):
+        stub_storage(monkeypatch, fake)
+        url, blob_name = await stream_url_to_firebase(f"{fake.url}/source.png", "upscaled", chunk_size=CHUNK)
+        assert blob_name.startswith("images/upscaled/") and blob_name.endswith(".png")
+        assert url and blob_name in url.replace("%2F", "/")
+        assert fake.received == source and fake.total == size
+        return fake.requests
+
+    requests = run_with_fake(test, source)
+    # Only the last request carries the total
+    assert all(content_range.endswith("/*") for content_range, _ in requests[:-1])
+    if size % CHUNK == 0:
+        # The body ends on a chunk boundary: the end marker finalises with an empty PUT
+        assert requests[-1] == (f"bytes */{size}", 0)
+    else:
+        assert requests[-1] == (f"bytes {size // CHUNK * CHUNK}-{size - 1}/{size}", size % CHUNK)
+
+
+def test_stream_gives_up_on_a_failed_chunk(monkeypatch):
+    async def test(fake, session):
+        stub_storage(monkeypatch, fake)
+        fake.script = [403]
+        return await stream_url_to_firebase(f"{fake.url}/source.png", "upscaled", chunk_size=CHUNK)
+
+    assert run_with_fake(test, b"x" * 1000) == (None, None)
+
+
+def data_requests(requests):
+    """(start, end, total) of each PUT that carried bytes."""
+    spans = []
+    for content_range, length in requests:
+        span, total = content_range.split(" ")[1].split("/")
+        if span != "*":
+            start, end = map(int, span.split("-"))
+            assert end - start + 1 == length
+            spans.append((start, end, total))
+    return spans
+
+
+@pytest.mark.parametrize("size", [2 * CHUNK + 100, 2 * CHUNK])
+def test_file_upload_resumes_from_the_committed_offset(monkeypatch, tmp_path, size):
+    path = tmp_path / "a.jpg"
+    content = bytes(i % 253 for i in range(size))
+    path.write_bytes(content)
+
+    async def test(fake, session):
+        monkeypatch.setattr(stream_upload, "start_upload_session", lambda blob_name, content_type: f"{fake.url}/upload")
+        # First chunk only half arrives, the second arrives but its answer is lost
+        fake.script = [("partial", CHUNK // 2), ("stored", 503)]
+        # A chunk size that isn't a multiple of 256 KiB is rounded down
+        uploaded = await upload_file_resumable(str(path), "images/LD/a.jpg", chunk_size=CHUNK + 1000)
+        assert uploaded == size
+        assert fake.received == content and fake.total == size
+        return fake.requests
+
+    spans = data_requests(run_with_fake(test))
+    # Every PUT starts where the server had committed up to
+    expected = [(0, CHUNK - 1), (CHUNK // 2, CHUNK - 1), (CHUNK, 2 * CHUNK - 1)]
+    if size > 2 * CHUNK:
+        expected.append((2 * CHUNK, size - 1))
+    assert [(start, end) for start, end, _ in spans] == expected
+    # Only the last chunk carries the total
+    assert [total for _, _, total in spans] == ["*"] * (len(spans) - 1) + [str(size)]
@@ -0,0 +1,32 @@
+from url_dedupe import UrlIndex, canonicalize_url
+
+
+def test_pexels_forms_share_a_key():
+    assert canonicalize_url("https://images.pexels.com/photos/123/pexels-photo-123.jpeg?auto=compress&w=600") == "pexels:123"
+    assert canonicalize_url("https://www.pexels.com/photo/red-sky-123/") == "pexels:123"
+
+
+def test_discord_cdn_and_proxy_share_a_key():
+    cdn = "https://cdn.discordapp.com/attachments/1/2/a.png?ex=1&is=2&hm=3"
+    proxy = "https://media.discordapp.net/attachments/1/2/a.png?width=400&height=300&format=webp"
+    assert canonicalize_url(cdn) == canonicalize_url(proxy) == "discord:1/2/a.png"
+
+
+def test_tracking_params_dropped_and_query_sorted():
+    url = "https://Example.com/img.jpg?b=2&utm_source=x&fbclid=y&a=1#top"
+    assert canonicalize_url(url) == "example.com/img.jpg?a=1&b=2"
+
+
+def test_size_params_kept_on_other_hosts():
+    small = canonicalize_url("https://cdn.example.com/img?id=7&w=400&format=webp")
+    large = canonicalize_url("https://cdn.example.com/img?id=7&w=1600&format=jpg")
+    assert small != large
+
+
+def test_index_persists_and_dedupes(tmp_path):
+    index = UrlIndex(str(tmp_path))
+    assert index.add_many(["https://images.pexels.com/photos/5/a.jpeg", "https://www.pexels.com/photo/5/"]) == 1
+    assert not index.add("https://images.pexels.com/photos/5/b.jpeg?w=10")
+    reloaded = UrlIndex(str(tmp_path))
+    assert reloaded.contains("https://pexels.com/photo/x-5/")
+    assert not reloaded.contains("https://images.pexels.com/photos/6/a.jpeg")
@@ -0,0 +1,79 @@
+from datetime import datetime, timezone
+
+from waiting_scheduler import URGENT_PRIORITY, WaitingScheduler, format_queue_stats, item_created_at
+
+NOW = 1_700_000_000.0
+
+
+def item(_id, source, hours_ago=0.0, priority=0, **extra):
+    return {"_id": _id, "source": source, "priority": priority, "status": "",
+            "createdAt": _iso(NOW - hours_ago * 3600), **extra}
+
+
+def _iso(epoch):
+    return datetime.fromtimestamp(epoch, timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def test_created_at_from_object_id():
+    assert item_created_at({"_id": "65a1b2c3" + "0" * 16}) == float(0x65a1b2c3)
+    assert item_created_at({"_id": "short"}) is None
+
+
+def test_urgent_item_goes_first():
+    items = [item("old", "pexels.com API", hours_ago=48), item("urgent", "discord", priority=URGENT_PRIORITY)]
+    assert WaitingScheduler().pick(items, NOW)["_id"] == "urgent"
+
+
+def test_sources_share_slots_by_weight():
+    scheduler = WaitingScheduler(weights={"discord": 2.0, "pexels.com API": 1.0})
+    items = [item(f"d{i}", "discord", hours_ago=1) for i in range(10)] + \
+            [item(f"p{i}", "pexels.com API", hours_ago=100) for i in range(10)]
+    picked = []
+    for _ in range(6):
+        chosen = scheduler.pick(items, NOW)
+        picked.append(chosen["source"])
+        items.remove(chosen)
+    assert picked.count("discord") == 4 and picked.count("pexels.com API") == 2
+
+
+def test_aging_lets_old_low_priority_items_through():
+    scheduler = WaitingScheduler(aging_per_hour=1.0)
+    items = [item("new", "discord", hours_ago=0, priority=5), item("old", "discord", hours_ago=10)]
+    assert scheduler.pick(items, NOW)["_id"] == "old"
+
+
+def test_finished_and_leased_items_are_skipped():
+    items = [item("done", "discord", hours_ago=5, status="Completed"),
+             item("leased", "discord", hours_ago=4, lease={"workerId": "b", "expiresAt": NOW + 60}),
+             item("assigned", "discord", hours_ago=3.5, assign="midjourney"),
+             item("expired", "discord", hours_ago=3, assign="midjourney",
+                  lease={"workerId": "b", "expiresAt": NOW - 60})]
+    scheduler = WaitingScheduler()
+    assert scheduler.pick(items, NOW)["_id"] == "expired"
+    assert scheduler.pick(items[:3], NOW) is None
+
+
+def test_queue_stats():
+    scheduler = WaitingScheduler()
+    items = [item("a", "discord", hours_ago=2), item("b", "discord", hours_ago=4),
+             item("u", "discord", hours_ago=1, priority=URGENT_PRIORITY)]
+    scheduler.pick(items, NOW)
+    stats = scheduler.queue_stats(items[:2], NOW)
+    assert stats["discord"]["depth"] == 2 and stats["discord"]["oldest_wait"] == 4 * 3600
+    assert stats["urgent"] == {"depth": 0, "oldest_wait": 0.0, "mean_wait": 0.0, "picked": 1, "last_wait": 3600}
+    assert "urgent" in format_queue_stats(stats)
+
+
+def test_urgent_item_behind_a_full_window_is_picked():
+    items = [item(f"d{i}", "discord", hours_ago=100 + i) for i in range(250)]
+    items.append(item("urgent", "discord", priority=URGENT_PRIORITY))
+    scheduler = WaitingScheduler(window_per_source=200)
+    assert len(scheduler.candidates(items, NOW)["discord"]) == 200
+    assert scheduler.pick(items, NOW)["_id"] == "urgent"
+
+
+def test_window_keeps_the_highest_effective_priority():
+    items = [item(f"d{i}", "discord", hours_ago=2 + i) for i in range(5)]
+    items.append(item("high", "discord", hours_ago=1, priority=8))
+    window = WaitingScheduler(window_per_source=3).candidates(items, NOW)["discord"]
+    assert [candidate["_id"] for candidate in window] == ["high", "d4", "d3"]
@@ -0,0 +1,62 @@
+import threading
+
+import pytest
+
+from api.local_server import make_server
+from api.wallpaper_api import WallpaperAPI
+
+
+@pytest.fixture
+def api():
+    server = make_server(port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield WallpaperAPI(f"http://127.0.0.1:{server.server_port}")
+    server.shutdown()
+
+
+def test_bulk_add_is_batched(api, monkeypatch):
+    calls = []
+    make_request = api._make_request
+
+    def counting(method, endpoint, data=None):
+        calls.append(endpoint)
+        return make_request(method, endpoint, data)
+
+    monkeypatch.setattr(api, "_make_request", counting)
+    items = [{"source": "test", "url": f"https://example.com/{i}.jpg"} for i in range(5)]
+    response = api.add_waiting_items_bulk(items, batch_size=2)
+    assert response["success"] and len(response["results"]) == 5
+    assert calls == ["/api/items/waiting/bulk"] * 3
+
+
+def test_unknown_item_fails_only_its_operation(api):
+    item_id = api._make_request("POST", "/api/items", {"title": "x"})["message"]
+    response = api.patch_data_by_field_bulk([(item_id, "title", "y"), ("missing", "title", "z")])
+    assert not response["success"]
+    assert response["failed"] == [1]
+
+
+def test_missing_bulk_endpoint_falls_back_to_single_requests(monkeypatch):
+    api = WallpaperAPI("http://backend.invalid")
+    calls = []
+
+    def fake_request(method, endpoint, data=None):
+        calls.append(endpoint)
+        if endpoint.endswith("/bulk"):
+            return {"success": False, "message": "Error: Not Found", "status_code": 404}
+        return {"success": True, "message": "ok", "status_code": 200}
+
+    monkeypatch.setattr(api, "_make_request", fake_request)
+    items = [{"source": "test", "url": f"https://example.com/{i}.jpg"} for i in range(3)]
+    response = api.add_waiting_items_bulk(items, batch_size=2)
+    assert response["success"] and len(response["results"]) == 3
+    # The bulk route is tried once, then remembered as unsupported
+    assert calls == ["/api/items/waiting/bulk"] + ["/api/items/waiting"] * 3
+
+
+def test_server_error_fails_the_batch_without_fallback(monkeypatch):
+    api = WallpaperAPI("http://backend.invalid")
+    monkeypatch.setattr(api, "_make_request",
+                        lambda method, endpoint, data=None: {"success": False, "message": "Error: boom", "status_code": 500})
+    response = api.add_waiting_items_bulk([{"url": "a"}, {"url": "b"}])
+    assert response["failed"] == [0, 1]
@@ -0,0 +1,192 @@
+"""
+Local duplicate detection for waiting-list ingestion.
+
+Every URL is reduced to a canonical key first (so the many forms of the same
+Pexels photo or Discord attachment compare equal), then checked against a
+persistent set of source URLs already in the waiting list. Duplicates are
+rejected without a backend call.
+
+Seed from the existing waiting list once with:
+
+    python3 url_dedupe.py --seed
+"""
+
+import os
+import re
+import threading
+from typing import Iterable
+from urllib.parse import urlsplit, parse_qsl, urlencode, unquote
+
+DEDUPE_FOLDER = "data"
+SEEN_FILE = os.path.join(DEDUPE_FOLDER, "url_seen.txt")
+
+# Query parameters that never change which image a URL points to, on any host
+TRACKING_PARAMS = {
+    "fbclid", "gclid", "dclid", "msclkid", "igshid", "mc_cid", "mc_eid", "ref", "ref_src", "si",
+}
+
+_PEXELS_HOSTS = ("images.pexels.com", "pexels.com")
+_DISCORD_HOSTS = ("cdn.discordapp.com", "media.discordapp.net")
+
+# Per-host parameters that only select a size or signature of the same image. On other
+# hosts (generic CDNs) w/h/format can name different files, so they are kept there.
+HOST_PARAMS = {
+    # Pexels resize options (the photo id identifies the image)
+    _PEXELS_HOSTS: {"auto", "cs", "w", "h", "dpr", "fit", "crop"},
+    # Discord CDN signature / expiry and media proxy resize options
+    _DISCORD_HOSTS: {"ex", "is", "hm", "width", "height", "format", "quality"},
+}
+
+_PEXELS_IMAGE_PATH = re.compile(r"^/photos/(\d+)/")
+_PEXELS_PAGE_PATH = re.compile(r"^/(?:[a-z]{2}-[a-z]{2}/)?photo/(?:[^/]*-)?(\d+)/?$")
+
+
+def _ignored_params(host: str) -> set:
+    ignored = set(TRACKING_PARAMS)
+    for hosts, params in HOST_PARAMS.items():
+        if host in hosts:
+            ignored |= params
+    return ignored
+
+
+def canonicalize_url(url: str) -> str:
+    """
+    Reduce a URL to a key that is equal for every form of the same image.
+
+    - Pexels: images.pexels.com/photos/<id>/... and www.pexels.com/photo/<slug>-<id>/ -> "pexels:<id>"
+    - Discord: cdn.discordapp.com and media.discordapp.net attachment URLs -> "discord:<channel>/<attachment>/<file>"
+    - Anything else: lower-cased host, no fragment, no tracking params (plus the Pexels /
+      Discord size params on those hosts), sorted query
+
+    Args:
+        url (str): URL as received
+
+    Returns:
+        str: Canonical key
+    """
+    url = url.strip()
+    parts = urlsplit(url)
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    path = unquote(parts.path) or "/"
+
+    if host == "images.pexels.com":
+        match = _PEXELS_IMAGE_PATH.match(path)
+        if match:
+            return f"pexels:{match.group(1)}"
+    if host == "pexels.com":
+        match = _PEXELS_PAGE_PATH.match(path)
+        if match:
+            return f"pexels:{match.group(1)}"
+
+    if host in _DISCORD_HOSTS and path.startswith(("/attachments/", "/ephemeral-attachments/")):
+        segments = path.strip("/").split("/")
+        return "discord:" + "/".join(segments[1:])
+
+    ignored = _ignored_params(host)
+    query = [
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key.lower() not in ignored and not key.lower().startswith("utm_")
+    ]
+    canonical = f"{host}{path.rstrip('/') or '/'}"
+    if query:
+        canonical += "?" + urlencode(sorted(query))
+    return canonical
+
+
+class UrlIndex:
+    """
+    Persistent set of canonical source keys already queued, kept in memory and
+    appended to a text file (one key per line) as keys are added.
+    """
+
+    def __init__(self, folder: str = DEDUPE_FOLDER):
+        self.seen_path = os.path.join(folder, os.path.basename(SEEN_FILE))
+        self._lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+
+        self.seen = set()
+        if os.path.exists(self.seen_path):
+            with open(self.seen_path, "r", encoding="utf-8") as f:
+                self.seen = {line.strip() for line in f if line.strip()}
+
+    def contains(self, url: str) -> bool:
+        return canonicalize_url(url) in self.seen
+
+    def add(self, url: str) -> bool:
+        """Record a URL. Returns False if it was already known."""
+        return self.add_many([url]) == 1
+
+    def add_many(self, urls: Iterable[str]) -> int:
+        """Record many URLs with one write. Returns the number that were new."""
+        with self._lock:
+            new_keys = []
+            for url in urls:
+                if not url:
+                    continue
+                key = canonicalize_url(url)
+                if key in self.seen:
+                    continue
+                self.seen.add(key)
+                new_keys.append(key)
+
+            if new_keys:
+                with open(self.seen_path, "a", encoding="utf-8") as f:
+                    f.writelines(f"{key}\n" for key in new_keys)
+            return len(new_keys)
+
+
+_url_index = None
+
+
+def get_url_index() -> UrlIndex:
+    """Load the index from disk on first use"""
+    global _url_index
+    if _url_index is None:
+        _url_index = UrlIndex()
+    return _url_index
+
+
+def seed_from_backend(api_client=None) -> int:
+    """
+    Seed the index from the source URL of every waiting-list item (queued or
+    completed). Published items only carry our own Firebase URLs, which never
+    match an incoming source, so they aren't used.
+
+    Returns:
+        int: Number of new keys added
+    """
+    import json
+    from api.wallpaper_api import WallpaperAPI
+
+    api_client = api_client or WallpaperAPI()
+    urls = []
+
+    response = api_client.get_waiting_list()
+    if response["success"]:
+        try:
+            urls.extend(item.get("url", "") for item in json.loads(response["message"]))
+        except (json.JSONDecodeError, AttributeError) as e:
+            print(f"Error parsing waiting list: {e}")
+    else:
+        print(f"Failed to get waiting list: {response['message']}")
+
+    added = get_url_index().add_many(urls)
+    print(f"Seeded URL index: {added} new of {len(urls)} URLs ({len(get_url_index().seen)} total)")
+    return added
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Waiting-list URL dedupe index')
+    parser.add_argument('--seed', action='store_true', help='Seed from the waiting list')
+    parser.add_argument('--check', metavar='URL', help='Show the canonical key and whether it is known')
+    args = parser.parse_args()
+
+    if args.seed:
+        seed_from_backend()
+    if args.check:
+        print(f"key:   {canonicalize_url(args.check)}")
+        print(f"known: {get_url_index().contains(args.check)}")
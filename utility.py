@@ -1,16 +1,22 @@
 import time
-import pyautogui
 import aiohttp
 import os
-from PIL import Image
-import firebase_admin
-from firebase_admin import credentials, storage
 from datetime import datetime
 from dotenv import load_dotenv
 import uuid
 import pytz
 import platform
 import asyncio
+import threading
+import shutil
+import subprocess
+from image_pool import run_image_task
+from blob_names import make_blob_name
+
+# pyautogui, PIL and firebase_admin are imported inside the functions that use them:
+# together they dominate the bot's cold start on the Pi (see startup_timing.py).
+
+_firebase_lock = threading.Lock()
 
 # Load environment variables
 load_dotenv()
@@ -21,68 +27,157 @@ def get_utc_time():
     return utc_now.strftime('%Y%m%d_%H%M%S_')
 
 def initialize_firebase():
-    """Initialize Firebase with the provided configuration"""
-    cred = credentials.Certificate({
-        "type": "service_account",
-        "project_id": "palettex-37930",
-        "private_key_id": os.getenv('FIREBASE_PRIVATE_KEY_ID'),
-        "private_key": os.getenv('FIREBASE_PRIVATE_KEY').replace('\\n', '\n'),
-        "client_email": os.getenv('FIREBASE_CLIENT_EMAIL'),
-        "client_id": os.getenv('FIREBASE_CLIENT_ID'),
-        "auth_uri": "https://accounts.google.com/o/oauth2/auth",
-        "token_uri": "https://oauth2.googleapis.com/token",
-        "auth_provider_x509_cert_url": "https://www.googleapis.com/oauth2/v1/certs",
-        "client_x509_cert_url": os.getenv('FIREBASE_CLIENT_CERT_URL')
-    })
-
-    if not firebase_admin._apps:
+    """
+    Initialize Firebase with the provided configuration.
+
+    Safe to call from several threads at once (the bot starts it in a worker
+    thread while logging in to Discord); only the first call does the work.
+    """
+    import firebase_admin
+    from firebase_admin import credentials
+
+    with _firebase_lock:
+        if firebase_admin._apps:
+            return
+
+        cred = credentials.Certificate({
+            "type": "service_account",
+            "project_id": "palettex-37930",
+            "private_key_id": os.getenv('FIREBASE_PRIVATE_KEY_ID'),
+            "private_key": os.getenv('FIREBASE_PRIVATE_KEY').replace('\\n', '\n'),
+            "client_email": os.getenv('FIREBASE_CLIENT_EMAIL'),
+            "client_id": os.getenv('FIREBASE_CLIENT_ID'),
+            "auth_uri": "https://accounts.google.com/o/oauth2/auth",
+            "token_uri": "https://oauth2.googleapis.com/token",
+            "auth_provider_x509_cert_url": "https://www.googleapis.com/oauth2/v1/certs",
+            "client_x509_cert_url": os.getenv('FIREBASE_CLIENT_CERT_URL')
+        })
+
         firebase_admin.initialize_app(cred, {
             'storageBucket': 'palettex-37930.appspot.com'
         })
 
 
-# when you use blob.make_public(), the URL will have no expiration
-def upload_to_firebase_3(local_file_path, firebase_folder, resolution = ""):
+def get_bucket():
+    """Return the default Firebase Storage bucket, initializing Firebase on first use"""
+    from firebase_admin import storage
+    initialize_firebase()
+    return storage.bucket()
+
+
+# With CONTENT_ADDRESSED_UPLOADS=1, name uploads after the SHA-256 of their bytes (content_store.py)
+CONTENT_ADDRESSED_UPLOADS = os.getenv("CONTENT_ADDRESSED_UPLOADS", "0") == "1"
+# Otherwise lead timestamp + uuid names with a short hash (blob_names.py)
+HASH_PREFIXED_BLOB_NAMES = os.getenv("HASH_PREFIXED_BLOB_NAMES", "1") == "1"
+
+# Object names never get new content (timestamp + uuid, or content hash), so they can be cached forever
+UPLOAD_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# URL form returned for uploads:
+#   "firebase" - firebasestorage.googleapis.com/v0/b/... (served from origin every time)
+#   "public"   - storage.googleapis.com/<bucket>/<blob>, cached by Google's edge per Cache-Control
+#   or set CDN_BASE_URL to a CDN in front of the bucket (e.g. https://cdn.example.com)
+PUBLIC_URL_STYLE = os.getenv("PUBLIC_URL_STYLE", "firebase")
+CDN_BASE_URL = os.getenv("CDN_BASE_URL", "")
+
+def public_blob_url(bucket_name, blob_name):
+    """URL of a public blob in the configured PUBLIC_URL_STYLE (Firebase, storage.googleapis.com or CDN)"""
+    from urllib.parse import quote
+
+    if CDN_BASE_URL:
+        return f"{CDN_BASE_URL.rstrip('/')}/{quote(blob_name)}"
+    if PUBLIC_URL_STYLE == "public":
+        return f"https://storage.googleapis.com/{bucket_name}/{quote(blob_name)}"
+    return (
+        f"https://firebasestorage.googleapis.com/v0/b/{bucket_name}"
+        f"/o/{blob_name.replace('/', '%2F')}?alt=media"
+    )
+
+def _find_uploaded_content(bucket, digest, file_ext):
+    """Blob name of already uploaded, public bytes with this digest, or None"""
+    from google.api_core.exceptions import NotFound
+    from content_store import get_upload_index, content_blob_name
+
+    index = get_upload_index()
+    known = index.get(digest)
+    blob_name = known or content_blob_name(digest, file_ext)
+    blob = bucket.blob(blob_name)
+    if not known and not blob.exists():
+        return None
+
+    # The returned URL needs public read; the ACL may have changed since the blob was uploaded
+    try:
+        blob.make_public()
+    except NotFound:
+        return None  # deleted since it was indexed: upload it again
+    if not known:
+        index.add(digest, blob_name)
+    return blob_name
+
+def _plan_upload(bucket, local_file_path, firebase_folder, resolution, content_addressed):
+    """
+    Pick the object name for an upload.
+
+    Returns:
+        tuple: (blob name, content digest or None, True if those bytes are already stored)
+    """
+    file_ext = os.path.splitext(local_file_path)[1]
+
+    if content_addressed:
+        from content_store import file_digest, content_blob_name
+
+        digest = file_digest(local_file_path)
+        existing_blob_name = _find_uploaded_content(bucket, digest, file_ext)
+        if existing_blob_name:
+            return existing_blob_name, digest, True
+        return content_blob_name(digest, file_ext), digest, False
+
+    # Create unique filename with UTC timestamp and UUID, led by a hash prefix
+    # so parallel uploads don't all land in one key range (see blob_names.py)
+    return make_blob_name(firebase_folder, file_ext, get_utc_time(), resolution, hashed=HASH_PREFIXED_BLOB_NAMES), None, False
+
+def _record_upload(digest, blob_name):
+    if digest:
+        from content_store import get_upload_index
+        get_upload_index().add(digest, blob_name)
+
+# the blob is uploaded with a public ACL, so the URL will have no expiration
+def upload_to_firebase_3(local_file_path, firebase_folder, resolution = "", content_addressed = None):
     """
     Uploads an image to Firebase Storage and returns a non-signed download URL
 
+    Single request; for multi-MB files on a flaky connection use
+    upload_to_firebase_resumable instead.
+
     Args:
         local_file_path (str): The local path to the image file
         firebase_folder (str): The folder name in Firebase Storage (e.g., 'thumbnail', 'upscaled')
+        content_addressed (bool): Name the blob after the hash of its bytes and skip the upload
+                                  when those bytes are already stored (default CONTENT_ADDRESSED_UPLOADS)
 
     Returns:
         str: The Firebase Storage download URL of the uploaded file
     """
+    if content_addressed is None:
+        content_addressed = CONTENT_ADDRESSED_UPLOADS
+
     try:
         # Get bucket
-        bucket = storage.bucket()
-
-        # Get the base filename from the local path
-        filename = os.path.basename(local_file_path)
-        file_ext = os.path.splitext(local_file_path)[1]
+        bucket = get_bucket()
 
-        # Create unique filename with UTC timestamp and UUID
-        time_string = get_utc_time()
-        resolution_name = ""
-        if resolution != "":
-            resolution_name = resolution + "_"
-        firebase_filename = f"{time_string}{firebase_folder}_{resolution_name}{str(uuid.uuid4())}{file_ext}"
+        destination_blob_name, digest, already_uploaded = _plan_upload(bucket, local_file_path, firebase_folder, resolution, content_addressed)
+        if already_uploaded:
+            print(f"Same bytes already in Firebase Storage, upload skipped: {destination_blob_name}")
+            return public_blob_url(bucket.name, destination_blob_name), destination_blob_name
 
-        # Create the full path in Firebase Storage
-        destination_blob_name = f'images/{firebase_folder}/{firebase_filename}'
-
-        # Upload the file
+        # Upload the file, public and with cache metadata in the same request (no make_public() round trip)
         blob = bucket.blob(destination_blob_name)
-        blob.upload_from_filename(local_file_path)
-
-        # Make the blob publicly accessible
-        blob.make_public()
+        blob.cache_control = UPLOAD_CACHE_CONTROL
+        blob.upload_from_filename(local_file_path, predefined_acl="publicRead")
+        _record_upload(digest, destination_blob_name)
 
         # Construct the Firebase Storage download URL
-        download_url = (
-            f"https://firebasestorage.googleapis.com/v0/b/{bucket.name}"
-            f"/o/{destination_blob_name.replace('/', '%2F')}?alt=media"
-        )
+        download_url = public_blob_url(bucket.name, destination_blob_name)
 
         print(f"File uploaded successfully to Firebase Storage: {destination_blob_name}")
         #print(f"Download URL: {download_url}")
@@ -93,6 +188,112 @@ def upload_to_firebase_3(local_file_path, firebase_folder, resolution = ""):
         print(f"Error upload_to_firebase_3(): {e}")
         return None, None  # Return both values as None instead of just None
 
+async def upload_to_firebase_resumable(local_file_path, firebase_folder, resolution = "", content_addressed = None,
+                                       chunk_size = None, max_retries = None):
+    """
+    Same as upload_to_firebase_3, but as a chunked resumable upload: each chunk is
+    retried with backoff and a failure resumes from the last committed offset
+    instead of starting over (see stream_upload.upload_file_resumable).
+
+    Args:
+        chunk_size (int): Bytes per request (default stream_upload.CHUNK_SIZE, multiple of 256 KiB)
+        max_retries (int): Retries per chunk (default stream_upload.MAX_CHUNK_RETRIES)
+
+    Returns:
+        tuple: (download URL, blob name), or (None, None) if the upload failed
+    """
+    from stream_upload import upload_file_resumable, CHUNK_SIZE, MAX_CHUNK_RETRIES
+
+    if content_addressed is None:
+        content_addressed = CONTENT_ADDRESSED_UPLOADS
+
+    try:
+        bucket = get_bucket()
+        destination_blob_name, digest, already_uploaded = await asyncio.to_thread(
+            _plan_upload, bucket, local_file_path, firebase_folder, resolution, content_addressed)
+        if already_uploaded:
+            print(f"Same bytes already in Firebase Storage, upload skipped: {destination_blob_name}")
+            return public_blob_url(bucket.name, destination_blob_name), destination_blob_name
+
+        await upload_file_resumable(local_file_path, destination_blob_name,
+                                    chunk_size=chunk_size or CHUNK_SIZE, max_retries=max_retries or MAX_CHUNK_RETRIES)
+        _record_upload(digest, destination_blob_name)
+
+        print(f"File uploaded successfully to Firebase Storage: {destination_blob_name} (resumable)")
+        return public_blob_url(bucket.name, destination_blob_name), destination_blob_name
+
+    except Exception as e:
+        print(f"Error upload_to_firebase_resumable(): {e}")
+        return None, None
+
+def delete_uploaded_blobs(blob_names):
+    """
+    Delete the blobs of a job that was given up on.
+
+    Content-addressed blobs are kept: other items may share them, and the next
+    attempt at the same item finds them already uploaded.
+
+    Returns:
+        int: Number of blobs deleted
+    """
+    from blob_names import parse_blob_name
+
+    deleted = 0
+    bucket = None
+    for blob_name in dict.fromkeys(name for name in blob_names if name):
+        parts = parse_blob_name(blob_name)
+        if parts and parts["scheme"] == "content":
+            continue
+        try:
+            bucket = bucket or get_bucket()
+            bucket.blob(blob_name).delete()
+            deleted += 1
+        except Exception as e:
+            print(f"Error deleting {blob_name}: {e}")
+    return deleted
+
+
+def convert_downloaded_image(input_path, filename, prefix, output_folder):
+    """
+    Convert a downloaded PNG to JPEG (other formats are moved as-is) and add the
+    "<prefix>_<width>x<height>_" filename prefix.
+
+    Returns:
+        str: Path of the file in output_folder
+    """
+    from PIL import Image
+
+    # Convert PNG to JPG if it's a PNG file
+    if filename.lower().endswith('.png'):
+        with Image.open(input_path) as im:
+            # Convert to RGB mode if necessary
+            if im.mode in ('RGBA', 'LA') or (im.mode == 'P' and 'transparency' in im.info):
+                bg = Image.new('RGB', im.size, (255, 255, 255))
+                if im.mode == 'RGBA':
+                    bg.paste(im, mask=im.split()[3])
+                else:
+                    bg.paste(im)
+                im = bg
+
+            width, height = im.size
+            resolution_name = f"{prefix}_{width}x{height}_"
+
+            # Change extension to jpg
+            jpg_filename = os.path.splitext(filename)[0] + '.jpg'
+            output_path = os.path.join(output_folder, f"{resolution_name}{jpg_filename}")
+
+            # Save as JPG
+            im.save(output_path, 'JPEG', quality=95)
+            os.remove(input_path)
+    else:
+        # Handle non-PNG files
+        with Image.open(input_path) as im:
+            width, height = im.size
+        resolution_name = f"{prefix}_{width}x{height}_"
+        output_path = os.path.join(output_folder, f"{resolution_name}{filename}")
+        os.rename(input_path, output_path) # the input_path will no longer exist after rename
+
+    return output_path
 
 async def download_and_convert_image(url, filename, prefix):
     try:
@@ -112,37 +313,8 @@ async def download_and_convert_image(url, filename, prefix):
                     with open(input_path, "wb") as f:
                         f.write(await response.read())
 
-                    output_path = None
-
-                    # Convert PNG to JPG if it's a PNG file
-                    if filename.lower().endswith('.png'):
-                        with Image.open(input_path) as im:
-                            # Convert to RGB mode if necessary
-                            if im.mode in ('RGBA', 'LA') or (im.mode == 'P' and 'transparency' in im.info):
-                                bg = Image.new('RGB', im.size, (255, 255, 255))
-                                if im.mode == 'RGBA':
-                                    bg.paste(im, mask=im.split()[3])
-                                else:
-                                    bg.paste(im)
-                                im = bg
-
-                            width, height = im.size
-                            resolution_name = f"{prefix}_{width}x{height}_"
-
-                            # Change extension to jpg
-                            jpg_filename = os.path.splitext(filename)[0] + '.jpg'
-                            output_path = os.path.join(output_folder, f"{resolution_name}{jpg_filename}")
-
-                            # Save as JPG
-                            im.save(output_path, 'JPEG', quality=95)
-                            os.remove(input_path)
-                    else:
-                        # Handle non-PNG files
-                        with Image.open(input_path) as im:
-                            width, height = im.size
-                            resolution_name = f"{prefix}_{width}x{height}_"
-                            output_path = os.path.join(output_folder, f"{resolution_name}{filename}")
-                            os.rename(input_path, output_path) # the input_path will no longer exist after rename
+                    # Pillow work runs in the image process pool, off the event loop
+                    output_path = await run_image_task(convert_downloaded_image, input_path, filename, prefix, output_folder)
 
                     return output_path  # Return the path of the saved file
 
@@ -155,12 +327,15 @@ async def download_and_convert_image(url, filename, prefix):
         return None
 
 
-async def download_image(url):
+async def download_image(url, probe=None):
     """
     Downloads a JPG image from a URL and returns the local file path.
 
     Args:
         url (str): The URL of the JPG image to download
+        probe (ImageProbe): Optional open probe from image_url_detection.probe_image_url();
+                            its buffered prefix and open response are reused so the
+                            image is not fetched a second time
 
     Returns:
         str: The local path to the downloaded image file, or empty string if failed
@@ -174,6 +349,16 @@ async def download_image(url):
         unique_id = str(uuid.uuid4())
         local_file_path = os.path.join(output_folder, f"download_{get_utc_time()}{unique_id}.jpg")
 
+        if probe is not None and probe.response is not None:
+            # Continue the validation request instead of starting a new one
+            async with probe:
+                with open(local_file_path, "wb") as f:
+                    async for chunk in probe.iter_body():
+                        f.write(chunk)
+
+            print(f"Successfully downloaded image from {url} to {local_file_path} (reused probe)")
+            return local_file_path
+
         # Download the image directly using aiohttp
         async with aiohttp.ClientSession() as session:
             async with session.get(url, timeout=30) as response:
@@ -192,16 +377,86 @@ async def download_image(url):
         print(f"Error in download_image: {e}")
         return ""
 
-async def resize_image(target_file, prefix, reduce_size = 0.5, reduce_quality = 100):
+def save_jpeg(img, output_path, quality, target_bytes=None, min_similarity=None):
+    """
+    Save an image as JPEG, either at a fixed quality or with the quality searched
+    per image (image_encoder.encode_jpeg) when a byte budget or SSIM floor is given.
+
+    Returns:
+        dict: The encoding settings used (quality, and subsampling/progressive/bytes if searched)
+    """
+    if target_bytes is None and min_similarity is None:
+        img.save(output_path, 'JPEG', quality=quality)
+        return {"quality": quality}
+
+    from image_encoder import encode_jpeg
+    return encode_jpeg(img, output_path, target_bytes=target_bytes, min_similarity=min_similarity)
+
+# JPEG draft mode decodes at 1/2, 1/4 or 1/8 in the DCT domain. Decode at least
+# this many times the target size so the final LANCZOS pass keeps the detail.
+DRAFT_OVERSAMPLE = 2
+
+def load_resized(target_file, reduce_size, fast_decode=True):
+    """
+    Decode an image and scale it by reduce_size.
+
+    With fast_decode, JPEGs are decoded directly at a reduced scale (Image.draft)
+    when the target is small enough, then LANCZOS-resized to the exact size.
+
+    Returns:
+        tuple: (resized RGB image, (original_width, original_height), (new_width, new_height))
+    """
+    from PIL import Image
+
+    with Image.open(target_file) as img:
+        original_width, original_height = img.size
+        new_width = int(original_width * reduce_size)
+        new_height = int(original_height * reduce_size)
+
+        if fast_decode and img.format == 'JPEG' and reduce_size < 1:
+            img.draft('RGB', (new_width * DRAFT_OVERSAMPLE, new_height * DRAFT_OVERSAMPLE))
+
+        img = img.convert('RGB')
+        if img.size != (new_width, new_height):
+            img = img.resize((new_width, new_height), Image.LANCZOS)
+        return img, (original_width, original_height), (new_width, new_height)
+
+async def resize_image(target_file, prefix, reduce_size = 0.5, reduce_quality = 100,
+                       target_bytes = None, min_similarity = None, with_encoding = False,
+                       fast_decode = True):
+    """Async wrapper: runs resize_image_sync in the image process pool (see image_pool.py)."""
+    return await run_image_task(resize_image_sync, target_file, prefix, reduce_size, reduce_quality,
+                                target_bytes, min_similarity, with_encoding, fast_decode)
+
+def _passthrough_size(target_file, reduce_size, target_bytes):
+    """(width, height) if target_file can be used as-is for this rendition, else None"""
+    from PIL import Image
+
+    if reduce_size != 1.0:
+        return None
+    if target_bytes is not None and os.path.getsize(target_file) > target_bytes:
+        return None
+    with Image.open(target_file) as img:
+        if img.format != 'JPEG' or img.mode != 'RGB':
+            return None
+        return img.size
+
+def resize_image_sync(target_file, prefix, reduce_size = 0.5, reduce_quality = 100,
+                      target_bytes = None, min_similarity = None, with_encoding = False,
+                      fast_decode = True):
     """
-    Download an image from URL and resize it to a smaller size.
+    Resize a local image to a smaller size.
 
     Args:
-        url (str): URL of the image to download and resize
+        target_file (str): Path of the local image to resize
         prefix (str): Prefix for the output filename
+        target_bytes (int): Optional byte budget, the JPEG quality is searched to fit it
+        min_similarity (float): Optional SSIM floor, the lowest quality meeting it is used
+        with_encoding (bool): Also return the encoding settings dict
+        fast_decode (bool): Decode JPEGs at a reduced scale when the target allows (see load_resized)
 
     Returns:
-        str: Path to the resized image file or None if an error occurs
+        tuple: (path, resolution) or (path, resolution, encoding), None if an error occurs
     """
     try:
         # Create output folder if it doesn't exist
@@ -217,41 +472,49 @@ async def resize_image(target_file, prefix, reduce_size = 0.5, reduce_quality =
         #     print(f"Failed to download image from {url}")
         #     return None
 
-        # Open the downloaded image and resize it
-        with Image.open(target_file) as img:
-            # Get original dimensions
-            original_width, original_height = img.size
+        passthrough = _passthrough_size(target_file, reduce_size, target_bytes)
+        if passthrough:
+            # Already a JPEG at this size within budget: re-encoding would only lose quality.
+            # Keeping the bytes also lets content-addressed uploads share this blob with the thumbnail.
+            new_width, new_height = passthrough
+            resolution_name = f"{prefix}_{new_width}x{new_height}_"
+            resized_path = os.path.join(output_folder, f"{resolution_name}{os.path.basename(target_file)}")
+            shutil.copyfile(target_file, resized_path)
+            encoding = {"passthrough": True, "bytes": os.path.getsize(resized_path)}
+            new_resolution = f"{new_width}x{new_height}"
+            print(f"Kept {target_file} as {prefix} {new_resolution} without re-encoding ({encoding})")
+            if with_encoding:
+                return resized_path, new_resolution, encoding
+            return resized_path, new_resolution
 
-            # Calculate new dimensions (reduce to 50% of original size)
-            # You can adjust this ratio as needed
-            new_width = int(original_width * reduce_size)
-            new_height = int(original_height * reduce_size)
+        # Open the downloaded image and resize it
+        resized_img, (original_width, original_height), (new_width, new_height) = load_resized(target_file, reduce_size, fast_decode)
 
-            # Resize the image
-            resized_img = img.resize((new_width, new_height), Image.LANCZOS)
+        # Create a filename for the resized image
+        resolution_name = f"{prefix}_{new_width}x{new_height}_"
+        resized_filename = f"{resolution_name}{os.path.basename(target_file)}"
+        resized_path = os.path.join(output_folder, resized_filename)
 
-            # Create a filename for the resized image
-            resolution_name = f"{prefix}_{new_width}x{new_height}_"
-            resized_filename = f"{resolution_name}{os.path.basename(target_file)}"
-            resized_path = os.path.join(output_folder, resized_filename)
+        # Save the resized image
+        encoding = save_jpeg(resized_img, resized_path, reduce_quality, target_bytes, min_similarity)
 
-            # Save the resized image
-            resized_img.save(resized_path, 'JPEG', quality=reduce_quality)
+        # Delete the original downloaded file if it's different from the resized path
+        #if target_file != resized_path:
+        #    safe_delete(target_file)
 
-            # Delete the original downloaded file if it's different from the resized path
-            #if target_file != resized_path:
-            #    safe_delete(target_file)
+        new_resolution = f"{new_width}x{new_height}"
+        print(f"Successfully resized image from {original_width}x{original_height} to {new_width}x{new_height} ({encoding})")
 
-            new_resolution = f"{new_width}x{new_height}"
-            print(f"Successfully resized image from {original_width}x{original_height} to {new_width}x{new_height}")
-
-            return resized_path, new_resolution
+        if with_encoding:
+            return resized_path, new_resolution, encoding
+        return resized_path, new_resolution
 
     except Exception as e:
         print(f"Error in resize_image: {e}")
         return None
 
-def blur_image(target_file, prefix, blur_strength=8):
+def blur_image(target_file, prefix, blur_strength=8, target_bytes=None, with_encoding=False,
+               downsample=None):
     """
     Creates a blurred version of the input image.
 
@@ -259,14 +522,17 @@ def blur_image(target_file, prefix, blur_strength=8):
         target_file (str): Path to the source image file
         prefix (str): Prefix for the output filename
         blur_strength (int): Strength of the blur effect (higher means more blur)
+        target_bytes (int): Optional byte budget instead of the fixed quality=40
+        with_encoding (bool): Also return the encoding settings dict
+        downsample (int): Blur at 1/downsample size and scale back up
+                          (default fast_blur.DEFAULT_DOWNSAMPLE, 1 = exact full-size blur)
 
     Returns:
-        tuple: (path to blurred image, resolution string)
+        tuple: (path to blurred image, resolution string[, encoding])
     """
     try:
-        from PIL import Image, ImageFilter
-        import os
-        import uuid
+        from PIL import Image
+        from fast_blur import gaussian_blur, DEFAULT_DOWNSAMPLE
 
         # Create output folder if it doesn't exist
         output_folder = "output"
@@ -278,7 +544,7 @@ def blur_image(target_file, prefix, blur_strength=8):
             original_width, original_height = img.size
 
             # Create a blurred version of the image
-            blurred_img = img.filter(ImageFilter.GaussianBlur(radius=blur_strength))
+            blurred_img = gaussian_blur(img, blur_strength, downsample=downsample or DEFAULT_DOWNSAMPLE)
 
             # Create a filename for the blurred image
             resolution_name = f"{prefix}_{original_width}x{original_height}_"
@@ -286,37 +552,164 @@ def blur_image(target_file, prefix, blur_strength=8):
             blurred_path = os.path.join(output_folder, blurred_filename)
 
             # Save the blurred image with reduced quality for smaller file size
-            blurred_img.save(blurred_path, 'JPEG', quality=40)
+            encoding = save_jpeg(blurred_img, blurred_path, 40, target_bytes)
 
             new_resolution = f"{original_width}x{original_height}"
             print(f"Successfully created blurred image from {target_file}")
 
+            if with_encoding:
+                return blurred_path, new_resolution, encoding
             return blurred_path, new_resolution
 
     except Exception as e:
         print(f"Error in blur_image: {e}")
+        if with_encoding:
+            return None, None, None
         return None, None
 
-async def resize_all_and_upload_to_firebase(target_local_file, delete_target_local_file_when_finish = True):
-    # Resize the image to different resolutions
-    LD_file_path, LD_resolution = await resize_image(target_local_file, "LD", 0.25)
-    SD_file_path, SD_resolution = await resize_image(target_local_file, "SD", 0.5)
-    HD_file_path, HD_resolution = await resize_image(target_local_file, "HD", 1.0)
-    TEMP_file_path, TEMP_resolution = await resize_image(target_local_file, "BL", 0.25)
-    BL_file_path, BL_resolution = blur_image(TEMP_file_path, "BL", blur_strength=32)
+def encode_format_variants(target_file, prefix, reduce_size, jpeg_path, formats):
+    """
+    Encode WebP/AVIF versions of a rendition at the same visual quality as its JPEG.
+
+    The SSIM the JPEG rendition reached is used as the floor for each format,
+    so every variant is the smallest file that looks as good as the JPEG.
+    A variant that isn't smaller than the JPEG is dropped.
+
+    Args:
+        target_file (str): Source image the JPEG rendition was made from
+        prefix (str): Rendition type, used in the filename (e.g. "LD")
+        reduce_size (float): Same scale as the JPEG rendition
+        jpeg_path (str): The JPEG rendition
+        formats (iterable): Formats to produce, e.g. ("webp", "avif"); unsupported ones are skipped
+
+    Returns:
+        list: (format, path, resolution, encoding) tuples
+    """
+    from image_encoder import IMAGE_FORMATS, is_format_supported, encode_variant, similarity_of_file
+
+    variants = []
+    formats = [fmt for fmt in formats or () if fmt in IMAGE_FORMATS and fmt != "jpeg"]
+    if not formats:
+        return variants
+
+    try:
+        output_folder = "output"
+        # Same pixels as resize_image produced for the JPEG rendition
+        resized_img, _, (new_width, new_height) = load_resized(target_file, reduce_size)
+
+        jpeg_similarity = similarity_of_file(resized_img, jpeg_path)
+        jpeg_bytes = os.path.getsize(jpeg_path)
+        base_name = os.path.splitext(os.path.basename(target_file))[0]
+
+        for fmt in formats:
+            if not is_format_supported(fmt):
+                print(f"Skipping {fmt} variant: not supported by this Pillow build")
+                continue
+            variant_path = os.path.join(output_folder, f"{prefix}_{new_width}x{new_height}_{base_name}{IMAGE_FORMATS[fmt][1]}")
+            encoding = encode_variant(resized_img, variant_path, fmt, min_similarity=jpeg_similarity)
+            if encoding["bytes"] >= jpeg_bytes:
+                # Couldn't match the JPEG's quality in fewer bytes: clients are better off with the JPEG
+                print(f"Skipping {fmt} {prefix} variant: {encoding['bytes']} bytes, JPEG is {jpeg_bytes}")
+                safe_delete(variant_path)
+                continue
+            variants.append((fmt, variant_path, f"{new_width}x{new_height}", encoding))
+            print(f"Successfully created {fmt} {prefix} variant ({encoding})")
 
-    # Upload resized images to Firebase
-    LD_firebase_url, LD_blob_name = upload_to_firebase_3(LD_file_path, "LD", LD_resolution)
-    SD_firebase_url, SD_blob_name = upload_to_firebase_3(SD_file_path, "SD", SD_resolution)
-    HD_firebase_url, HD_blob_name = upload_to_firebase_3(HD_file_path, "HD", HD_resolution)
-    BL_firebase_url, BL_blob_name = upload_to_firebase_3(BL_file_path, "BL", BL_resolution)
+    except Exception as e:
+        print(f"Error in encode_format_variants: {e}")
+
+    return variants
+
+async def resize_all_and_upload_to_firebase(target_local_file, delete_target_local_file_when_finish = True, budgets = None, extra_formats = (), include_blur = True, with_placeholder = False):
+    """
+    Create the LD/SD/HD/BL renditions, upload them and return the imageList entries
+    together with the inline placeholder.
+
+    Args:
+        budgets (dict): Byte budget per rendition type (default image_encoder.RENDITION_BUDGETS);
+                        pass {} to keep the old fixed-quality encoding
+        extra_formats (tuple): Also emit these formats ("webp", "avif") for LD/SD/HD; they are
+                               listed after the JPEG entries with their own "format" field
+        include_blur (bool): Also create and upload the BL rendition
+        with_placeholder (bool): Also compute the inline placeholder (placeholder.make_placeholder)
+                                 from the LD rendition
+
+    Returns:
+        tuple: (image_list, placeholder); placeholder is None unless with_placeholder is set
+    """
+    from image_encoder import RENDITION_BUDGETS
+    if budgets is None:
+        budgets = RENDITION_BUDGETS
+
+    # Resize the image to different resolutions, in parallel across the image pool workers
+    renditions = [
+        resize_image(target_local_file, "LD", 0.25, target_bytes=budgets.get("LD"), with_encoding=True),
+        resize_image(target_local_file, "SD", 0.5, target_bytes=budgets.get("SD"), with_encoding=True),
+        resize_image(target_local_file, "HD", 1.0, target_bytes=budgets.get("HD"), with_encoding=True)
+    ]
+    if include_blur:
+        renditions.append(resize_image(target_local_file, "BL", 0.25))
+    results = await asyncio.gather(*renditions)
+    (LD_file_path, LD_resolution, LD_encoding), (SD_file_path, SD_resolution, SD_encoding), (HD_file_path, HD_resolution, HD_encoding) = results[:3]
+    if include_blur:
+        TEMP_file_path, TEMP_resolution = results[3]
+        BL_file_path, BL_resolution, BL_encoding = await run_image_task(
+            blur_image, TEMP_file_path, "BL", blur_strength=32, target_bytes=budgets.get("BL"), with_encoding=True)
+
+    # Optional modern-format variants of the LD/SD/HD renditions
+    format_variants = []
+    if extra_formats:
+        variant_results = await asyncio.gather(*[
+            run_image_task(encode_format_variants, target_local_file, rendition_type, reduce_size, jpeg_path, extra_formats)
+            for rendition_type, reduce_size, jpeg_path in (("LD", 0.25, LD_file_path), ("SD", 0.5, SD_file_path), ("HD", 1.0, HD_file_path))
+        ])
+        for rendition_type, variants in zip(("LD", "SD", "HD"), variant_results):
+            for variant in variants:
+                format_variants.append((rendition_type, *variant))
+
+    # Upload resized images to Firebase, concurrently and off the event loop
+    uploads = [(LD_file_path, "LD", LD_resolution), (SD_file_path, "SD", SD_resolution), (HD_file_path, "HD", HD_resolution)]
+    if include_blur:
+        uploads.append((BL_file_path, "BL", BL_resolution))
+    uploads.extend((variant_path, rendition_type, variant_resolution)
+                   for rendition_type, fmt, variant_path, variant_resolution, variant_encoding in format_variants)
+    upload_task = asyncio.gather(*[asyncio.to_thread(upload_to_firebase_3, path, folder, resolution)
+                                   for path, folder, resolution in uploads])
+
+    placeholder = None
+    if with_placeholder:
+        from placeholder import make_placeholder
+        try:
+            placeholder = await run_image_task(make_placeholder, LD_file_path)
+        except Exception as e:
+            print(f"Error creating placeholder: {e}")
+
+    uploaded = await upload_task
+    (LD_firebase_url, LD_blob_name), (SD_firebase_url, SD_blob_name), (HD_firebase_url, HD_blob_name) = uploaded[:3]
+    if include_blur:
+        BL_firebase_url, BL_blob_name = uploaded[3]
+    variant_uploads = uploaded[4 if include_blur else 3:]
+
+    variant_items = []
+    for (rendition_type, fmt, variant_path, variant_resolution, variant_encoding), (variant_url, variant_blob) in zip(format_variants, variant_uploads):
+        safe_delete(variant_path)
+        if variant_url:
+            variant_items.append({
+                "type": rendition_type,
+                "format": fmt,
+                "resolution": variant_resolution,
+                "link": variant_url,
+                "blob": variant_blob,
+                "encoding": variant_encoding
+            })
 
     # You can add code to delete the local files here
     safe_delete(LD_file_path)
     safe_delete(SD_file_path)
     safe_delete(HD_file_path)
-    safe_delete(TEMP_file_path)
-    safe_delete(BL_file_path)
+    if include_blur:
+        safe_delete(TEMP_file_path)
+        safe_delete(BL_file_path)
     if delete_target_local_file_when_finish:
         safe_delete(target_local_file)
 
@@ -324,39 +717,51 @@ async def resize_all_and_upload_to_firebase(target_local_file, delete_target_loc
     image_list = [
         {
             "type": "LD",
+            "format": "jpeg",
             "resolution": LD_resolution,
             "link": LD_firebase_url,
-            "blob": LD_blob_name
+            "blob": LD_blob_name,
+            "encoding": LD_encoding
         },
         {
             "type": "SD",
+            "format": "jpeg",
             "resolution": SD_resolution,
             "link": SD_firebase_url,
-            "blob": SD_blob_name
+            "blob": SD_blob_name,
+            "encoding": SD_encoding
         },
         {
             "type": "HD",
+            "format": "jpeg",
             "resolution": HD_resolution,
             "link": HD_firebase_url,
-            "blob": HD_blob_name
-        },
-        {
+            "blob": HD_blob_name,
+            "encoding": HD_encoding
+        }
+    ]
+    if include_blur:
+        image_list.append({
             "type": "BL",
+            "format": "jpeg",
             "resolution": BL_resolution,
             "link": BL_firebase_url,
-            "blob": BL_blob_name
-        }
-    ]
+            "blob": BL_blob_name,
+            "encoding": BL_encoding
+        })
+    # JPEG entries stay first so clients that only read "type" keep getting JPEG
+    image_list.extend(variant_items)
 
-    return image_list
+    return image_list, placeholder
 
 async def resize_one_blur_and_upload_to_firebase(target_local_file, delete_target_local_file_when_finish = True):
+    from image_encoder import RENDITION_BUDGETS
 
     LD_file_path, LD_resolution = await resize_image(target_local_file, "BL", 0.25, reduce_quality=100)
-    BL_file_path, BL_resolution = blur_image(LD_file_path, "BL", blur_strength=32)
-
-    BL_firebase_url, BL_blob_name = upload_to_firebase_3(BL_file_path, "BL", BL_resolution)
+    BL_file_path, BL_resolution, BL_encoding = await run_image_task(
+        blur_image, LD_file_path, "BL", blur_strength=32, target_bytes=RENDITION_BUDGETS["BL"], with_encoding=True)
 
+    BL_firebase_url, BL_blob_name = await asyncio.to_thread(upload_to_firebase_3, BL_file_path, "BL", BL_resolution)
 
     # You can add code to delete the local files here
     safe_delete(LD_file_path)
@@ -366,22 +771,110 @@ async def resize_one_blur_and_upload_to_firebase(target_local_file, delete_targe
 
     return {
         "type": "BL",
+        "format": "jpeg",
         "resolution": BL_resolution,
         "link": BL_firebase_url,
-        "blob": BL_blob_name
+        "blob": BL_blob_name,
+        "encoding": BL_encoding
     }
 
 
-def type_imagine(prompt):
-    # Type the command
+# How type_imagine enters the prompt: "clipboard" pastes it in one action (pbcopy, xclip or xsel),
+# "keys" types it character by character; clipboard falls back to keys when no tool is available
+INPUT_BACKEND = os.getenv("INPUT_BACKEND", "clipboard")
+IMAGINE_POPUP_TIMEOUT = 5  # seconds to wait for Discord's /imagine suggestion popup
+KEY_SETTLE_SECONDS = 0.3   # pause after a key Discord reacts to (opening the prompt field, a paste)
+
+_search_errors_logged = set()  # templates whose search error wait_for_image already printed
+
+
+def imagine_popup_template():
+    """Screenshot of the /imagine suggestion popup, per platform like the other click templates"""
+    return "img/mac/imagine_popup.png" if is_macos() else "img/linux/imagine_popup.png"
+
+
+def wait_for_image(image_file, timeout=IMAGINE_POPUP_TIMEOUT, interval=0.2):
+    """
+    Poll the screen until image_file is visible.
+
+    A search error (e.g. confidence= without OpenCV) returns at once instead of
+    polling until the timeout, and is printed once per template.
+
+    Returns:
+        bool: True once it is found; False on timeout, on a search error or if the template file doesn't exist
+    """
+    import pyautogui
+    if not os.path.exists(image_file):
+        return False
+    not_found = getattr(pyautogui, "ImageNotFoundException", ())
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if pyautogui.locateOnScreen(image_file, confidence=0.8):
+                return True
+        except not_found:
+            pass  # newer pyautogui raises instead of returning None
+        except Exception as e:
+            if image_file not in _search_errors_logged:
+                print(f"wait_for_image: cannot search for {image_file}: {e}")
+                _search_errors_logged.add(image_file)
+            return False
+        time.sleep(interval)
+    print(f"wait_for_image: {image_file} not visible after {timeout}s")
+    return False
+
+
+def _clipboard_command():
+    if is_macos():
+        return ["pbcopy"]
+    if shutil.which("xclip"):
+        return ["xclip", "-selection", "clipboard"]
+    if shutil.which("xsel"):
+        return ["xsel", "--clipboard", "--input"]
+    return None
+
+
+def copy_to_clipboard(text):
+    """Put text on the system clipboard; False if no clipboard tool is available or it failed"""
+    command = _clipboard_command()
+    if command is None:
+        return False
+    try:
+        subprocess.run(command, input=text.encode("utf-8"), check=True, timeout=5)
+        return True
+    except (OSError, subprocess.SubprocessError) as e:
+        print(f"copy_to_clipboard failed ({command[0]}): {e}")
+        return False
+
+
+def type_imagine(prompt, backend=None):
+    """
+    Send a Midjourney /imagine command from the focused Discord text box.
+
+    Args:
+        prompt (str): Prompt text, pasted in one action or typed (see INPUT_BACKEND)
+        backend (str): "clipboard" or "keys" (default INPUT_BACKEND)
+    """
+    import pyautogui
+    backend = backend or INPUT_BACKEND
+
+    # Type the command; continue as soon as Discord shows the suggestion popup
     pyautogui.write("/imagine")
-    time.sleep(1)
+    if not wait_for_image(imagine_popup_template()):
+        time.sleep(1)  # no template (or not seen): the old fixed delay
     pyautogui.press('space')
-    time.sleep(1)
+    time.sleep(KEY_SETTLE_SECONDS)
     pyautogui.press('space')
-    time.sleep(1)
-    pyautogui.write(prompt)
-    time.sleep(1)
+    time.sleep(KEY_SETTLE_SECONDS)
+
+    if backend == "clipboard" and copy_to_clipboard(prompt):
+        pyautogui.hotkey('command' if is_macos() else 'ctrl', 'v')
+        time.sleep(KEY_SETTLE_SECONDS)
+    else:
+        if backend == "clipboard":
+            print("type_imagine: clipboard unavailable, typing the prompt")
+        pyautogui.write(prompt)
+        time.sleep(1)
     pyautogui.press('enter')
 
 def safe_delete(file_path):
@@ -409,6 +902,7 @@ def click_somewhere(image_file, interval_seconds=1, repeat=1, retry=2, retry_int
     Returns:
         bool: True if image was found and clicked, False otherwise
     """
+    import pyautogui
     print(f"click_somewhere( {image_file}, interval={interval_seconds}s, repeat={repeat}x, retry={retry}x )")
 
     # Retry loop
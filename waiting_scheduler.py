@@ -0,0 +1,172 @@
+"""
+Client-side choice of the next waiting item.
+
+The backend hands out waiting items in its own order, so a bulk Pexels
+harvest queued ahead of a few hand-picked Discord submissions is processed
+first, for days. Instead the bot fetches the pending items and picks:
+
+  1. Urgent items (priority >= URGENT_PRIORITY) before anything else, so an
+     urgent submission takes the next free job slot.
+  2. Otherwise the source that is furthest behind its share of job slots
+     (SOURCE_WEIGHTS, weighted round robin over sources with pending items).
+  3. Within that source, the highest priority after aging: every hour of
+     waiting adds AGING_PER_HOUR, so low priority items still get their turn.
+
+queue_stats() reports depth and wait time per class (source, plus "urgent")
+for the polling log and the command_queue_stats command.
+"""
+
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+URGENT_PRIORITY = 10
+AGING_PER_HOUR = 1.0
+# Relative share of job slots per source; sources not listed get DEFAULT_SOURCE_WEIGHT
+SOURCE_WEIGHTS = {"discord": 4.0, "pexels.com API": 1.0}
+DEFAULT_SOURCE_WEIGHT = 1.0
+WINDOW_PER_SOURCE = 200  # pending items considered per source: urgent ones, then the highest effective priority
+
+
+def item_created_at(item: dict) -> Optional[float]:
+    """Epoch seconds the item was queued: createdAt, or the timestamp inside a MongoDB ObjectId."""
+    created_at = item.get("createdAt")
+    if created_at:
+        try:
+            return datetime.fromisoformat(str(created_at).replace("Z", "+00:00")).timestamp()
+        except ValueError:
+            pass
+    _id = str(item.get("_id", ""))
+    if len(_id) == 24:
+        try:
+            return float(int(_id[:8], 16))
+        except ValueError:
+            pass
+    return None
+
+
+def is_pending(item: dict, now: Optional[float] = None) -> bool:
+    """Not finished, not held by an unexpired lease and, without a lease, not assigned to a worker"""
+    if item.get("status", "") != "":
+        return False
+    lease = item.get("lease")
+    if lease:
+        return lease.get("expiresAt", 0) <= (now or time.time())
+    return not item.get("assign")
+
+
+def item_class(item: dict) -> str:
+    if item.get("priority", 0) >= URGENT_PRIORITY:
+        return "urgent"
+    return item.get("source") or "unknown"
+
+
+class WaitingScheduler:
+    def __init__(self, weights: Optional[Dict[str, float]] = None, aging_per_hour: float = AGING_PER_HOUR,
+                 window_per_source: int = WINDOW_PER_SOURCE):
+        """
+        Args:
+            weights (dict): Source -> relative share of job slots (default SOURCE_WEIGHTS)
+            aging_per_hour (float): Priority gained per hour of waiting
+            window_per_source (int): Pending items considered per source
+        """
+        self.weights = SOURCE_WEIGHTS if weights is None else weights
+        self.aging_per_hour = aging_per_hour
+        self.window_per_source = window_per_source
+        self.served: Dict[str, float] = defaultdict(float)  # slots used / weight, per source
+        self.picked: Dict[str, int] = defaultdict(int)
+        self.last_wait: Dict[str, float] = {}  # class -> wait of the last item picked from it
+
+    def weight(self, source: str) -> float:
+        return self.weights.get(source, DEFAULT_SOURCE_WEIGHT)
+
+    def effective_priority(self, item: dict, now: float) -> float:
+        created_at = item_created_at(item)
+        waited_hours = (now - created_at) / 3600 if created_at else 0.0
+        return item.get("priority", 0) + self.aging_per_hour * max(waited_hours, 0.0)
+
+    def candidates(self, items: Iterable[dict], now: Optional[float] = None) -> Dict[str, List[dict]]:
+        """
+        Pending items grouped by source, at most window_per_source each: urgent items
+        first, then by effective priority (oldest first on ties), so the window never
+        drops an item pick() would choose.
+        """
+        now = now or time.time()
+        by_source = defaultdict(list)
+        for item in items:
+            if is_pending(item, now):
+                by_source[item.get("source") or "unknown"].append(item)
+        for source, source_items in by_source.items():
+            source_items.sort(key=lambda item: (item.get("priority", 0) < URGENT_PRIORITY,
+                                                -self.effective_priority(item, now),
+                                                item_created_at(item) or now))
+            del source_items[self.window_per_source:]
+        return by_source
+
+    def pick(self, items: Iterable[dict], now: Optional[float] = None) -> Optional[dict]:
+        """Choose the next item to process and charge its source; None if nothing is pending."""
+        now = now or time.time()
+        by_source = self.candidates(items, now)
+        if not by_source:
+            return None
+
+        urgent = [item for source_items in by_source.values() for item in source_items
+                  if item.get("priority", 0) >= URGENT_PRIORITY]
+        if urgent:
+            chosen = max(urgent, key=lambda item: (item.get("priority", 0), -(item_created_at(item) or now)))
+        else:
+            # A source that was idle starts level with the others instead of catching up in a burst
+            floor = min((self.served[source] for source in by_source if source in self.served), default=0.0)
+            for source in by_source:
+                self.served[source] = max(self.served[source], floor)
+            source = min(by_source, key=lambda source: (self.served[source], -self.weight(source)))
+            chosen = max(by_source[source], key=lambda item: (self.effective_priority(item, now),
+                                                              -(item_created_at(item) or now)))
+        self.record_pick(chosen, now)
+        return chosen
+
+    def record_pick(self, item: dict, now: Optional[float] = None):
+        now = now or time.time()
+        source = item.get("source") or "unknown"
+        self.served[source] += 1.0 / self.weight(source)
+        self.picked[item_class(item)] += 1
+        created_at = item_created_at(item)
+        if created_at:
+            self.last_wait[item_class(item)] = now - created_at
+
+    def queue_stats(self, items: Iterable[dict], now: Optional[float] = None) -> Dict[str, dict]:
+        """
+        Per class: pending count, oldest and mean wait (seconds), items picked by this
+        process and the wait of the last one picked.
+        """
+        now = now or time.time()
+        waits = defaultdict(list)
+        for item in items:
+            if is_pending(item, now):
+                created_at = item_created_at(item)
+                waits[item_class(item)].append(now - created_at if created_at else 0.0)
+        stats = {}
+        for name in sorted(set(waits) | set(self.picked)):
+            class_waits = waits.get(name, [])
+            stats[name] = {
+                "depth": len(class_waits),
+                "oldest_wait": max(class_waits, default=0.0),
+                "mean_wait": sum(class_waits) / len(class_waits) if class_waits else 0.0,
+                "picked": self.picked.get(name, 0),
+                "last_wait": self.last_wait.get(name),
+            }
+        return stats
+
+
+def _hours(seconds: Optional[float]) -> str:
+    return "-" if seconds is None else f"{seconds / 3600:.1f}h"
+
+
+def format_queue_stats(stats: Dict[str, dict]) -> str:
+    """Queue metrics as a Discord code block"""
+    lines = [f"{'class':<16}{'depth':>7}{'oldest':>9}{'mean':>8}{'picked':>8}{'last':>8}"]
+    for name, row in stats.items():
+        lines.append(f"{name[:15]:<16}{row['depth']:>7}{_hours(row['oldest_wait']):>9}{_hours(row['mean_wait']):>8}"
+                     f"{row['picked']:>8}{_hours(row['last_wait']):>8}")
+    return "```\n" + "\n".join(lines) + "\n```"